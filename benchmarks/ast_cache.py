@@ -0,0 +1,62 @@
+"""
+AST cache benchmark: parsing a source versus loading its serialized tree.
+
+    python benchmarks/ast_cache.py [runs]
+
+For `program` and for generated programs of a few sizes (see memory.py),
+prints the time to parse, to dump the tree and to load it back, and the
+time `main.parse_cached` takes when the tree is already on disk.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import main as compiler  # noqa: E402
+import zuv_serialize  # noqa: E402
+from memory import make_source  # noqa: E402
+
+
+def best_of(fn, runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(runs: int):
+    with open(os.path.join(ROOT, "program")) as file:
+        sources = {"program": file.read()}
+    for statements in (1_000, 10_000):
+        sources[f"{statements // 1000}k stmts"] = make_source(statements)
+
+    compiler.get_parser()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        compiler.CACHE_DIR = cache_dir
+        print(f"{'source':>10} {'bytes':>8} {'tree':>8} {'parse':>10}"
+              f" {'dump':>9} {'load':>9} {'cached':>9} {'speedup':>8}")
+        for (name, source) in sources.items():
+            ast = compiler.parse(source)
+            data = zuv_serialize.dumps(ast)
+            assert zuv_serialize.loads(data) == ast
+            compiler.parse_cached(source)
+
+            parse = best_of(lambda: compiler.parse(source), runs)
+            dump = best_of(lambda: zuv_serialize.dumps(ast), runs)
+            load = best_of(lambda: zuv_serialize.loads(data), runs)
+            cached = best_of(lambda: compiler.parse_cached(source), runs)
+            print(
+                f"{name:>10} {len(source):8} {len(data):8} {parse * 1000:8.2f}ms"
+                f" {dump * 1000:7.2f}ms {load * 1000:7.2f}ms {cached * 1000:7.2f}ms"
+                f" {parse / cached:7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
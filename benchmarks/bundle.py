@@ -0,0 +1,93 @@
+"""
+Bundle benchmark: bytes shipped, and time to load them, with all of lib.js
+versus only the part of it the program uses.
+
+    python benchmarks/bundle.py [runs]
+
+Loading is timed in node (if it's installed), by compiling and running each
+script in a fresh context, with the program's console output thrown away.
+"""
+
+import io
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import main as compiler  # noqa: E402
+import zuv_bundle  # noqa: E402
+
+
+PROGRAMS = {
+    "hello": 'console @log "Hello, world!".\n',
+    "program": open(os.path.join(ROOT, "program")).read(),
+}
+
+LOADER = """
+const fs = require("fs");
+const vm = require("vm");
+const runs = Number(process.argv[2]);
+const sources = process.argv.slice(3).map(path => fs.readFileSync(path, "utf8"));
+const quiet = {log() {}, debug() {}, warn() {}, error() {}};
+const start = process.hrtime.bigint();
+for (let i = 0; i < runs; i++) {
+    const context = vm.createContext({console: quiet});
+    for (const source of sources)
+        new vm.Script(source).runInContext(context);
+}
+console.log(Number(process.hrtime.bigint() - start) / 1e6 / runs);
+"""
+
+
+def load_ms(node: str, paths, runs: int) -> float:
+    with tempfile.NamedTemporaryFile("w", suffix=".js", delete=False) as loader:
+        loader.write(LOADER)
+    try:
+        out = subprocess.run(
+            [node, loader.name, str(runs), *paths], check=True, capture_output=True, text=True
+        )
+    finally:
+        os.unlink(loader.name)
+    return float(out.stdout)
+
+
+def main(runs: int):
+    node = shutil.which("node")
+    with open(zuv_bundle.RUNTIME_PATH) as file:
+        runtime = file.read()
+    with tempfile.TemporaryDirectory() as tmp:
+        for (name, source) in PROGRAMS.items():
+            sink = io.StringIO()
+            compiler.write_program(compiler.parse(source), sink)
+            output = os.path.join(tmp, f"{name}.js")
+            with open(output, "w") as file:
+                file.write(sink.getvalue() + "\n")
+            bundle = zuv_bundle.bundle_ast(compiler.parse(source))
+            bundled = os.path.join(tmp, f"{name}.bundle.js")
+            with open(bundled, "w") as file:
+                file.write(bundle.js)
+
+            full_size = len(runtime) + len(sink.getvalue()) + 1
+            print(
+                f"{name:>8}: lib.js + output {full_size:6} bytes"
+                f"   bundle {len(bundle.js):6} bytes ({len(bundle.js) / full_size:.0%})"
+            )
+            if node is not None:
+                times = [load_ms(node, [zuv_bundle.RUNTIME_PATH, output], runs) for _ in range(5)]
+                bundle_times = [load_ms(node, [bundled], runs) for _ in range(5)]
+                print(
+                    f"{'':>8}  load: {statistics.median(times):6.3f} ms"
+                    f"   bundle {statistics.median(bundle_times):6.3f} ms"
+                )
+    if node is None:
+        print("node not found, skipping load times")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,204 @@
+"""
+Deep nesting: every phase on programs nested thousands of levels deep.
+
+    python benchmarks/depth.py [--depths 1000 10000 100000] [--shapes ...]
+
+Machine-generated zuv nests far deeper than anything written by hand. For
+each shape and depth, this builds the tree, prints it with `format_ast`, and
+times parsing it back, `prepare_program`, code generation (plain, and
+minified with hoisted literals), `format_ast`, and a serialization round
+trip. It checks that the tree parses back equal to the one it was printed
+from, and shows how the cost of each phase per node grows with the depth:
+about 1x for a linear phase. The source has no indentation, which would
+grow with the square of the depth. The exit status is 1 if a phase fails,
+say with a `RecursionError`, or gives a different result.
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import main as compiler  # noqa: E402
+import zuv_format  # noqa: E402
+import zuv_serialize  # noqa: E402
+from generate import nesting  # noqa: E402
+from zuv_ast import (  # noqa: E402
+    ArrayLiteral,
+    Assignment,
+    AstElement,
+    BlockExpression,
+    ChainedMethodCall,
+    FunctionCall,
+    FunctionDefinition,
+    IntLiteral,
+    LvalueName,
+    MemberAccess,
+    MethodCall,
+    Name,
+    SingleChainedCall,
+    TableEntry,
+    TableLiteral,
+)
+
+
+def _program(value: AstElement) -> AstElement:
+    return BlockExpression([Assignment(LvalueName("result"), value)], implicit_return=False)
+
+
+def ladder(depth: int) -> AstElement:
+    # c0 @? (fn: 0) (fn: c1 @? (fn: 1) (fn: ...))
+    value: AstElement = IntLiteral(depth)
+    for i in range(depth - 1, -1, -1):
+        value = MethodCall(Name("c"), "?", [
+            FunctionDefinition([], BlockExpression([IntLiteral(i)])),
+            FunctionDefinition([], BlockExpression([value])),
+        ])
+    return _program(value)
+
+
+def arrays(depth: int) -> AstElement:
+    value: AstElement = IntLiteral(0)
+    for i in range(depth):
+        value = ArrayLiteral([value, IntLiteral(i)])
+    return _program(value)
+
+
+def tables(depth: int) -> AstElement:
+    value: AstElement = IntLiteral(0)
+    for i in range(depth):
+        value = TableLiteral([TableEntry.KeyValue("next", value), TableEntry.KeyShorthand("c")])
+    return _program(value)
+
+
+def calls(depth: int) -> AstElement:
+    # add: 0 (add: 1 (add: 2 ...)) and (x->a->a->a...)!
+    value: AstElement = IntLiteral(depth)
+    access: AstElement = Name("x")
+    for i in range(depth - 1, -1, -1):
+        value = FunctionCall(Name("add"), [IntLiteral(i), value])
+        access = MemberAccess(access, "a")
+    return _program(ArrayLiteral([value, FunctionCall(access, [])]))
+
+
+def chains(depth: int) -> AstElement:
+    # (((x... @f 0.)... @f 1.)... ...)
+    value: AstElement = Name("x")
+    for i in range(depth):
+        value = ChainedMethodCall(value, [SingleChainedCall("@", "f", [IntLiteral(i)])])
+    return _program(value)
+
+
+SHAPES: Dict[str, Callable[[int], AstElement]] = {
+    "functions": nesting,
+    "ladder": ladder,
+    "arrays": arrays,
+    "tables": tables,
+    "calls": calls,
+    "chains": chains,
+}
+
+PHASES = ["parse", "prepare", "to_js", "minified", "format", "serialize"]
+
+
+def count_nodes(root: AstElement) -> int:
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children())
+    return count
+
+
+def timed(fn: Callable[[], object]) -> tuple:
+    start = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - start, result)
+
+
+def emit(ast: AstElement, flags: compiler.CompileFlags) -> str:
+    sink = io.StringIO()
+    compiler.emit_program(ast, sink, flags)
+    return sink.getvalue()
+
+
+def measure(tree: AstElement) -> Dict[str, object]:
+    """Seconds for each phase, or the error that stopped it."""
+    results: Dict[str, object] = {}
+    source = zuv_format.format_ast(tree, indent_width=0)
+    plain = compiler.CompileFlags()
+    minified = compiler.CompileFlags(minify=True, hoist_literals=True)
+
+    def check(phase: str, fn: Callable[[], object], expected: Callable[[object], bool]) -> object:
+        try:
+            (seconds, result) = timed(fn)
+        except RecursionError as e:
+            results[phase] = f"RecursionError: {e}"
+            return None
+        results[phase] = seconds if expected(result) else "wrong result"
+        return result
+
+    ast = check("parse", lambda: compiler.parse(source), lambda parsed: parsed == tree)
+    if ast is None:
+        return results
+    data = zuv_serialize.dumps(ast)
+    prepared = check("prepare", lambda: compiler.prepare_program(zuv_serialize.loads(data), plain),
+                     lambda result: result is not None)
+    if prepared is not None:
+        check("to_js", lambda: emit(prepared, plain), bool)
+        try:
+            small = compiler.prepare_program(zuv_serialize.loads(data), minified)
+        except RecursionError as e:
+            results["minified"] = f"RecursionError: {e}"
+        else:
+            check("minified", lambda: emit(small, minified), bool)
+    check("format", lambda: zuv_format.format_ast(ast, indent_width=0), lambda result: result == source)
+    check("serialize", lambda: zuv_serialize.loads(zuv_serialize.dumps(ast)),
+          lambda result: result == ast)
+    return results
+
+
+def main(argv: List[str]) -> int:
+    argparser = argparse.ArgumentParser(prog="benchmarks/depth.py", description=__doc__.split("\n\n")[0])
+    argparser.add_argument("--shapes", nargs="+", choices=list(SHAPES), default=list(SHAPES))
+    argparser.add_argument("--depths", nargs="+", type=int, default=[1000, 10000, 100000])
+    args = argparser.parse_args(argv)
+
+    compiler.get_parser()
+    failures = 0
+    print(f"{'shape':>10} {'depth':>7} {'nodes':>8} " + " ".join(f"{p:>10}" for p in PHASES))
+    for shape in args.shapes:
+        per_node: Dict[str, List[float]] = {phase: [] for phase in PHASES}
+        for depth in args.depths:
+            tree = SHAPES[shape](depth)
+            nodes = count_nodes(tree)
+            results = measure(tree)
+            cells = []
+            for phase in PHASES:
+                result = results.get(phase, "skipped")
+                if isinstance(result, float):
+                    per_node[phase].append(result / nodes)
+                    cells.append(f"{result * 1000:8.1f}ms")
+                else:
+                    failures += 1
+                    cells.append(f"{'FAILED':>10}")
+                    print(f"{shape} {depth} {phase}: {result}", file=sys.stderr)
+            print(f"{shape:>10} {depth:7} {nodes:8} " + " ".join(cells))
+        # how much more each node cost at the largest depth than at the smallest
+        growth = [
+            f"{times[-1] / times[0]:9.2f}x" if len(times) > 1 and times[0] else f"{'-':>10}"
+            for times in per_node.values()
+        ]
+        print(f"{'per node':>10} {'':>7} {'':>8} " + " ".join(growth))
+    print(f"{failures} failures")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
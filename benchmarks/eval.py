@@ -0,0 +1,322 @@
+"""
+In-process evaluation: `zuv_eval`'s closures against a tree-walking interpreter.
+
+    python benchmarks/eval.py [--runs 3] [--workloads fib program collections]
+
+Both run on `zuv_runtime`. The tree walker is the straightforward design:
+it dispatches on the type of every node each time it evaluates it, and
+keeps variables in dicts, looked up by name along a chain of environments.
+`zuv_eval` compiles the tree once (the "compile" column) and then only runs
+closures that index frames. With node on the PATH, the last column is the
+time to run the compiled JS with `lib.js` in a fresh node process, startup
+included. All of them must print the same, or the exit status is 1.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import main as compiler  # noqa: E402
+import zuv_eval  # noqa: E402
+import zuv_scope  # noqa: E402
+from zuv_ast import (  # noqa: E402
+    ArrayLiteral,
+    ArrayParameter,
+    Assignment,
+    AstElement,
+    BlockExpression,
+    ChainedMethodCall,
+    ExpressionStatement,
+    FunctionCall,
+    FunctionDefinition,
+    IntLiteral,
+    LvalueArray,
+    LvalueName,
+    LvalueNameNonlocal,
+    LvalueTable,
+    MemberAccess,
+    MethodCall,
+    Name,
+    NamedParameter,
+    ObjectParameter,
+    StrLiteral,
+    TableEntry,
+    TableLiteral,
+)
+from zuv_runtime import (  # noqa: E402
+    GLOBALS,
+    UNDEFINED,
+    Array,
+    Integer,
+    Record,
+    String,
+    ZuvError,
+    call,
+    member,
+    type_error,
+)
+
+TIMES = """
+times = fn n f:
+    (n @gt 0) @if:
+        f!
+        (times: (n @sub 1) f)..
+"""
+
+FIB = """
+fib = fn n: (n @lt 2) @? (fn: n) (fn: (fib: (n @sub 1)) @add (fib: (n @sub 2)).)..
+console @debug (fib: 20).
+"""
+
+# `program` checks FizzBuzz against 16 answers; this does it 300 times
+CHECKS = """
+times: 300 (fn: problem @check fizzBuzz.).
+"""
+
+COLLECTIONS = """
+i = 0
+xs = []
+squares = Table!
+addSquare = fn:
+    <=i = i @add 1.
+    xs @push i.
+    squares @set i (i @mul i)..
+times: 2000 addSquare.
+
+total = 0
+(xs @map!x: (squares @get x)) @forEach!y: <=total = total @add y..
+console @debug total.
+
+words = []
+addWord = fn:
+    <=i = i @sub 1.
+    words @push (concat: "w" (String: i) {i})..
+times: 500 addWord.
+console @debug (eq: (", " @join words) (", " @rjoin words)).
+console @log (words @at 3).
+"""
+
+
+def _program_source() -> str:
+    with open(os.path.join(ROOT, "program")) as file:
+        return file.read()
+
+
+WORKLOADS: Dict[str, Callable[[], str]] = {
+    "fib": lambda: FIB,
+    "program": lambda: TIMES + _program_source() + CHECKS,
+    "collections": lambda: TIMES + COLLECTIONS,
+}
+
+
+class Environment:
+    __slots__ = ("names", "parent")
+
+    def __init__(self, parent: Optional["Environment"]):
+        self.names: Dict[str, Any] = {}
+        self.parent = parent
+
+    def find(self, name: str) -> Optional["Environment"]:
+        environment: Optional[Environment] = self
+        while environment is not None and name not in environment.names:
+            environment = environment.parent
+        return environment
+
+
+class TreeWalker:
+    """Evaluates a resolved tree by walking it, every time it runs."""
+
+    def __init__(self) -> None:
+        self.globals: Dict[str, Any] = {}
+        self.methods: Dict[type, Callable[[Any, Environment], Any]] = {
+            BlockExpression: self.block,
+            ExpressionStatement: lambda node, env: self.evaluate(node.expression, env),
+            Name: self.name,
+            IntLiteral: lambda node, env: Integer(node.value),
+            StrLiteral: lambda node, env: String(node.value),
+            ArrayLiteral: lambda node, env: Array([self.evaluate(e, env) for e in node.elements]),
+            TableLiteral: self.table,
+            Assignment: self.assignment,
+            MemberAccess: lambda node, env: member(self.evaluate(node.expression, env), _mangle(node.member_name)),
+            MethodCall: self.method_call,
+            ChainedMethodCall: self.chain,
+            FunctionDefinition: self.function,
+            FunctionCall: self.function_call,
+        }
+
+    def run(self, root: AstElement) -> None:
+        self.globals = {}
+        self.evaluate(root, Environment(None))
+
+    def evaluate(self, node: AstElement, env: Environment) -> Any:
+        return self.methods[type(node)](node, env)
+
+    def block(self, node: BlockExpression, env: Environment) -> Any:
+        value = UNDEFINED
+        for statement in node.statements:
+            value = self.evaluate(statement, env)
+        if not node.implicit_return or not node.statements or isinstance(node.statements[-1], Assignment):
+            return UNDEFINED
+        return value
+
+    def lookup(self, name: str, env: Environment) -> Any:
+        found = env.find(name)
+        if found is not None:
+            return found.names[name]
+        if name in self.globals:
+            return self.globals[name]
+        if name in GLOBALS:
+            return GLOBALS[name]
+        raise ZuvError("ReferenceError", f"{name} is not defined")
+
+    def name(self, node: Name, env: Environment) -> Any:
+        return self.lookup(node.value, env)
+
+    def table(self, node: TableLiteral, env: Environment) -> Record:
+        record = Record()
+        for entry in node.entries:
+            key = "js_" + _mangle(entry[0])
+            if isinstance(entry, TableEntry.KeyValue):
+                setattr(record, key, self.evaluate(entry[1], env))
+            elif isinstance(entry, TableEntry.KeyShorthand):
+                setattr(record, key, self.lookup(entry[0], env))
+            else:
+                setattr(record, key, lambda *_, name=entry[0]: self.lookup(name, env))
+        return record
+
+    def assign(self, target: AstElement, value: Any, env: Environment) -> None:
+        if isinstance(target, LvalueName):
+            env.names[target.name] = value
+        elif isinstance(target, LvalueNameNonlocal):
+            found = env.find(target.name)
+            (found.names if found is not None else self.globals)[target.name] = value
+        elif isinstance(target, LvalueArray):
+            items = zuv_eval._iterate(value)
+            for (i, t) in enumerate(target.targets):
+                self.assign(t, items[i] if i < len(items) else UNDEFINED, env)
+        elif isinstance(target, LvalueTable):
+            for name in target.names:
+                env.names[name] = member(value, _mangle(name))
+
+    def assignment(self, node: Assignment, env: Environment) -> Any:
+        value = self.evaluate(node.expression, env)
+        self.assign(node.target, value, env)
+        return value
+
+    def method_call(self, node: MethodCall, env: Environment) -> Any:
+        receiver = self.evaluate(node.expression, env)
+        method = member(receiver, _mangle(node.method_name))
+        arguments = tuple(self.evaluate(a, env) for a in node.arguments)
+        return call(method, arguments, node.method_name)
+
+    def chain(self, node: ChainedMethodCall, env: Environment) -> Any:
+        s = x = self.evaluate(node.subject, env)
+        for link in node.calls:
+            method = member(s if link.kind == "@" else x, _mangle(link.method_name))
+            x = call(method, tuple(self.evaluate(a, env) for a in link.arguments), link.method_name)
+        return x
+
+    def function(self, node: FunctionDefinition, env: Environment) -> Callable[..., Any]:
+        def function(*args: Any) -> Any:
+            inner = Environment(env)
+            for (i, parameter) in enumerate(node.parameters):
+                value = args[i] if i < len(args) else UNDEFINED
+                if isinstance(parameter, NamedParameter):
+                    inner.names[parameter.name] = value
+                elif isinstance(parameter, ObjectParameter):
+                    for name in parameter.names:
+                        inner.names[name] = member(value, _mangle(name))
+                elif isinstance(parameter, ArrayParameter):
+                    items = zuv_eval._iterate(value)
+                    for (j, name) in enumerate(parameter.names):
+                        inner.names[name] = items[j] if j < len(items) else UNDEFINED
+            return self.evaluate(node.body, inner)
+        return function
+
+    def function_call(self, node: FunctionCall, env: Environment) -> Any:
+        function = self.evaluate(node.function, env)
+        arguments = tuple(self.evaluate(a, env) for a in node.arguments)
+        if not callable(function):
+            raise type_error("function is not a function")
+        return function(*arguments)
+
+
+def _mangle(name: str) -> str:
+    return name.replace("?", "__QMARK")
+
+
+def best_of(fn: Callable[[], Any], runs: int) -> tuple:
+    """The best time of `runs` calls, and what the calls printed."""
+    best = float("inf")
+    printed = ""
+    for _ in range(runs):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            start = time.perf_counter()
+            zuv_eval.with_deep_stack(fn)
+            best = min(best, time.perf_counter() - start)
+        printed = out.getvalue()
+    return (best, printed)
+
+
+def run_node(js: str, runs: int) -> tuple:
+    with open(os.path.join(ROOT, "lib.js")) as file:
+        script = file.read() + "\n" + js
+    best = float("inf")
+    printed = ""
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(["node", "-e", script], capture_output=True, text=True)
+        best = min(best, time.perf_counter() - start)
+        printed = result.stdout
+    return (best, printed)
+
+
+def main(argv: List[str]) -> int:
+    argparser = argparse.ArgumentParser(prog="benchmarks/eval.py", description=__doc__.split("\n\n")[0])
+    argparser.add_argument("--runs", type=int, default=3)
+    argparser.add_argument("--workloads", nargs="+", choices=list(WORKLOADS), default=list(WORKLOADS))
+    args = argparser.parse_args(argv)
+
+    node = shutil.which("node")
+    failures = 0
+    print(f"{'workload':>12} {'walker':>10} {'compile':>10} {'closures':>10} {'speedup':>8} {'node':>10}")
+    for workload in args.workloads:
+        source = WORKLOADS[workload]()
+        ast = compiler.parse(source)
+        zuv_scope.resolve(ast)
+        walker = TreeWalker()
+        (walked, expected) = best_of(lambda: walker.run(ast), args.runs)
+
+        start = time.perf_counter()
+        program = zuv_eval.compile_program(compiler.parse(source))
+        compiled = time.perf_counter() - start
+        (ran, printed) = best_of(program.run, args.runs)
+        outputs = [printed]
+
+        node_cell = f"{'-':>10}"
+        if node is not None:
+            (seconds, printed) = run_node(compiler.compile_source(source), args.runs)
+            node_cell = f"{seconds * 1000:8.1f}ms"
+            outputs.append(printed)
+        if any(output != expected for output in outputs):
+            failures += 1
+            print(f"{workload}: the outputs differ", file=sys.stderr)
+        print(
+            f"{workload:>12} {walked * 1000:8.1f}ms {compiled * 1000:8.1f}ms {ran * 1000:8.1f}ms"
+            f" {walked / ran:7.1f}x {node_cell}"
+        )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
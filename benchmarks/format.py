@@ -0,0 +1,100 @@
+"""
+Formatter benchmark: deeply nested array and table literals.
+
+    python benchmarks/format.py [max_depth]
+
+For each shape and depth, prints how long `as_source()` (the legacy layout)
+and `zuv_format.format_ast` take, and the time per node. Both are linear in
+the size of their output, so the time per node stays flat as the nesting
+gets deeper, until the indentation (which grows with the square of the
+depth) dominates the output.
+"""
+
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import zuv_ast  # noqa: E402
+import zuv_format  # noqa: E402
+
+
+def nested_arrays(depth: int) -> zuv_ast.AstElement:
+    # [0, [1, [2, ... "leaf"]]]
+    node: zuv_ast.AstElement = zuv_ast.StrLiteral("leaf")
+    for i in range(depth, 0, -1):
+        node = zuv_ast.ArrayLiteral([zuv_ast.IntLiteral(i), node])
+    return node
+
+
+def nested_tables(depth: int) -> zuv_ast.AstElement:
+    # {name "n0", child {name "n1", child {... }, size 1}, size 0}
+    node: zuv_ast.AstElement = zuv_ast.TableLiteral([])
+    for i in range(depth, 0, -1):
+        node = zuv_ast.TableLiteral([
+            zuv_ast.TableEntry.KeyValue("name", zuv_ast.StrLiteral(f"n{i}")),
+            zuv_ast.TableEntry.KeyValue("child", node),
+            zuv_ast.TableEntry.KeyShorthand("size"),
+        ])
+    return node
+
+
+def mixed(depth: int) -> zuv_ast.AstElement:
+    # arrays of tables of arrays, each level also holding a short flat literal
+    node: zuv_ast.AstElement = zuv_ast.IntLiteral(0)
+    for i in range(depth, 0, -1):
+        if i % 2:
+            node = zuv_ast.ArrayLiteral([node, zuv_ast.ArrayLiteral([zuv_ast.IntLiteral(i)] * 3)])
+        else:
+            node = zuv_ast.TableLiteral([
+                zuv_ast.TableEntry.KeyValue("inner", node),
+                zuv_ast.TableEntry.KeyValue("tag", zuv_ast.StrLiteral("t")),
+            ])
+    return node
+
+
+SHAPES = {"arrays": nested_arrays, "tables": nested_tables, "mixed": mixed}
+
+
+def count_nodes(root: zuv_ast.AstElement) -> int:
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children())
+    return count
+
+
+def best_of(fn, runs: int = 3) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(max_depth: int):
+    print(f"{'shape':>7} {'depth':>6} {'nodes':>7} {'chars':>9}"
+          f" {'as_source':>10} {'per node':>9} {'format':>9} {'per node':>9}")
+    for (name, make) in SHAPES.items():
+        depth = 10
+        while depth <= max_depth:
+            root = make(depth)
+            nodes = count_nodes(root)
+            chars = len(zuv_format.format_ast(root))
+            legacy = best_of(root.as_source)
+            formatted = best_of(lambda: zuv_format.format_ast(root))
+            print(
+                f"{name:>7} {depth:6} {nodes:7} {chars:9}"
+                f" {legacy * 1000:8.2f}ms {legacy / nodes * 1e6:7.2f}us"
+                f" {formatted * 1000:7.2f}ms {formatted / nodes * 1e6:7.2f}us"
+            )
+            depth *= 4
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2560)
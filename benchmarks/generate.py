@@ -0,0 +1,145 @@
+"""
+Synthetic zuv programs for the benchmarks, each stressing one thing.
+
+    python benchmarks/generate.py SHAPE SIZE > program.zuv
+
+Shapes (what SIZE counts):
+
+    functions   many top-level functions (functions)
+    nesting     `fn` inside `fn` inside `fn`... (levels)
+    chains      one long `...` chain mixing `@` and `|>` calls (calls)
+    literals    one huge table of arrays and tables (entries)
+    strings     long string literals full of escapes (strings of ~2 kB)
+
+The trees are built directly and printed with `zuv_format.format_ast`, so
+the programs always parse back to the same tree.
+"""
+
+import os
+import sys
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import zuv_format  # noqa: E402
+from zuv_ast import (  # noqa: E402
+    ArrayLiteral,
+    Assignment,
+    AstElement,
+    BlockExpression,
+    ChainedMethodCall,
+    FunctionCall,
+    FunctionDefinition,
+    IntLiteral,
+    LvalueName,
+    MethodCall,
+    Name,
+    NamedParameter,
+    SingleChainedCall,
+    StrLiteral,
+    TableEntry,
+    TableLiteral,
+)
+
+
+def _call(function: str, *arguments: AstElement) -> FunctionCall:
+    return FunctionCall(Name(function), list(arguments))
+
+
+def _assign(name: str, value: AstElement) -> Assignment:
+    return Assignment(LvalueName(name), value)
+
+
+def functions(size: int) -> AstElement:
+    statements: List[AstElement] = []
+    for i in range(size):
+        log = MethodCall(Name("console"), "log", [Name("item"), Name("total")])
+        body = BlockExpression([
+            _assign("total", _call("add", Name("a"), Name("b"), IntLiteral(i))),
+            MethodCall(Name("items"), "forEach", [
+                FunctionDefinition([NamedParameter("item")], BlockExpression([log]))
+            ]),
+            TableLiteral([
+                TableEntry.KeyValue("name", StrLiteral(f"f{i}")),
+                TableEntry.KeyShorthand("total"),
+            ]),
+        ])
+        statements.append(_assign(f"f{i}", FunctionDefinition(
+            [NamedParameter("a"), NamedParameter("b")], body
+        )))
+    return BlockExpression(statements, implicit_return=False)
+
+
+def nesting(size: int) -> AstElement:
+    # the innermost function adds up parameters from the levels around it
+    body: List[AstElement] = [
+        _call("add", *(Name(f"x{i}") for i in range(0, size, max(1, size // 8))))
+    ]
+    for i in range(size - 1, -1, -1):
+        scaled = _assign(f"y{i}", _call("mul", Name(f"x{i}"), IntLiteral(i)))
+        body = [FunctionDefinition([NamedParameter(f"x{i}")], BlockExpression([scaled, *body]))]
+    return BlockExpression([_assign("nested", body[0])], implicit_return=False)
+
+
+def chains(size: int) -> AstElement:
+    calls = [
+        SingleChainedCall(
+            "@" if i % 3 == 0 else "|>",
+            ["map", "filter", "concat", "push"][i % 4],
+            [IntLiteral(i)] if i % 2 else [Name("step"), StrLiteral(str(i))],
+        )
+        for i in range(size)
+    ]
+    return BlockExpression([
+        _assign("step", IntLiteral(1)),
+        _assign("result", ChainedMethodCall(Name("items"), calls)),
+    ], implicit_return=False)
+
+
+def literals(size: int) -> AstElement:
+    entries = []
+    for i in range(size):
+        value: AstElement = ArrayLiteral([IntLiteral(i), StrLiteral(f"v{i}"), IntLiteral(i * i)])
+        if i % 10 == 0:
+            value = TableLiteral([
+                TableEntry.KeyValue("id", IntLiteral(i)),
+                TableEntry.KeyValue("tags", ArrayLiteral([StrLiteral("a"), StrLiteral("b")])),
+                TableEntry.KeyShorthand("owner"),
+            ])
+        entries.append(TableEntry.KeyValue(f"key{i}", value))
+    return BlockExpression([
+        _assign("owner", StrLiteral("me")),
+        _assign("data", TableLiteral(entries)),
+    ], implicit_return=False)
+
+
+STRING_CHUNK = 'line "quoted" \\ back\\slash\ttab, unicode: é中 \U0001F600\n'
+
+
+def strings(size: int) -> AstElement:
+    text = STRING_CHUNK * (2048 // len(STRING_CHUNK))
+    return BlockExpression(
+        [_assign(f"s{i}", StrLiteral(f"{i}: {text}")) for i in range(size)],
+        implicit_return=False,
+    )
+
+
+SHAPES: Dict[str, Callable[[int], AstElement]] = {
+    "functions": functions,
+    "nesting": nesting,
+    "chains": chains,
+    "literals": literals,
+    "strings": strings,
+}
+
+
+def generate(shape: str, size: int) -> str:
+    return zuv_format.format_ast(SHAPES[shape](size)) + "\n"
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in SHAPES:
+        sys.exit(f"usage: {sys.argv[0]} {{{','.join(SHAPES)}}} SIZE")
+    sys.stdout.write(generate(sys.argv[1], int(sys.argv[2])))
@@ -0,0 +1,61 @@
+"""
+Incremental compilation benchmark.
+
+    python benchmarks/incremental.py [copies]
+
+Builds a large program out of renamed copies of `program`, then types a
+character into a function in the middle of it, and compares how long the
+incremental and the full recompilation take.
+"""
+
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import main as compiler  # noqa: E402
+from zuv_incremental import IncrementalCompilation  # noqa: E402
+
+
+def make_source(copies: int) -> str:
+    with open(os.path.join(ROOT, "program")) as file:
+        program = file.read()
+    return "\n".join(
+        program.replace("Problem", f"Problem{i}").replace("fizzBuzz", f"fizzBuzz{i}")
+        for i in range(copies)
+    )
+
+
+def main(copies: int):
+    source = make_source(copies)
+    print(f"{source.count(chr(10))} lines")
+
+    start = time.perf_counter()
+    compilation = IncrementalCompilation(source)
+    compilation.to_js()
+    print(f"initial compile: {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    position = source.index("Fizz", len(source) // 2)
+    incremental = []
+    full = []
+    for i in range(20):
+        text = "Fizz" if i % 2 else "Fuzz"
+        start = time.perf_counter()
+        compilation.edit(position, position + 4, text)
+        js = compilation.to_js()
+        incremental.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        expected = compiler.compile_source(compilation.source)
+        full.append(time.perf_counter() - start)
+        assert js == expected
+
+    print(f"incremental edit: {statistics.median(incremental) * 1000:8.2f} ms (median)")
+    print(f"full recompile:   {statistics.median(full) * 1000:8.2f} ms (median)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 80)
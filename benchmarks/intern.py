@@ -0,0 +1,109 @@
+"""
+Hash-consing (`--intern`): the memory the prepared tree keeps and the time
+code generation takes on repetitive sources, with and without it.
+
+    python benchmarks/intern.py [--records 2000] [--runs 3]
+
+The corpus is generated: records like the FizzBuzz test table of `program`,
+repeated with a different name each time, each with the same configuration
+table, a function that uses it, and an unfolded literal expression. The
+JS must be the same with and without interning, with the default flags,
+with `--hoist-literals`, `--minify` and `--no-fold`; the exit status is 1
+otherwise.
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import replace
+from typing import Callable, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import main as compiler  # noqa: E402
+import zuv_ast  # noqa: E402
+
+ROWS = ", ".join(f'[{n}, "{n}"]' for n in range(1, 17))
+
+RECORD = """
+problemK = Problem: {name "FizzBuzz", tests [ROWS]}.
+configK = {name "widget", size 3, tags ["a", "b", "c"], limits {low 0, high 100, step 5}, unit "px"}
+checkK = fn x: ((x @ge (configK->limits->low)) @and (configK->tags @includes "b")).
+labelK = ("widget" @padStart 10) @concat ("px" @repeat (2 @mul 3)).
+"""
+
+
+def make_source(records: int) -> str:
+    record = RECORD.replace("ROWS", ROWS)
+    return "".join(record.replace("K", str(k)) for k in range(records))
+
+
+def best_of(fn: Callable[[], object], runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def prepared(source: str, flags: compiler.CompileFlags) -> Tuple[zuv_ast.AstElement, int, int]:
+    """The prepared tree, the memory it keeps, and the peak while preparing it."""
+    tracemalloc.start()
+    try:
+        ast = compiler.prepare_program(compiler.parse(source, flags.parser), flags)
+        (kept, peak) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return (ast, kept, peak)
+
+
+def emit(ast: zuv_ast.AstElement, flags: compiler.CompileFlags) -> str:
+    sink = io.StringIO()
+    compiler.emit_program(ast, sink, flags)
+    return sink.getvalue()
+
+
+def main(argv: List[str]) -> int:
+    argparser = argparse.ArgumentParser(prog="benchmarks/intern.py", description=__doc__.split("\n\n")[0])
+    argparser.add_argument("--records", type=int, default=2000)
+    argparser.add_argument("--runs", type=int, default=3)
+    args = argparser.parse_args(argv)
+    source = make_source(args.records)
+
+    failures = 0
+    for flags in [
+        compiler.CompileFlags(),
+        compiler.CompileFlags(hoist_literals=True),
+        compiler.CompileFlags(minify=True),
+        compiler.CompileFlags(fold_constants=False),
+    ]:
+        if compiler.compile_source(source, flags) != compiler.compile_source(source, replace(flags, intern=True)):
+            failures += 1
+            print(f"the JS differs with --intern and {flags}", file=sys.stderr)
+
+    print(f"{args.records} records, {len(source)} characters")
+    print(f"{'':>10} {'tree kept':>10} {'peak':>10} {'prepare':>10} {'emit':>10} {'compile':>10}")
+    results = []
+    for flags in [compiler.CompileFlags(), compiler.CompileFlags(intern=True)]:
+        (ast, kept, peak) = prepared(source, flags)
+        prepare = best_of(lambda: compiler.prepare_program(compiler.parse(source, flags.parser), flags), args.runs)
+        emitting = best_of(lambda: emit(ast, flags), args.runs)
+        total = best_of(lambda: compiler.compile_source(source, flags), args.runs)
+        results.append((kept, emitting))
+        label = "interned" if flags.intern else "plain"
+        print(
+            f"{label:>10} {kept / 2**20:8.1f}MB {peak / 2**20:8.1f}MB {prepare * 1000:8.1f}ms"
+            f" {emitting * 1000:8.1f}ms {total * 1000:8.1f}ms"
+        )
+    ((plain_kept, plain_emit), (kept, emitting)) = results
+    print(f"the interned tree keeps {kept / plain_kept:.0%} of the memory; emit takes {emitting / plain_emit:.0%}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
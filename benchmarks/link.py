@@ -0,0 +1,142 @@
+"""
+Separate compilation: linking a project of many modules from scratch, with
+nothing changed, and after editing one module.
+
+    python benchmarks/link.py [--modules 300] [--edits 5]
+
+The project is generated in a temporary directory: every module imports
+`Problem` and `assert` from a shared module (the start of `program`), and a
+value from two earlier modules, and has a few functions of its own. The
+entry prints the value of the last module. Each edit changes the constant
+of a module in the middle. The rebuild after an edit must compile that
+module only, link to the same script as a cold build of the edited project,
+and print what the values add up to in node (if node is on the PATH). The
+exit status is 1 otherwise.
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import main as compiler  # noqa: E402
+from zuv_link import Linker  # noqa: E402
+
+MODULE = """
+import "shared/problems" {Problem, assert}
+IMPORTS
+
+fizzBuzzK = fn n:
+    s = ""
+    (eq: (n @mod 3) 0)
+        @if: <=s = (concat: s "Fizz").
+    (eq: (n @mod 5) 0)
+        @if: <=s = (concat: s "Buzz").
+    (eq: s "")
+        @if: <=s = (concat: s (String: n)).
+    s.
+
+problemK = Problem: {name "FizzBuzz K", tests [[3, "Fizz"], [10, "Buzz"], [15, "FizzBuzz"]]}.
+problemK @check fizzBuzzK.
+assert: (eq: (fizzBuzzK: 7) "7") "fizzBuzzK".
+
+vK = VALUE
+"""
+
+
+def module_source(k: int, constant: int) -> str:
+    if k == 0:
+        (imports, value) = ("", str(constant))
+    else:
+        (j, l) = (k - 1, k // 2)
+        imports = f'import "m{j}" {{v{j}}}' + (f'\nimport "m{l}" {{v{l}}}' if l != j else "")
+        value = f"(v{j} @add v{l}) @add {constant}."
+    return MODULE.replace("IMPORTS", imports).replace("VALUE", value).replace("K", str(k))
+
+
+def expected_value(constants: List[int]) -> int:
+    values: List[int] = []
+    for (k, constant) in enumerate(constants):
+        values.append(constant if k == 0 else values[k - 1] + values[k // 2] + constant)
+    return values[-1]
+
+
+def write(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        file.write(text)
+
+
+def timed_link(linker: Linker, entry: str):
+    start = time.perf_counter()
+    js = linker.link(entry)
+    return (js, time.perf_counter() - start)
+
+
+def main(argv: List[str]) -> int:
+    argparser = argparse.ArgumentParser(prog="benchmarks/link.py", description=__doc__.split("\n\n")[0])
+    argparser.add_argument("--modules", type=int, default=300)
+    argparser.add_argument("--edits", type=int, default=5)
+    args = argparser.parse_args(argv)
+
+    failures = 0
+    flags = compiler.CompileFlags()
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "src")
+        with open(os.path.join(ROOT, "program")) as file:
+            write(os.path.join(src, "shared", "problems.zuv"), "".join(file.readlines()[:13]))
+        constants = list(range(args.modules))
+        for k in constants:
+            write(os.path.join(src, f"m{k}.zuv"), module_source(k, k))
+        last = args.modules - 1
+        entry = os.path.join(src, "main.zuv")
+        write(entry, f'import "m{last}" {{v{last}}}\nconsole @debug v{last}.\n')
+        cache = os.path.join(tmp, "cache")
+
+        (js, cold) = timed_link(Linker(flags, cache), entry)
+        (_, warm) = timed_link(Linker(flags, cache), entry)
+        linker = Linker(flags, cache)
+        linker.link(entry)
+        (_, relink) = timed_link(linker, entry)
+        print(f"{args.modules + 2} modules")
+        print(f"cold build:                    {cold * 1000:8.1f} ms")
+        print(f"nothing changed, new linker:   {warm * 1000:8.1f} ms")
+        print(f"nothing changed, same linker:  {relink * 1000:8.1f} ms")
+
+        edited = args.modules // 2
+        times = []
+        for i in range(args.edits):
+            constants[edited] = 1000 * (i + 1)
+            write(os.path.join(src, f"m{edited}.zuv"), module_source(edited, constants[edited]))
+            (js, seconds) = timed_link(linker, entry)
+            times.append(seconds)
+            if linker.compiled != [os.path.join(src, f"m{edited}.zuv")]:
+                failures += 1
+                print(f"edit {i}: compiled {len(linker.compiled)} modules", file=sys.stderr)
+        print(f"one module edited:             {statistics.median(times) * 1000:8.1f} ms (median)")
+
+        fresh = os.path.join(tmp, "fresh-cache")
+        if js != Linker(flags, fresh).link(entry):
+            failures += 1
+            print("the rebuilt script differs from a cold build", file=sys.stderr)
+
+        if shutil.which("node") is not None:
+            with open(os.path.join(ROOT, "lib.js")) as file:
+                write(os.path.join(tmp, "out.js"), file.read() + "\n" + js)
+            result = subprocess.run(["node", os.path.join(tmp, "out.js")], capture_output=True, text=True)
+            if result.stdout.strip() != str(expected_value(constants)):
+                failures += 1
+                print(f"node printed {result.stdout.strip()!r}{result.stderr}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
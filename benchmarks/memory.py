@@ -0,0 +1,86 @@
+"""
+AST memory benchmark: how much a parsed program takes compared to its source.
+
+    python benchmarks/memory.py [statements]
+
+Generates a program with that many top-level statements (100k by default),
+parses it, and adds up the size of every object the tree keeps alive: the
+nodes, their lists and table entries, and the strings and ints in them.
+Objects that are shared, like interned names, are counted once.
+"""
+
+import gc
+import os
+import sys
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import main as compiler  # noqa: E402
+import zuv_ast  # noqa: E402
+
+TEMPLATES = [
+    'item{i} = {{name "item {i}", size {i}, tags [small, large], owner}}\n',
+    "scale{i} = fn value factor: (mul: value factor {i}).\n",
+    "console @log item{i}->size (scale{i}: 2 3).\n",
+    "items @forEach! item: (console @log item->name).\n",
+    "[low{i}, high{i}] = (split: items {i})\n",
+]
+
+
+def make_source(statements: int) -> str:
+    return "".join(TEMPLATES[i % len(TEMPLATES)].format(i=i) for i in range(statements))
+
+
+def retained_size(root: zuv_ast.AstElement) -> Counter:
+    """Bytes kept alive by the tree, by the type of object holding them."""
+    sizes: Counter = Counter()
+    seen = set()
+    stack = [root]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or obj is None or isinstance(obj, bool):
+            continue
+        seen.add(id(obj))
+        sizes[type(obj).__name__] += sys.getsizeof(obj)
+        if isinstance(obj, zuv_ast.AstElement):
+            slots = [name for cls in type(obj).__mro__ for name in getattr(cls, "__slots__", ())]
+            stack.extend(getattr(obj, name) for name in slots)
+            if hasattr(obj, "__dict__"):
+                sizes["__dict__"] += sys.getsizeof(obj.__dict__)
+                stack.extend(vars(obj).values())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+    return sizes
+
+
+def main(statements: int):
+    source = make_source(statements)
+    start = time.perf_counter()
+    ast = compiler.parse(source)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+
+    sizes = retained_size(ast)
+    total = sum(sizes.values())
+    nodes = sum(1 for _ in _walk(ast))
+    source_bytes = len(source.encode())
+    print(f"{statements} statements, {source_bytes} bytes of source, parsed in {elapsed:.1f} s")
+    print(f"{nodes} nodes, {total} bytes of AST ({total / nodes:.0f} per node,"
+          f" {total / source_bytes:.1f}x the source)")
+    for (name, size) in sizes.most_common(8):
+        print(f"{name:>20} {size:12} bytes {size / total:6.1%}")
+
+
+def _walk(root: zuv_ast.AstElement):
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(node.children())
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,70 @@
+"""
+Parallel compilation of one large file, against a serial compile.
+
+    python benchmarks/parallel.py [--statements 20000] [--jobs 1 2 4 8] [--runs 3]
+
+The file is the `memory` benchmark's mix of top-level statements. For each
+number of jobs this times `zuv_parallel.compile_parallel`, plain and
+minified, and shows the speedup over `main.compile_source`. Splitting the
+source is timed on its own: it is the part that stays serial, with joining
+the results. The speedup can't be more than the number of CPUs (shown
+first). The exit status is 1 if an output differs from the serial one.
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import Callable, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import main as compiler  # noqa: E402
+import zuv_parallel  # noqa: E402
+from memory import make_source  # noqa: E402
+
+
+def best_of(fn: Callable[[], str], runs: int) -> tuple:
+    best = float("inf")
+    result = ""
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return (best, result)
+
+
+def main(argv: List[str]) -> int:
+    argparser = argparse.ArgumentParser(prog="benchmarks/parallel.py", description=__doc__.split("\n\n")[0])
+    argparser.add_argument("--statements", type=int, default=20000)
+    argparser.add_argument("--jobs", nargs="+", type=int, default=[1, 2, 4, 8])
+    argparser.add_argument("--runs", type=int, default=3)
+    args = argparser.parse_args(argv)
+
+    source = make_source(args.statements)
+    compiler.get_parser()
+    print(f"{os.cpu_count()} CPUs, {len(source)} chars, {args.statements} statements")
+    failures = 0
+    print(f"{'flags':>8} {'jobs':>5} {'pieces':>7} {'split':>10} {'serial':>10} {'parallel':>10} {'speedup':>8}")
+    for (label, flags) in [("plain", compiler.CompileFlags()), ("minify", compiler.CompileFlags(minify=True))]:
+        (serial, expected) = best_of(lambda: compiler.compile_source(source, flags), args.runs)
+        for jobs in args.jobs:
+            # with one job, the file is compiled serially
+            (split, cuts) = (0.0, [])
+            if jobs > 1:
+                pieces = zuv_parallel.PIECES_PER_JOB * jobs
+                (split, cuts) = best_of(lambda: zuv_parallel.split_source(source, pieces), args.runs)
+            (parallel, js) = best_of(lambda: zuv_parallel.compile_parallel(source, flags, jobs), args.runs)
+            if js != expected:
+                failures += 1
+                print(f"{label} with {jobs} jobs: the output differs", file=sys.stderr)
+            print(
+                f"{label:>8} {jobs:5} {len(cuts) + 1:7} {split * 1000:8.1f}ms {serial * 1000:8.1f}ms"
+                f" {parallel * 1000:8.1f}ms {serial / parallel:7.2f}x"
+            )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
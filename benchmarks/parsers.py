@@ -0,0 +1,296 @@
+"""
+The two parsers: `zuv_descent` against the Lark grammar, for speed and for
+agreement.
+
+    python benchmarks/parsers.py [--programs 300] [--mutants 10] [--runs 3]
+
+The corpus is the generated programs of the other benchmarks, random trees
+printed by `format_ast` at a few widths and by `legacy_source`, and tricky
+snippets. Each source is also damaged a few times at random: a token is
+dropped, repeated, swapped with the next one, or something is inserted.
+For every source the parsers must both build equal trees, or both fail.
+Then the valid sources are parsed by each, and the throughput (tokens per
+second, counted by Lark's lexer) is compared. The exit status is 1 if the
+parsers disagree on any source.
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import main as compiler  # noqa: E402
+import zuv_descent  # noqa: E402
+import zuv_format  # noqa: E402
+from generate import generate  # noqa: E402
+from memory import make_source  # noqa: E402
+from zuv_ast import (  # noqa: E402
+    ArrayLiteral,
+    ArrayParameter,
+    Assignment,
+    AstElement,
+    BlockExpression,
+    ChainedMethodCall,
+    FunctionCall,
+    FunctionDefinition,
+    IntLiteral,
+    LvalueArray,
+    LvalueName,
+    LvalueNameNonlocal,
+    LvalueTable,
+    MemberAccess,
+    MethodCall,
+    Name,
+    NamedParameter,
+    ObjectParameter,
+    SingleChainedCall,
+    StrLiteral,
+    TableEntry,
+    TableLiteral,
+)
+
+# what the LALR parser decides on its own, and the tokens its lexer only
+# looks for after some tokens
+SNIPPETS = [
+    "[a, b] = x", "[a] = x", "[a, 1]", "[a]", "[[a], 1]", "[[1], a]", "[[a, b], [c]] = x",
+    "[{a, b}, c] = x", "[{a}, c]", "[<=a, b] = x", "[a b]", "[a = 1]", "[] = x", "[]",
+    "{a}", "{a,} = x", "{a, b} = x", "{a, b}", "{a b}", "{a b, c}", "{a} = x", "{} = x", "{}",
+    "x = {a, b}", "x = [a, b]", "x @m [a, b] = y.", "x @m {a} {a,} = y.",
+    "fn:....@m.", "x = fn:....@m.", "x @m y...", "f: x...@m..", "f: x....", "x....@m.",
+    "x... @m..", "x.. .", "x . . .@m.", "x...@a y = z @b w.", "x...@a y = z |>b w.",
+    "{a ()}", "{a ( )}", "{a (b)}", "x = ()", "f: ().",
+    "(f: a)", "(f: a: b)", "(f: a: b.)", "(f: a.: b)", "(x @m a)", "(x @m a b: c)", "(x @m: a)",
+    "(x...@m a)", "(x...@m a.)", "(fn: a)", "(fn: a.)", "(fn: a.)!", "(fn: x @m a)", "(a = 1)",
+    "outer", "outer = 1", "outerx = 1", "fn? = 1", "fn?: 1.", "fn1 = 1", "x @fn.", "x->fn",
+    '"a\\"', '"a\\\\"', '"\\u00e9"', '"a\nb"', '"\\q"', "0123", "-0", "+5", "1a", "a-1", "x->y->z!",
+    "x = 1;", "x = 1; y = 2", "x = 1;;", "<=x = 1", "<= x = 1", "x @m: a @n b..", "x @m! {a} [b]: a.",
+    'import "a" {b}', 'import "a" {b, c,}', 'import "a" {}', 'import "a" b', "import {b}", 'import "a" {b};',
+    'import "a" {b} import "c" {d}', 'f = fn: import "a" {b} b.', 'x @m import "a" {b}.', "import = 1",
+    "importx = 1", "x->import", 'x @m: import "a" {b}.', '(import "a" {b})', 'import "\u00e9" {b}',
+    "x...|>m!y: y.", "x... @a @b |>c.", "x...", "x = ", "", "// only a comment", "x // c\n= 1",
+]
+
+NAMES = ["a", "b", "x", "y?", "_", "fn1", "outerx", "fnx", "is?", "ab_c2"]
+STRINGS = ["", "a", "q\"", "back\\slash", "tab\tnew\nline", "é中 😀", "//", "()"]
+
+
+class RandomTrees:
+    """Random trees that the grammar can express, with every kind of node."""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+
+    def name(self) -> str:
+        return self.rng.choice(NAMES)
+
+    def names(self, least: int) -> List[str]:
+        return [self.name() for _ in range(self.rng.randint(least, 3))]
+
+    def program(self, size: int) -> BlockExpression:
+        return BlockExpression([self.statement(3) for _ in range(size)], implicit_return=False)
+
+    def statement(self, depth: int) -> AstElement:
+        if self.rng.random() < 0.4:
+            return Assignment(self.target(2), self.expression(depth))
+        return self.expression(depth)
+
+    def target(self, depth: int) -> AstElement:
+        r = self.rng.random()
+        if depth <= 0 or r < 0.5:
+            return LvalueName(self.name())
+        if r < 0.65:
+            return LvalueNameNonlocal(self.name())
+        if r < 0.85:
+            return LvalueArray([self.target(depth - 1) for _ in range(self.rng.randint(1, 3))])
+        return LvalueTable(self.names(1))
+
+    def parameters(self) -> List[AstElement]:
+        parameters: List[AstElement] = []
+        for _ in range(self.rng.randint(0, 3)):
+            r = self.rng.random()
+            if r < 0.6:
+                parameters.append(NamedParameter(self.name()))
+            elif r < 0.8:
+                parameters.append(ObjectParameter(self.names(0)))
+            else:
+                parameters.append(ArrayParameter(self.names(0)))
+        return parameters
+
+    def arguments(self, depth: int) -> List[AstElement]:
+        # `stmt_no_method_call`s, or one function that is printed in short
+        if self.rng.random() < 0.2:
+            body = [self.statement(depth) for _ in range(self.rng.randint(0, 2))]
+            return [FunctionDefinition(self.parameters(), BlockExpression(body))]
+        return [self.statement(depth) for _ in range(self.rng.randint(0, 3))]
+
+    def expression(self, depth: int) -> AstElement:
+        rng = self.rng
+        if depth <= 0 or rng.random() < 0.25:
+            r = rng.random()
+            if r < 0.5:
+                return Name(self.name())
+            if r < 0.8:
+                return IntLiteral(rng.choice([0, 1, 42, -7, 10 ** 30]))
+            return StrLiteral(rng.choice(STRINGS))
+        depth -= 1
+        kind = rng.randrange(9)
+        if kind == 0:
+            return ArrayLiteral([self.expression(depth) for _ in range(rng.randint(0, 3))])
+        if kind == 1:
+            entries = []
+            for key in self.names(0):
+                r = rng.random()
+                if r < 0.5:
+                    entries.append(TableEntry.KeyValue(key, self.expression(depth)))
+                elif r < 0.8:
+                    entries.append(TableEntry.KeyShorthand(key))
+                else:
+                    entries.append(TableEntry.GetterShorthand(key))
+            return TableLiteral(entries)
+        if kind == 2:
+            body = [self.statement(depth) for _ in range(rng.randint(0, 3))]
+            return FunctionDefinition(self.parameters(), BlockExpression(body))
+        if kind == 3:
+            arguments = [self.expression(depth) for _ in range(rng.randint(0, 3))]
+            return FunctionCall(self.expression(depth), arguments)
+        if kind == 4:
+            return MemberAccess(self.expression(depth), self.name())
+        if kind in (5, 6):
+            return MethodCall(self.expression(depth), self.name(), self.arguments(depth))
+        calls = [
+            SingleChainedCall(rng.choice(["@", "|>"]), self.name(), self.arguments(depth))
+            for _ in range(rng.randint(1, 3))
+        ]
+        return ChainedMethodCall(self.expression(depth), calls)
+
+
+_PIECE = re.compile(r'\s+|[A-Za-z0-9_?]+|"(?:[^"\\]|\\.)*"|\.\.\.|.', re.DOTALL)
+_INSERTS = [".", "...", "(", ")", "()", "[", "]", "{", "}", ",", "=", ";", ":", "!", "@", "|>", "->", "<=",
+            "fn", "x", "-1", '"s"', " ", "\n"]
+
+
+def mutate(source: str, rng: random.Random) -> str:
+    pieces = _PIECE.findall(source)
+    for _ in range(rng.randint(1, 2)):
+        if not pieces:
+            break
+        i = rng.randrange(len(pieces))
+        r = rng.random()
+        if r < 0.3:
+            del pieces[i]
+        elif r < 0.5:
+            pieces.insert(i, pieces[i])
+        elif r < 0.7 and i + 1 < len(pieces):
+            (pieces[i], pieces[i + 1]) = (pieces[i + 1], pieces[i])
+        else:
+            pieces.insert(i, rng.choice(_INSERTS))
+    return "".join(pieces)
+
+
+def corpus(programs: int, seed: int) -> List[Tuple[str, str]]:
+    sources = [("program", _read("program")), ("program_annotated", _read("program_annotated"))]
+    sources += [(f"snippet {snippet!r}", snippet) for snippet in SNIPPETS]
+    sources += [(shape, generate(shape, 50)) for shape in ["functions", "nesting", "chains", "literals", "strings"]]
+    sources.append(("memory", make_source(200)))
+    for i in range(programs):
+        tree = RandomTrees(random.Random(seed + i)).program(8)
+        printers: List[Callable[[AstElement], str]] = [
+            zuv_format.format_ast,
+            lambda t: zuv_format.format_ast(t, width=30, indent_width=0),
+            lambda t: zuv_format.format_ast(t, width=1000),
+            zuv_format.legacy_source,
+        ]
+        printer = printers[i % len(printers)]
+        sources.append((f"random {seed + i}", printer(tree)))
+    return sources
+
+
+def _read(name: str) -> str:
+    with open(os.path.join(ROOT, name)) as file:
+        return file.read()
+
+
+def outcome(parse: Callable[[str], AstElement], source: str) -> Tuple[Optional[AstElement], str]:
+    try:
+        return (parse(source), "")
+    except Exception as e:
+        return (None, f"{type(e).__name__}: {e}")
+
+
+def agree(source: str) -> Optional[str]:
+    """What differs between the parsers on `source`, if anything."""
+    (expected, expected_error) = outcome(compiler.parse, source)
+    (tree, error) = outcome(zuv_descent.parse, source)
+    if expected is None and tree is None:
+        return None
+    if expected is None:
+        return f"Lark fails with {expected_error}, zuv_descent doesn't"
+    if tree is None:
+        return f"zuv_descent fails with {error}, Lark doesn't"
+    return None if tree == expected else "the trees differ"
+
+
+def best_of(fn: Callable[[], object], runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv: List[str]) -> int:
+    argparser = argparse.ArgumentParser(prog="benchmarks/parsers.py", description=__doc__.split("\n\n")[0])
+    argparser.add_argument("--programs", type=int, default=300, help="random programs in the corpus")
+    argparser.add_argument("--mutants", type=int, default=10, help="damaged copies of each source")
+    argparser.add_argument("--seed", type=int, default=0)
+    argparser.add_argument("--runs", type=int, default=3)
+    args = argparser.parse_args(argv)
+
+    compiler.get_parser()
+    rng = random.Random(args.seed)
+    sources = corpus(args.programs, args.seed)
+    failures = 0
+    checked: Dict[str, int] = {"valid": 0, "invalid": 0}
+    valid_random: List[str] = []
+    for (label, source) in sources:
+        for (i, text) in enumerate([source] + [mutate(source, rng) for _ in range(args.mutants)]):
+            difference = agree(text)
+            if difference is not None:
+                failures += 1
+                print(f"{label}{f' (damaged {i})' if i else ''}: {difference}\n{text}\n", file=sys.stderr)
+            valid = outcome(compiler.parse, text)[0] is not None
+            checked["valid" if valid else "invalid"] += 1
+            if valid and i == 0 and label.startswith("random"):
+                valid_random.append(text)
+    print(f"{checked['valid']} valid and {checked['invalid']} invalid sources, {failures} disagreements")
+
+    # throughput on the larger valid sources
+    big = [
+        ("memory", make_source(4000)),
+        ("functions", generate("functions", 2000)),
+        ("literals", generate("literals", 10000)),
+        ("strings", generate("strings", 300)),
+        ("random", "\n".join(valid_random)),
+    ]
+    print(f"{'source':>10} {'tokens':>8} {'lark':>10} {'descent':>10} {'speedup':>8}")
+    total = [0.0, 0.0]
+    for (label, source) in big:
+        tokens = sum(1 for _ in compiler.get_parser().lex(source))
+        lark = best_of(lambda: compiler.parse(source), args.runs)
+        descent = best_of(lambda: zuv_descent.parse(source), args.runs)
+        total[0] += lark
+        total[1] += descent
+        print(f"{label:>10} {tokens:8} {lark * 1000:8.1f}ms {descent * 1000:8.1f}ms {lark / descent:7.1f}x")
+    print(f"{'total':>10} {'':>8} {total[0] * 1000:8.1f}ms {total[1] * 1000:8.1f}ms {total[0] / total[1]:7.1f}x")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,49 @@
+"""
+Startup benchmark: how long does it take to get a ready-to-use parser?
+
+    python benchmarks/startup.py [runs]
+
+"cold" runs start with an empty cache directory, so lark has to analyse the
+grammar and build the LALR tables; "warm" runs load the tables from disk.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPET = "import main; main.get_parser().parse('x = 1')"
+
+
+def run_once(cache_dir: str) -> float:
+    env = dict(os.environ, ZUV_CACHE_DIR=cache_dir)
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", SNIPPET], cwd=ROOT, env=env, check=True)
+    return time.perf_counter() - start
+
+
+def report(label: str, times):
+    print(
+        f"{label:>5}: median {statistics.median(times) * 1000:8.1f} ms"
+        f"   min {min(times) * 1000:8.1f} ms   ({len(times)} runs)"
+    )
+
+
+def main(runs: int):
+    cold = []
+    warm = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cold.append(run_once(cache_dir))
+            warm.append(run_once(cache_dir))
+    report("cold", cold)
+    report("warm", warm)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -0,0 +1,234 @@
+"""
+Benchmark suite: every compiler phase on generated programs of growing size.
+
+    python benchmarks/suite.py [-o results.json] [--baseline baseline.json]
+
+For each shape in generate.py and each size, it times these phases (best of
+--repeat runs) and measures their peak memory with tracemalloc:
+
+    parse       the LALR parse into a lark tree, without the transformer
+    transform   the `ZuvTransformer` callbacks, run over that tree
+    prepare     constant folding and scope resolution
+    to_js       code generation
+    as_source   the debugging view of the tree
+    format      `zuv_format.format_ast`
+
+It also fits how each phase scales: time ~ size^k, where k is about 1 for a
+linear phase. With -o, the results are written as JSON; with --baseline,
+they are compared with a saved run, and the exit status is 1 if any phase
+got slower than --tolerance times its baseline.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import lark  # noqa: E402
+
+import main as compiler  # noqa: E402
+import zuv_format  # noqa: E402
+import zuv_serialize  # noqa: E402
+from generate import SHAPES, generate  # noqa: E402
+
+RESULTS_FORMAT = 1
+
+PHASES = ["parse", "transform", "prepare", "to_js", "as_source", "format"]
+
+# the smallest size of each shape; the others are 2x, 4x, ...
+BASE_SIZES = {"functions": 250, "nesting": 25, "chains": 250, "literals": 2000, "strings": 50}
+
+# differences smaller than this are noise, whatever the ratio
+MIN_REGRESSION_SECONDS = 0.002
+
+
+def best_of(fn: Callable[[], object], runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(fn: Callable[[], object]) -> int:
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        fn()
+        return tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+
+def count_nodes(root) -> int:
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children())
+    return count
+
+
+# `main.parse` runs the transformer inline, during the parse; to time it on
+# its own, it runs over a lark tree instead (without recursing, like lark)
+TreeTransformer = type(
+    "TreeTransformer", (lark.visitors.Transformer_NonRecursive, compiler.ZuvTransformer), {}
+)
+
+
+def measure(source: str, tree_parser: lark.Lark, repeat: int) -> Dict[str, dict]:
+    """Seconds and peak bytes for each phase, or the error that stopped it."""
+    flags = compiler.CompileFlags()
+    ast = compiler.parse(source)
+    tree = tree_parser.parse(source)
+    data = zuv_serialize.dumps(ast)
+    # (comparing the trees themselves would recurse)
+    assert zuv_serialize.dumps(TreeTransformer().transform(tree)) == data
+    options = compiler.js_options_for(flags)
+
+    # Each of these makes the function to time. Every run of a phase that
+    # changes the tree gets its own copy, and code generation a prepared one.
+    steps: Dict[str, Callable[[], Callable[[], object]]] = {
+        "parse": lambda: lambda: tree_parser.parse(source),
+        "transform": lambda: lambda: TreeTransformer().transform(tree),
+        "prepare": lambda: (lambda tree: lambda: compiler.prepare_program(tree, flags))(
+            zuv_serialize.loads(data)
+        ),
+        "to_js": lambda: (lambda tree: lambda: tree.to_js(options))(
+            compiler.prepare_program(zuv_serialize.loads(data), flags)
+        ),
+        "as_source": lambda: ast.as_source,
+        "format": lambda: lambda: zuv_format.format_ast(ast),
+    }
+    results: Dict[str, dict] = {}
+    for (phase, make) in steps.items():
+        try:
+            seconds = min(best_of(make(), 1) for _ in range(repeat))
+            peak = peak_memory(make())
+        except RecursionError as e:
+            results[phase] = {"error": f"RecursionError: {e}"}
+            continue
+        results[phase] = {"seconds": seconds, "peak_bytes": peak}
+    return results
+
+
+def scaling_exponent(points: List[tuple]) -> Optional[float]:
+    """The slope of log(time) against log(size), by least squares."""
+    points = [(math.log(size), math.log(seconds)) for (size, seconds) in points if seconds > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for (x, _) in points) / len(points)
+    mean_y = sum(y for (_, y) in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for (x, _) in points)
+    return sum((x - mean_x) * (y - mean_y) for (x, y) in points) / spread
+
+
+def run(shapes: List[str], steps: int, scale: float, repeat: int) -> dict:
+    tree_parser = lark.Lark.open(compiler.GRAMMAR_PATH, **compiler._PARSER_OPTIONS)
+    compiler.get_parser()
+    results = []
+    scaling: Dict[str, Optional[float]] = {}
+    for shape in shapes:
+        points: Dict[str, List[tuple]] = {phase: [] for phase in PHASES}
+        print(f"{shape}:")
+        print(f"{'size':>8} {'bytes':>9} {'nodes':>8} " + " ".join(f"{p:>10}" for p in PHASES))
+        for step in range(steps):
+            size = max(1, round(BASE_SIZES[shape] * scale)) * 2 ** step
+            source = generate(shape, size)
+            nodes = count_nodes(compiler.parse(source))
+            measured = measure(source, tree_parser, repeat)
+            cells = []
+            for phase in PHASES:
+                entry = {"shape": shape, "size": size, "source_bytes": len(source.encode()),
+                         "nodes": nodes, "phase": phase, **measured[phase]}
+                results.append(entry)
+                if "seconds" in entry:
+                    points[phase].append((size, entry["seconds"]))
+                    cells.append(f"{entry['seconds'] * 1000:8.1f}ms")
+                else:
+                    cells.append(f"{'error':>10}")
+            print(f"{size:8} {len(source):9} {nodes:8} " + " ".join(cells))
+        exponents = {phase: scaling_exponent(points[phase]) for phase in PHASES}
+        scaling.update({f"{shape}/{phase}": k for (phase, k) in exponents.items()})
+        print(f"{'size^k':>8} {'':>9} {'':>8} " + " ".join(
+            f"{'k=' + format(k, '.2f') if k is not None else '-':>10}" for k in exponents.values()
+        ))
+        print()
+    return {
+        "format": RESULTS_FORMAT,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "lark": lark.__version__,
+        "machine": platform.machine(),
+        "results": results,
+        "scaling": scaling,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> int:
+    """Print the phases that got slower; returns how many did."""
+    def key(entry):
+        return (entry["shape"], entry["size"], entry["phase"])
+
+    before = {key(entry): entry for entry in baseline["results"]}
+    regressions = 0
+    for entry in current["results"]:
+        old = before.get(key(entry))
+        if old is None or "seconds" not in old:
+            continue
+        (shape, size, phase) = key(entry)
+        if "seconds" not in entry:
+            print(f"REGRESSION {shape} {size} {phase}: {entry['error']}")
+            regressions += 1
+            continue
+        ratio = entry["seconds"] / old["seconds"] if old["seconds"] else math.inf
+        if ratio > tolerance and entry["seconds"] - old["seconds"] > MIN_REGRESSION_SECONDS:
+            print(
+                f"REGRESSION {shape} {size} {phase}: {old['seconds'] * 1000:.1f} ms"
+                f" -> {entry['seconds'] * 1000:.1f} ms ({ratio:.2f}x)"
+            )
+            regressions += 1
+    if baseline.get("python") != current["python"] or baseline.get("lark") != current["lark"]:
+        print("note: the baseline was made with different Python or lark versions")
+    print(f"{regressions} regressions against the baseline (tolerance {tolerance:.2f}x)")
+    return regressions
+
+
+def main(argv: List[str]) -> int:
+    argparser = argparse.ArgumentParser(prog="benchmarks/suite.py", description=__doc__.split("\n\n")[0])
+    argparser.add_argument("--shapes", nargs="+", choices=list(SHAPES), default=list(SHAPES))
+    argparser.add_argument("--steps", type=int, default=4, help="sizes per shape, doubling each time")
+    argparser.add_argument("--scale", type=float, default=1.0, help="multiply every size by this")
+    argparser.add_argument("--repeat", type=int, default=3, help="runs per measurement (the best counts)")
+    argparser.add_argument("-o", "--output", help="write the results here, as JSON")
+    argparser.add_argument("--baseline", help="results of an earlier run to compare with")
+    argparser.add_argument("--tolerance", type=float, default=1.25, help="allowed slowdown (default 1.25x)")
+    args = argparser.parse_args(argv)
+
+    current = run(args.shapes, args.steps, args.scale, args.repeat)
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(current, file, indent=1)
+            file.write("\n")
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline.get("format") != RESULTS_FORMAT:
+            print(f"{args.baseline}: unknown results format {baseline.get('format')}")
+            return 2
+        return 1 if compare(current, baseline, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,80 @@
+"""
+Microbenchmark for `sum_type` constructors.
+
+    python benchmarks/sum_type.py [count]
+
+Builds `count` (default: a million) table entries with `TableEntry.KeyValue`
+and compares the time and peak memory with plain tuples and a dataclass, then
+times the `isinstance` dispatch used by `table_entry_to_js`.
+"""
+
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zuv_ast import TableEntry  # noqa: E402
+
+
+@dataclass
+class KeyValueDataclass:
+    key: str
+    value: object
+
+
+def build_sum_type(n):
+    return [TableEntry.KeyValue("key", i) for i in range(n)]
+
+
+def build_tuple(n):
+    return [("key", i) for i in range(n)]
+
+
+def build_dataclass(n):
+    return [KeyValueDataclass("key", i) for i in range(n)]
+
+
+def dispatch(entries):
+    count = 0
+    for e in entries:
+        if isinstance(e, TableEntry.KeyValue):
+            count += 1
+        elif isinstance(e, TableEntry.KeyShorthand):
+            pass
+        elif isinstance(e, TableEntry.GetterShorthand):
+            pass
+    return count
+
+
+def measure(label, build, n):
+    gc.collect()
+    start = time.perf_counter()
+    build(n)
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    result = build(n)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:>12}: {elapsed:6.3f} s   peak {peak / 2**20:7.1f} MiB")
+    return result
+
+
+def main(n):
+    print(f"constructing {n} entries")
+    entries = measure("SumType", build_sum_type, n)
+    measure("tuple", build_tuple, n)
+    measure("dataclass", build_dataclass, n)
+
+    start = time.perf_counter()
+    dispatch(entries)
+    print(f"{'dispatch':>12}: {time.perf_counter() - start:6.3f} s")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,117 @@
+"""
+Functions that call themselves in tail position, run by node as loops and
+as plain recursion (`--no-tail-loops`).
+
+    python benchmarks/tail_loops.py [--iterations 1000000] [--runs 3]
+
+Each workload iterates through a self tail call, in a different tail
+position: an `@?` branch, the last call of an `@else ... @if` chain, a
+loop that makes closures over the values of each iteration, and a
+function that is replaced while it runs. With few iterations, both forms
+must print the same. With many, the loops must still finish; recursion
+usually runs out of stack ("overflow"). The times include node's startup.
+The exit status is 1 if an output differs or a loop fails.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import main as compiler  # noqa: E402
+
+WORKLOADS: Dict[str, str] = {
+    "count": """
+count = fn n acc:
+    (n @eq 0) @? (fn: acc) (fn: (count: (n @sub 1) (acc @add 2)))..
+console @debug (count: N 0).
+""",
+    "chain": """
+countdown = fn n acc:
+    (n @gt 0)...
+        @else: (console @debug acc)
+        @if:
+            next = n @sub 1.
+            (countdown: next (acc @add n))..
+countdown: N 0.
+""",
+    "closures": """
+collect = fn n fs:
+    (n @eq 0) @? (fn: fs) (fn:
+        (fs @push (fn: n))
+        (collect: (n @sub 1) fs).)..
+fs = collect: N [].
+console @debug ((fs @at 0)!).
+console @debug ((fs @at 1)!).
+""",
+    "replaced": """
+f = fn n: (n @eq 0) @? (fn: "done") (fn: (f: (n @sub 1)))..
+g = f
+f = fn n: (concat: "replaced at " n).
+console @debug (g: N).
+console @debug (f: N).
+""",
+}
+
+
+def run_node(js: str) -> Tuple[float, str]:
+    with open(os.path.join(ROOT, "lib.js")) as file:
+        script = file.read() + "\n" + js
+    start = time.perf_counter()
+    result = subprocess.run(["node", "-e", script], capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if result.returncode != 0:
+        failure = "overflow" if "Maximum call stack size exceeded" in result.stderr else "failed"
+        return (seconds, failure)
+    return (seconds, result.stdout)
+
+
+def best_of(js: str, runs: int) -> Tuple[float, str]:
+    results = [run_node(js) for _ in range(runs)]
+    return (min(seconds for (seconds, _) in results), results[-1][1])
+
+
+def main(argv: List[str]) -> int:
+    argparser = argparse.ArgumentParser(prog="benchmarks/tail_loops.py", description=__doc__.split("\n\n")[0])
+    argparser.add_argument("--iterations", type=int, default=1_000_000)
+    argparser.add_argument("--check-iterations", type=int, default=1000)
+    argparser.add_argument("--runs", type=int, default=3)
+    argparser.add_argument("--workloads", nargs="+", choices=list(WORKLOADS), default=list(WORKLOADS))
+    args = argparser.parse_args(argv)
+    if shutil.which("node") is None:
+        print("node is not on the PATH", file=sys.stderr)
+        return 1
+
+    loops = compiler.CompileFlags()
+    recursion = compiler.CompileFlags(tail_loops=False)
+    failures = 0
+    print(f"{'workload':>10} {'recursion':>10} {'loops':>10} {'speedup':>8}")
+    for workload in args.workloads:
+        source = WORKLOADS[workload]
+        small = source.replace(" N", f" {args.check_iterations}")
+        outputs = [run_node(compiler.compile_source(small, flags))[1] for flags in (recursion, loops)]
+        if outputs[0] != outputs[1]:
+            failures += 1
+            print(f"{workload}: the outputs differ\n{outputs[0]}\n{outputs[1]}", file=sys.stderr)
+
+        big = source.replace(" N", f" {args.iterations}")
+        (recursed, printed) = best_of(compiler.compile_source(big, recursion), args.runs)
+        (looped, looped_printed) = best_of(compiler.compile_source(big, loops), args.runs)
+        if looped_printed in ("overflow", "failed"):
+            failures += 1
+            print(f"{workload}: the loop {looped_printed}", file=sys.stderr)
+        if printed in ("overflow", "failed"):
+            print(f"{workload:>10} {printed:>10} {looped * 1000:8.1f}ms {'-':>8}")
+        else:
+            print(f"{workload:>10} {recursed * 1000:8.1f}ms {looped * 1000:8.1f}ms {recursed / looped:7.2f}x")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,106 @@
+"""
+Integer and String operations run unboxed, against the boxed operations of
+`--no-unbox`, in node.
+
+    python benchmarks/unboxed.py [--iterations 200000] [--runs 3]
+
+The workloads loop through numeric code: the `fizzBuzz` of `program`, a
+sum of squares modulo 7, and Collatz sequences. For each this shows the
+best time of a few runs (with node's startup) and how many times node's
+young generation had to be collected, which goes with the number of boxes
+allocated. Both forms must print the same; the exit status is 1 otherwise.
+"""
+
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import main as compiler  # noqa: E402
+
+WORKLOADS: Dict[str, str] = {
+    "fizzbuzz": """
+fizzBuzz = fn n:
+    s = ""
+    (eq: (n @mod 3) 0)
+        @if: <=s = (concat: s "Fizz").
+    (eq: (n @mod 5) 0)
+        @if: <=s = (concat: s "Buzz").
+    (eq: s "")
+        @if: <=s = (concat: s (String: n)).
+    s.
+count = fn i found:
+    (i @gt N) @? (fn: found) (fn: (count: (i @add 1) (found @add ((eq: (fizzBuzz: i) "FizzBuzz") @? (fn: 1) (fn: 0)))))..
+console @debug (count: 1 0).
+""",
+    "squares": """
+sum = fn i acc:
+    (i @gt N) @? (fn: acc) (fn: (sum: (i @add 1) (acc @add ((i @mul i) @mod 7))))..
+console @debug (sum: 1 0).
+""",
+    "collatz": """
+steps = fn n count:
+    (n @eq 1) @? (fn: count) (fn: (steps: (((n @mod 2) @eq 0) @? (fn: (n @div 2)) (fn: ((n @mul 3) @add 1))) (count @add 1)))..
+total = fn i acc:
+    (i @gt N) @? (fn: acc) (fn: (total: (i @add 1) (acc @add (steps: i 0))))..
+console @debug (total: 1 0).
+""",
+}
+
+# a line of `--trace-gc` for a collection of the young generation
+_SCAVENGE = re.compile(r"^\[\d+:0x[0-9a-f]+\].*Scavenge", re.MULTILINE)
+
+
+def run_node(js: str) -> Tuple[float, str, int]:
+    with open(os.path.join(ROOT, "lib.js")) as file:
+        script = file.read() + "\n" + js
+    start = time.perf_counter()
+    result = subprocess.run(["node", "--trace-gc", "-e", script], capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    printed = "".join(line + "\n" for line in result.stdout.splitlines() if not line.startswith("["))
+    if result.returncode != 0:
+        printed += result.stderr
+    return (seconds, printed, len(_SCAVENGE.findall(result.stdout)))
+
+
+def best_of(js: str, runs: int) -> Tuple[float, str, int]:
+    results = [run_node(js) for _ in range(runs)]
+    return (min(seconds for (seconds, _, _) in results), results[-1][1], results[-1][2])
+
+
+def main(argv: List[str]) -> int:
+    argparser = argparse.ArgumentParser(prog="benchmarks/unboxed.py", description=__doc__.split("\n\n")[0])
+    argparser.add_argument("--iterations", type=int, default=200_000)
+    argparser.add_argument("--runs", type=int, default=3)
+    argparser.add_argument("--workloads", nargs="+", choices=list(WORKLOADS), default=list(WORKLOADS))
+    args = argparser.parse_args(argv)
+    if shutil.which("node") is None:
+        print("node is not on the PATH", file=sys.stderr)
+        return 1
+
+    failures = 0
+    print(f"{'workload':>10} {'boxed':>10} {'GCs':>6} {'unboxed':>10} {'GCs':>6} {'speedup':>8}")
+    for workload in args.workloads:
+        source = WORKLOADS[workload].replace(" N", f" {args.iterations}")
+        boxed_js = compiler.compile_source(source, compiler.CompileFlags(unbox=False))
+        (boxed, boxed_printed, boxed_gcs) = best_of(boxed_js, args.runs)
+        (unboxed, printed, gcs) = best_of(compiler.compile_source(source), args.runs)
+        if printed != boxed_printed:
+            failures += 1
+            print(f"{workload}: the outputs differ\n{boxed_printed}\n{printed}", file=sys.stderr)
+        print(
+            f"{workload:>10} {boxed * 1000:8.1f}ms {boxed_gcs:6} {unboxed * 1000:8.1f}ms {gcs:6}"
+            f" {boxed / unboxed:7.2f}x"
+        )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,10 +1,32 @@
+import argparse
+import glob
+import hashlib
+import importlib
+import inspect
+import io
 import json
-from typing import Any
+import os
+import pathlib
+import shutil
+import sys
+from dataclasses import dataclass
+from typing import Any, List, Optional, TextIO
 import zuv_ast
+import zuv_optimize
+import zuv_scope
+import zuv_serialize
+import zuv_types
 
+import lark
 from lark import Lark, Transformer, v_args
 
 
+def _identifier(token: lark.Token) -> str:
+    # The same few names come up over and over in a program: keep one copy of
+    # each, as a plain `str` rather than a `Token` with its position.
+    return sys.intern(str(token))
+
+
 @v_args(inline=True)
 class ZuvTransformer(Transformer):
     @staticmethod
@@ -27,11 +49,11 @@ class ZuvTransformer(Transformer):
     # Assignment:
     @staticmethod
     def lvalue_name_nonlocal(token):
-        return zuv_ast.LvalueNameNonlocal(token.value)
+        return zuv_ast.LvalueNameNonlocal(_identifier(token))
 
     @staticmethod
     def lvalue_name(token):
-        return zuv_ast.LvalueName(token.value)
+        return zuv_ast.LvalueName(_identifier(token))
 
     @staticmethod
     def lvalue_array(targets):
@@ -39,16 +61,23 @@ class ZuvTransformer(Transformer):
 
     @staticmethod
     def lvalue_table(targets):
-        return zuv_ast.LvalueTable(targets)
+        return zuv_ast.LvalueTable(list(map(_identifier, targets)))
 
     @staticmethod
     def assignment_stmt(target, expr):
         return zuv_ast.Assignment(target, expr)
 
+    @staticmethod
+    def import_stmt(path, names):
+        # `{a, b} = <the exports of the module>`
+        return zuv_ast.Assignment(
+            zuv_ast.LvalueTable(list(map(_identifier, names))), zuv_ast.ModuleReference(json.loads(path))
+        )
+
     # Literals:
     @staticmethod
     def name_literal(token):
-        return zuv_ast.Name(token.value)
+        return zuv_ast.Name(_identifier(token))
 
     @staticmethod
     def int_literal(token):
@@ -70,11 +99,11 @@ class ZuvTransformer(Transformer):
     @staticmethod
     def table_literal_entry(key, value):
         if value is None:
-            return zuv_ast.TableEntry.KeyShorthand(key.value)
+            return zuv_ast.TableEntry.KeyShorthand(_identifier(key))
         elif value == "()":
-            return zuv_ast.TableEntry.GetterShorthand(key.value)
+            return zuv_ast.TableEntry.GetterShorthand(_identifier(key))
         else:
-            return zuv_ast.TableEntry.KeyValue(key.value, value)
+            return zuv_ast.TableEntry.KeyValue(_identifier(key), value)
 
     @staticmethod
     def fn_parameters(*params):
@@ -82,7 +111,7 @@ class ZuvTransformer(Transformer):
 
     @staticmethod
     def member_access(expr, identifier):
-        return zuv_ast.MemberAccess(expr, identifier.value)
+        return zuv_ast.MemberAccess(expr, _identifier(identifier))
 
     @staticmethod
     def shorthand_args(*params):
@@ -90,26 +119,26 @@ class ZuvTransformer(Transformer):
 
     @staticmethod
     def param_name(name):
-        return zuv_ast.NamedParameter(str(name))
+        return zuv_ast.NamedParameter(_identifier(name))
 
     @staticmethod
     def param_object(names):
-        return zuv_ast.ObjectParameter(names)
+        return zuv_ast.ObjectParameter(list(map(_identifier, names)))
 
     @staticmethod
     def param_array(names):
-        return zuv_ast.ArrayParameter(names)
+        return zuv_ast.ArrayParameter(list(map(_identifier, names)))
 
     @staticmethod
     def bare_method_call(expr, method_name, shorthand_args, *args):
         if shorthand_args is not None:
             return zuv_ast.MethodCall(
                 expr,
-                method_name.value,
+                _identifier(method_name),
                 [zuv_ast.FunctionDefinition(shorthand_args, zuv_ast.BlockExpression(list(args)))]
             )
         else:
-            return zuv_ast.MethodCall(expr, method_name.value, list(args))
+            return zuv_ast.MethodCall(expr, _identifier(method_name), list(args))
 
     @staticmethod
     def bare_function_call(function, *args):
@@ -138,32 +167,419 @@ class ZuvTransformer(Transformer):
         if shorthand_args is not None:
             return zuv_ast.SingleChainedCall(
                 kind,
-                method_name.value,
+                _identifier(method_name),
                 [zuv_ast.FunctionDefinition(shorthand_args, zuv_ast.BlockExpression(list(args)))]
             )
         else:
-            return zuv_ast.SingleChainedCall(kind, method_name.value, list(args))
+            return zuv_ast.SingleChainedCall(kind, _identifier(method_name), list(args))
 
     @staticmethod
     def chained_method_call_expr(subject, *calls):
         return zuv_ast.ChainedMethodCall(subject, list(calls))
 
 
-parser = Lark.open(
-    "grammar.lark",
-    rel_to=__file__,
-    parser="lalr",
-    maybe_placeholders=True,
-    transformer=ZuvTransformer(),
+GRAMMAR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "grammar.lark")
+
+# Where serialized parser tables live. `__pycache__` is already ignored by git
+# and is the first place people look when they want to wipe caches.
+CACHE_DIR = os.environ.get("ZUV_CACHE_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "__pycache__"
 )
 
+_PARSER_OPTIONS = dict(parser="lalr", maybe_placeholders=True)
+
+_parser: Optional[Lark] = None
+
+
+def parser_cache_key() -> str:
+    """
+    Hash of everything the LALR tables depend on: the grammar, the
+    transformer, the options and the lark/Python versions.
+    """
+    h = hashlib.sha256()
+    with open(GRAMMAR_PATH, "rb") as file:
+        h.update(file.read())
+    try:
+        h.update(inspect.getsource(ZuvTransformer).encode())
+    except OSError:
+        h.update(" ".join(sorted(vars(ZuvTransformer))).encode())
+    h.update(repr(sorted(_PARSER_OPTIONS.items())).encode())
+    h.update(f"{lark.__version__} {sys.version_info[:2]}".encode())
+    return h.hexdigest()[:32]
+
+
+def _build_parser() -> Lark:
+    key = parser_cache_key()
+    cache_path = os.path.join(CACHE_DIR, f"zuv_parser.{key}.lark")
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+    except OSError:
+        return Lark.open(GRAMMAR_PATH, transformer=ZuvTransformer(), **_PARSER_OPTIONS)
+
+    if not os.path.exists(cache_path):
+        # the grammar or the transformer changed: old tables are useless now
+        _remove_stale("zuv_parser.*.lark", cache_path)
+
+    # lark verifies the tables against the grammar itself, and falls back to
+    # building them from scratch if the file is missing or unreadable
+    return Lark.open(
+        GRAMMAR_PATH, cache=cache_path, transformer=ZuvTransformer(), **_PARSER_OPTIONS
+    )
+
+
+def _remove_stale(pattern: str, current: str) -> None:
+    """
+    Remove the caches in `CACHE_DIR` that match `pattern`, except `current`.
+    Another process may be removing the same ones.
+    """
+    for stale in glob.glob(os.path.join(CACHE_DIR, pattern)):
+        if os.path.basename(stale) == os.path.basename(current):
+            continue
+        try:
+            if os.path.isdir(stale):
+                shutil.rmtree(stale, ignore_errors=True)
+            else:
+                pathlib.Path(stale).unlink(missing_ok=True)
+        except OSError:
+            pass
+
+
+def get_parser() -> Lark:
+    """Build the parser on first use, loading the LALR tables from disk if possible."""
+    global _parser
+    if _parser is None:
+        _parser = _build_parser()
+    return _parser
+
+
+def __getattr__(name: str) -> Any:
+    # `main.parser` used to be built at import time; keep it working lazily
+    if name == "parser":
+        return get_parser()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# "lark" is the LALR parser of `grammar.lark`; "descent" is the faster
+# hand-written one in `zuv_descent`, which builds the same trees
+PARSERS = ("lark", "descent")
+
+
+def parse(source: str, parser: str = "lark") -> zuv_ast.AstElement:
+    if parser == "descent":
+        import zuv_descent
+        return zuv_descent.parse(source)
+    ast: Any = get_parser().parse(source)
+    assert isinstance(ast, zuv_ast.AstElement)
+    return ast
+
+
+# how many trees `parse_cached` keeps on disk; the oldest go first
+AST_CACHE_SIZE = 512
+
+_ast_cache_dir: Optional[str] = None
+
+
+def ast_cache_dir() -> str:
+    """Where `parse_cached` keeps trees built by this parser, in this format."""
+    global _ast_cache_dir
+    if _ast_cache_dir is None:
+        h = hashlib.sha256(parser_cache_key().encode())
+        h.update(str(zuv_serialize.FORMAT_VERSION).encode())
+        _ast_cache_dir = os.path.join(CACHE_DIR, f"zuv_asts.{h.hexdigest()[:16]}")
+    return _ast_cache_dir
+
+
+def parse_cached(source: str, parser: str = "lark") -> zuv_ast.AstElement:
+    """
+    `parse`, but the tree is also saved on disk, keyed by a hash of the
+    source, and loaded from there the next time the same source is parsed
+    (by either parser).
+    """
+    directory = ast_cache_dir()
+    key = hashlib.sha256(source.encode("utf-8", "surrogatepass")).hexdigest()[:32]
+    path = os.path.join(directory, key + ".zast")
+    try:
+        with open(path, "rb") as file:
+            return zuv_serialize.loads(file.read())
+    except (OSError, zuv_serialize.FormatError):
+        pass
+
+    ast = parse(source, parser)
+    try:
+        _store_tree(directory, path, zuv_serialize.dumps(ast))
+    except OSError:
+        pass
+    return ast
+
+
+def _store_tree(directory: str, path: str, data: bytes) -> None:
+    if not os.path.isdir(directory):
+        # the grammar, the transformer or the format changed
+        _remove_stale("zuv_asts.*", directory)
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+    entries = [entry for entry in os.scandir(directory) if entry.name.endswith(".zast")]
+    if len(entries) > AST_CACHE_SIZE:
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - AST_CACHE_SIZE]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+@dataclass(frozen=True)
+class CompileFlags:
+    """Optional compiler behaviour, as selected on the command line."""
+    hoist_literals: bool = False
+    fold_constants: bool = True
+    lower_chains: bool = True
+    tail_loops: bool = True
+    unbox: bool = True
+    intern: bool = False
+    minify: bool = False
+    parser: str = "lark"
+
+
+def add_flag_arguments(argparser: argparse.ArgumentParser) -> None:
+    argparser.add_argument(
+        "--hoist-literals",
+        action="store_true",
+        help="create each literal used in a function once, as a module-level constant",
+    )
+    argparser.add_argument(
+        "--no-fold",
+        dest="fold_constants",
+        action="store_false",
+        help="don't evaluate constant expressions at compile time",
+    )
+    argparser.add_argument(
+        "--no-lower-chains",
+        dest="lower_chains",
+        action="store_false",
+        help="always compile `...` chains to an immediately invoked closure",
+    )
+    argparser.add_argument(
+        "--no-tail-loops",
+        dest="tail_loops",
+        action="store_false",
+        help="compile functions that call themselves in tail position as plain recursion",
+    )
+    argparser.add_argument(
+        "--no-unbox",
+        dest="unbox",
+        action="store_false",
+        help="run every Integer and String operation on boxed values, even where the types are known",
+    )
+    argparser.add_argument(
+        "--intern",
+        action="store_true",
+        help="share identical subtrees without names, like repeated literal tables, and generate their JS once",
+    )
+    argparser.add_argument(
+        "--minify",
+        action="store_true",
+        help="shorten local names and drop unneeded whitespace",
+    )
+    argparser.add_argument(
+        "--parser",
+        choices=PARSERS,
+        default="lark",
+        help="the Lark LALR parser, or the hand-written recursive-descent one (faster)",
+    )
+
+
+def flags_from_args(args: argparse.Namespace) -> CompileFlags:
+    return CompileFlags(
+        hoist_literals=args.hoist_literals,
+        fold_constants=args.fold_constants,
+        lower_chains=args.lower_chains,
+        tail_loops=args.tail_loops,
+        unbox=args.unbox,
+        intern=args.intern,
+        minify=args.minify,
+        parser=args.parser,
+    )
+
+
+def js_options_for(flags: CompileFlags) -> zuv_ast.JsOptions:
+    return zuv_ast.JsOptions(lower_chains=flags.lower_chains, tail_loops=flags.tail_loops, minify=flags.minify)
+
+
+class CompileHooks:
+    """
+    Callbacks around the steps of a compile (see `zuv_stats`); override the
+    ones you need. The phases are "parse", "fold", "intern", "resolve",
+    "types" and "emit", and `after_phase` gets the tree the phase produced (None after
+    "emit"). The statement hooks fire around the code generation of each
+    top-level statement.
+    """
+
+    def before_phase(self, phase: str) -> None:
+        pass
+
+    def after_phase(self, phase: str, ast: Optional[zuv_ast.AstElement]) -> None:
+        pass
+
+    def before_statement(self, index: int, statement: zuv_ast.Statement) -> None:
+        pass
+
+    def after_statement(self, index: int, statement: zuv_ast.Statement) -> None:
+        pass
+
+    def js_options(self, options: zuv_ast.JsOptions) -> None:
+        """Adjust the code generation settings before "emit"."""
+
+
+def run_phase(hooks: Optional[CompileHooks], phase: str, fn, *args) -> Any:
+    if hooks is None:
+        return fn(*args)
+    hooks.before_phase(phase)
+    result = fn(*args)
+    hooks.after_phase(phase, result)
+    return result
+
+
+def prepare_program(
+    ast: zuv_ast.AstElement,
+    flags: CompileFlags = CompileFlags(),
+    hooks: Optional[CompileHooks] = None,
+) -> zuv_ast.AstElement:
+    """Run the passes between parsing and code generation."""
+    if flags.fold_constants:
+        ast = run_phase(hooks, "fold", zuv_optimize.fold_constants, ast)
+    if flags.intern:
+        ast = run_phase(hooks, "intern", zuv_optimize.intern_subtrees, ast)
+    ast = run_phase(hooks, "resolve", _resolve, ast, flags.minify)
+    if flags.unbox:
+        ast = run_phase(hooks, "types", zuv_types.infer, ast)
+    return ast
+
+
+def _resolve(ast: zuv_ast.AstElement, minify: bool) -> zuv_ast.AstElement:
+    zuv_scope.resolve(ast, minify)
+    return ast
+
+
+def write_program(
+    ast: zuv_ast.AstElement,
+    sink: TextIO,
+    flags: CompileFlags = CompileFlags(),
+    hooks: Optional[CompileHooks] = None,
+) -> None:
+    emit_program(prepare_program(ast, flags, hooks), sink, flags, hooks)
+
+
+def emit_program(
+    ast: zuv_ast.AstElement,
+    sink: TextIO,
+    flags: CompileFlags = CompileFlags(),
+    hooks: Optional[CompileHooks] = None,
+) -> None:
+    """Write the JS for a tree that went through `prepare_program`."""
+    options = js_options_for(flags)
+    if flags.tail_loops:
+        options.shadowed = zuv_ast.declared_names(ast) & zuv_ast.BRANCH_GLOBALS
+    if hooks is not None:
+        hooks.js_options(options)
+    run_phase(hooks, "emit", _emit, ast, options, flags, sink, hooks)
+
+
+def _emit(
+    ast: zuv_ast.AstElement,
+    options: zuv_ast.JsOptions,
+    flags: CompileFlags,
+    sink: TextIO,
+    hooks: Optional[CompileHooks],
+) -> None:
+    if flags.intern:
+        options.memo = zuv_ast.shared_nodes(ast)
+    if flags.hoist_literals:
+        options.constants = zuv_ast.collect_constants(
+            ast, zuv_ast.declared_names(ast) & zuv_ast.LITERAL_CONSTRUCTORS
+        )
+        declaration = zuv_ast.constants_declaration(options.constants)
+        if flags.minify:
+            declaration = "".join(zuv_ast.minify_js([declaration]))
+        sink.write(declaration)
+    if hooks is not None and isinstance(ast, zuv_ast.BlockExpression):
+        parts = zuv_ast.js_parts(ast.hooked_js_iter(options, hooks), options)
+        zuv_ast.write_js_parts(parts, options, sink)
+    else:
+        ast.write_js(options, sink)
+
+
+def compile_source(
+    source: str,
+    flags: CompileFlags = CompileFlags(),
+    cache: bool = False,
+    hooks: Optional[CompileHooks] = None,
+) -> str:
+    """With `cache`, the tree comes from `parse_cached`."""
+    sink = io.StringIO()
+    ast = run_phase(hooks, "parse", parse_cached if cache else parse, source, flags.parser)
+    write_program(ast, sink, flags, hooks)
+    return sink.getvalue()
+
+
+# Subcommands: `python main.py <command> ...` runs `<module>.main(args)`
+COMMANDS = {
+    "batch": "zuv_batch",
+    "bundle": "zuv_bundle",
+    "fmt": "zuv_format",
+    "link": "zuv_link",
+    "run": "zuv_eval",
+    "watch": "zuv_watch",
+}
+
+
+def main(argv: List[str]) -> int:
+    if argv and argv[0] in COMMANDS:
+        module = importlib.import_module(COMMANDS[argv[0]])
+        return module.main(argv[1:])
+
+    argparser = argparse.ArgumentParser(
+        prog="main.py",
+        description="Compile a zuv file to JS, printed to stdout."
+        f" Other commands: {', '.join(COMMANDS)}.",
+    )
+    argparser.add_argument("path")
+    add_flag_arguments(argparser)
+    argparser.add_argument(
+        "--stats",
+        metavar="FILE",
+        help="write timings and other statistics of each phase to FILE as JSON (- for stderr)",
+    )
+    argparser.add_argument("--profile", metavar="FILE", help="write a cProfile of the phases to FILE")
+    argparser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="compile the top-level statements of a large file in this many processes",
+    )
+    args = argparser.parse_args(argv)
+    if args.jobs is not None and (args.hoist_literals or args.stats is not None or args.profile is not None):
+        argparser.error("--jobs can't be combined with --hoist-literals, --stats or --profile")
+
+    with open(args.path, "r") as file:
+        source = file.read()
+    flags = flags_from_args(args)
+    if args.jobs is not None:
+        import zuv_parallel
+        zuv_parallel.write_parallel(source, sys.stdout, flags, args.jobs)
+    elif args.stats is None and args.profile is None:
+        write_program(parse_cached(source, flags.parser), sys.stdout, flags)
+    else:
+        import zuv_stats
+        zuv_stats.compile_with_report(source, sys.stdout, flags, args.stats, args.profile)
+    sys.stdout.write("\n")
+    return 0
+
 
 if __name__ == "__main__":
-    import sys
-
-    with open(sys.argv[1], "r") as file:
-        ast: Any = parser.parse(file.read())
-        assert isinstance(ast, zuv_ast.AstElement)
-        print(ast.to_js(zuv_ast.Box(zuv_ast.JsContext(
-            None, set(), set()
-        ))))
\ No newline at end of file
+    sys.exit(main(sys.argv[1:]))
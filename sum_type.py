@@ -1,84 +1,68 @@
-# type: ignore
 """
 Sum type. Abandon all hope ye who enter here.
-"""
 
-from context_manager_patma import register
-from typing import Any, Callable, Iterator, Tuple, Type, TypeVar, overload
+    class TableEntry(SumType):
+        KeyValue(str, object)
+        KeyShorthand(str)
 
+Every variant becomes a slotted `tuple` subclass of `TableEntry`, built once
+when the class body is executed. Values are plain tuples underneath, so they
+can be destructured (`[k, v] = entry`), and `isinstance` works without any
+custom `__instancecheck__` magic.
+"""
 
-class _EmbellishedBase:
-    _constructor_name: str
+from typing import Any, Iterator, Tuple, Type
 
 
-def embellished(name, definition):
-    class EmbellishedMeta(type):
-        def __repr__(self):
-            return f"embellished({self._constructor_name!r}, {definition!r})"
+def make_constructor(name: str, definition: Tuple[type, ...], base: type = object) -> Type[tuple]:
+    arity = len(definition)
+    # `object` accepts anything, so don't bother checking those fields
+    checked = tuple((i, t) for (i, t) in enumerate(definition) if t is not object)
 
-    class Embellished(_EmbellishedBase, metaclass=EmbellishedMeta):
-        _constructor_name = name
-        def __repr__(self):
-            return f"prop<:{self._constructor_name} :: {definition!r})>({self})"
+    def coerce(args):
+        return tuple(
+            x if isinstance(x, t) else t(x)
+            for (t, x) in zip(definition, args)
+        )
 
-    return Embellished
+    def __new__(cls, *args):
+        if len(args) != arity:
+            raise TypeError(
+                f"{name} takes {arity} argument(s), got {len(args)}"
+            )
+        for (i, t) in checked:
+            if not isinstance(args[i], t):
+                # otherwise, try to coerce the value
+                args = coerce(args)
+                break
+        return tuple.__new__(cls, args)
 
+    def __repr__(self):
+        return f"{name}({', '.join(map(repr, self))})"
 
-def make_constructor(name, definition):
-    # Metametaclass!
-    class __make_base_meta__(type):
-        def __instancecheck__(self, instance):
-            return (
-                isinstance(instance, _EmbellishedBase)
-                and instance._constructor_name == name
-            )
+    def __eq__(self, other):
+        if not isinstance(other, tuple):
+            return NotImplemented
+        return type(self) is type(other) and tuple.__eq__(self, other)
 
-        def __repr__(self):
-            return name
+    def __ne__(self, other):
+        result = __eq__(self, other)
+        return result if result is NotImplemented else not result
 
-    class __make_base__(type, metaclass=__make_base_meta__):
-        def __instancecheck__(self, instance):
-            return (
-                isinstance(instance, _EmbellishedBase)
-                and instance._constructor_name == name
-            )
+    def __hash__(self):
+        return hash((name, tuple.__hash__(self)))
 
-    if isinstance(definition, type):
-        class __make__(__make_base__):
-            def __new__(self, x):
-                if isinstance(x, definition):
-                    return x
-                # otherwise, try to coerce the value
-                e = embellished(name, definition)
-                return type(type.__name__ + "*", (definition, e, ), {})(x)
-    elif isinstance(definition, tuple):
-        class __make__(__make_base__):
-            def __new__(self, *args):
-                if len(args) != len(definition):
-                    raise TypeError(
-                        "Incorrect argument count for tuple constructor"
-                    )
-                e = embellished(name, definition)
-
-                def _repr(self):
-                    return f"{name}({', '.join(map(repr, self))})"
-                e.__repr__ = _repr
-
-                def _eq(self, other):
-                    if not isinstance(other, tuple):
-                        return NotImplemented
-                    if not hasattr(other, "_constructor_name"):
-                        return False
-                    return self._constructor_name == other._constructor_name
-                e.__eq__ = _eq
-
-                T = type(type.__name__ + "*", (e, tuple), {})
-                return T(
-                    make_constructor(f"{name}.{i}", t)(x)
-                    for i, (t, x) in enumerate(zip(definition, args))
-                )
-
-    return __make__
+    return type(name.rsplit(".", 1)[-1], (tuple, base), {
+        "__slots__": (),
+        "__qualname__": name,
+        "__new__": __new__,
+        "__repr__": __repr__,
+        "__eq__": __eq__,
+        "__ne__": __ne__,
+        "__hash__": __hash__,
+        "_constructor_name": name,
+        "_definition": definition,
+    })
 
 
 class SumTypeProperty:
@@ -89,8 +73,6 @@ class SumTypeProperty:
 
     def __call__(self, *definition):
         self.definition = definition
-        key = self.name.split(".")[1]
-        self.parent_dict[key] = make_constructor(self.name, definition)
 
     def __repr__(self):
         return f"<:{self.name} :: {self.definition}>"
@@ -111,27 +93,41 @@ class SumTypeDict(dict):
 
 
 class SumTypeMeta(type):
-    def __prepare__(name, *args, **kwargs):
+    def __prepare__(name, bases, **kwargs):
+        if not bases:
+            # `SumType` itself is an ordinary class
+            return {}
         dict_ = SumTypeDict(name)
-        adt_props = dict_["__adt_props__"] = {}
+        dict_["__adt_props__"] = {}
         return dict_
 
-    def __instancecheck__(self, instance):
-        return (
-            isinstance(instance, _EmbellishedBase)
-            and instance._constructor_name.split(".")[0] == self.__name__
-        )
+    def __new__(mcs, name, bases, namespace, **kwargs):
+        namespace = dict(namespace)
+        namespace.setdefault("__slots__", ())
+        props = namespace.get("__adt_props__", {})
+        for key in props:
+            namespace.pop(key, None)
+        cls = super().__new__(mcs, name, bases, namespace, **kwargs)
+        for (key, prop) in props.items():
+            if prop.definition is None:
+                raise TypeError(f"Variant {prop.name} has no definition")
+            setattr(cls, key, make_constructor(prop.name, prop.definition, cls))
+        return cls
 
     def __getattr__(cls, attr: str) -> Any:
         ...
 
-    def __repr__(self):
-        return f"{self.__name__} {self.__adt_props__}"
+    def __repr__(cls):
+        if "_constructor_name" in vars(cls):
+            return cls._constructor_name
+        return f"{cls.__name__} {cls.__adt_props__}"
 
 
 class SumType(metaclass=SumTypeMeta):
+    __adt_props__: dict = {}
+
     def __iter__(self) -> Iterator[Any]:
         ...
 
     def __getitem__(self, index: int) -> Any:
-        ...
\ No newline at end of file
+        ...
@@ -0,0 +1,47 @@
+import os
+import shutil
+import subprocess
+import sys
+from typing import Callable
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the benchmarks' generators are reused at small sizes; the repository comes
+# first, since some benchmarks are named like the modules they measure
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+sys.path.insert(0, ROOT)
+
+
+def pytest_addoption(parser):
+    parser.addoption("--run-slow", action="store_true", help="also run the tests marked slow")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: takes minutes; only runs with --run-slow")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--run-slow"):
+        return
+    skip = pytest.mark.skip(reason="slow, use --run-slow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def node(tmp_path) -> Callable[[str], str]:
+    """Runs compiled JS after `lib.js` in node, and returns what it printed."""
+    if shutil.which("node") is None:
+        pytest.skip("node is not on the PATH")
+
+    def run(js: str) -> str:
+        script = tmp_path / "out.js"
+        with open(os.path.join(ROOT, "lib.js")) as file:
+            script.write_text(file.read() + "\n" + js)
+        result = subprocess.run(["node", str(script)], capture_output=True, text=True, timeout=60)
+        assert result.returncode == 0, result.stderr
+        return result.stdout
+
+    return run
@@ -0,0 +1,33 @@
+import zuv_batch
+
+
+def test_reverted_edit_rewrites_the_output(tmp_path):
+    source = tmp_path / "a.zuv"
+    output = tmp_path / "a.js"
+    cache = str(tmp_path / "cache")
+
+    def build():
+        [result] = zuv_batch.build([str(source)], cache_dir=cache, jobs=1)
+        assert result.error is None
+        return result
+
+    source.write_text("x = 2\n")
+    assert not build().hit
+    # the same size, so only the contents tell the outputs apart
+    source.write_text("x = 1\n")
+    build()
+    assert "Integer(1)" in output.read_text()
+    source.write_text("x = 2\n")
+    assert build().hit
+    assert "Integer(2)" in output.read_text()
+
+
+def test_unchanged_output_is_not_rewritten(tmp_path):
+    source = tmp_path / "a.zuv"
+    source.write_text("x = 2\n")
+    cache = str(tmp_path / "cache")
+    zuv_batch.build([str(source)], cache_dir=cache, jobs=1)
+    before = (tmp_path / "a.js").stat().st_mtime_ns
+    [result] = zuv_batch.build([str(source)], cache_dir=cache, jobs=1)
+    assert result.hit
+    assert (tmp_path / "a.js").stat().st_mtime_ns == before
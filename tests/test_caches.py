@@ -0,0 +1,41 @@
+import os
+
+import main as compiler
+
+
+def test_new_parser_tables_replace_the_tables_of_other_versions(monkeypatch, tmp_path):
+    monkeypatch.setattr(compiler, "CACHE_DIR", str(tmp_path))
+    stale = tmp_path / "zuv_parser.0123456789abcdef.lark"
+    stale.write_bytes(b"old tables")
+    other = tmp_path / "unrelated.lark"
+    other.write_bytes(b"")
+
+    compiler._build_parser()
+
+    assert not stale.exists()
+    assert other.exists()
+    assert sorted(os.listdir(tmp_path)) == sorted([f"zuv_parser.{compiler.parser_cache_key()}.lark", other.name])
+
+
+def test_current_parser_tables_are_kept(monkeypatch, tmp_path):
+    monkeypatch.setattr(compiler, "CACHE_DIR", str(tmp_path))
+    compiler._build_parser()
+    current = tmp_path / f"zuv_parser.{compiler.parser_cache_key()}.lark"
+    mtime = current.stat().st_mtime_ns
+
+    assert compiler._build_parser().parse("x = 1")
+    assert current.stat().st_mtime_ns == mtime
+
+
+def test_a_new_tree_cache_replaces_the_caches_of_other_versions(monkeypatch, tmp_path):
+    monkeypatch.setattr(compiler, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(compiler, "_ast_cache_dir", str(tmp_path / "zuv_asts.current"))
+    stale = tmp_path / "zuv_asts.0123456789abcdef"
+    stale.mkdir()
+    (stale / "0123.zast").write_bytes(b"old tree")
+
+    assert compiler.parse_cached("x = 1") == compiler.parse("x = 1")
+
+    assert not stale.exists()
+    assert len(os.listdir(tmp_path / "zuv_asts.current")) == 1
+    assert compiler.parse_cached("x = 1") == compiler.parse("x = 1")
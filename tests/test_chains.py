@@ -0,0 +1,27 @@
+import pytest
+
+import main as compiler
+
+SOURCE = """
+y = 3... @add 4 |>mul 2.
+console @debug y.
+3... @add 1 @mul 5.
+f = fn n: (n... @add 1 |>mul n.).
+console @debug (f: 4).
+"""
+
+# what a script loaded after the program sees
+GLOBALS = '\nprocess.stdout.write(typeof $s + " " + typeof $x + "\\n");\n'
+
+
+@pytest.mark.parametrize("minify", [False, True])
+def test_lowered_chains_print_the_same(node, minify):
+    lowered = compiler.compile_source(SOURCE, compiler.CompileFlags(minify=minify))
+    closures = compiler.compile_source(SOURCE, compiler.CompileFlags(lower_chains=False, minify=minify))
+    assert "$x" in lowered
+    assert node(lowered) == node(closures)
+
+
+def test_top_level_chains_leave_no_globals(node):
+    js = compiler.compile_source(SOURCE)
+    assert node(js + GLOBALS).splitlines()[-1] == "undefined undefined"
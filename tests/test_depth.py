@@ -0,0 +1,27 @@
+import pytest
+
+from depth import SHAPES, measure
+
+# past the default recursion limit of 1000, and the depths machine-generated
+# programs reach
+DEPTH = 2000
+DEEP = 100_000
+
+
+@pytest.mark.parametrize("shape", list(SHAPES))
+def test_every_phase_handles_deep_nesting(shape):
+    _check(SHAPES[shape](DEPTH))
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("shape", list(SHAPES))
+def test_every_phase_handles_nesting_100k_deep(shape):
+    _check(SHAPES[shape](DEEP))
+
+
+def _check(program):
+    results = measure(program)
+    failed = {phase: result for (phase, result) in results.items() if not isinstance(result, float)}
+    assert not failed
+    assert set(results) == {"parse", "prepare", "to_js", "minified", "format", "serialize"}
+
@@ -0,0 +1,88 @@
+import pytest
+
+import main as compiler
+import zuv_incremental
+import zuv_optimize
+from zuv_ast import IntLiteral, MethodCall
+
+PROGRAMS = {
+    "arithmetic": """
+console @debug (7 @add 5) (7 @sub 12) (7 @mul -3) (-7 @div 2) (-7 @mod 3) (7 @mod -3) (3 @lt 4) (4 @ge 4).
+console @debug (eq: 3 3) (eq: 3 "3") (concat: "a" 1 "b").
+(True @if: (console @debug "taken").)
+(False @if: (console @debug "not taken").)
+""",
+    "safe integers": """
+console @debug (9007199254740991 @add 0) (9007199254740990 @add 1) (-9007199254740991 @sub 0).
+console @debug (9007199254740991 @add 1) (9007199254740993 @sub 9007199254740992) (-9007199254740993 @add 1).
+console @debug (eq: 9007199254740993 9007199254740992) (concat: 9007199254740993 "").
+""",
+    "branches that aren't thunks": """
+False @if (console @log "a").
+True @else (console @log "b").
+x = (True @? (fn: 1) (console @log "c"))
+console @debug x.
+""",
+    "True": """
+True = False
+console @debug (True @? (fn: 1) (fn: 2)) (3 @lt 4) (eq: 3 3).
+""",
+    "eq and concat": """
+eq = fn a b: "mine".
+concat = fn a b: "also mine".
+console @debug (eq: 1 1) (concat: "a" "b").
+""",
+    "Integer": """
+Integer = fn x: (concat: "int " (String: x)).
+console @debug (concat: 1 2) (eq: 1 2).
+""",
+}
+
+
+@pytest.mark.parametrize("name", list(PROGRAMS))
+def test_folded_program_prints_the_same(node, name):
+    source = PROGRAMS[name]
+    unfolded = compiler.compile_source(source, compiler.CompileFlags(fold_constants=False))
+    assert node(compiler.compile_source(source)) == node(unfolded)
+
+
+@pytest.mark.parametrize(
+    ("source", "folded"),
+    [
+        ("x = (9007199254740990 @add 1)", True),
+        ("x = (9007199254740991 @add 1)", False),
+        ("x = (9007199254740993 @sub 9007199254740992)", False),
+        ("x = (-9007199254740993 @add 1)", False),
+    ],
+)
+def test_operands_must_be_safe_integers(source, folded):
+    [statement] = zuv_optimize.fold_constants(compiler.parse(source)).statements
+    assert isinstance(statement.expression, IntLiteral if folded else MethodCall)
+
+
+SIDE_EFFECTS = [
+    'False @if (console @log "a").',
+    'True @else (console @log "b").',
+    'x = (True @? (fn: 1) (console @log "c"))',
+]
+
+
+@pytest.mark.parametrize("source", SIDE_EFFECTS)
+def test_branches_that_arent_thunks_are_kept(source):
+    [statement] = zuv_optimize.fold_constants(compiler.parse(source)).statements
+    assert statement == compiler.parse(source).statements[0]
+    assert "console.log" in compiler.compile_source(source)
+
+
+@pytest.mark.parametrize("source", SIDE_EFFECTS)
+def test_incremental_compile_keeps_branches_that_arent_thunks(source):
+    compilation = zuv_incremental.IncrementalCompilation(source)
+    assert "console.log" in compilation.to_js()
+    assert compilation.to_js() == compiler.compile_source(source)
+
+
+def test_branches_of_thunks_are_folded():
+    source = 'False @if: (console @log "a").\nx = (True @? (fn: 1) (fn: 2))'
+    [statement] = zuv_optimize.fold_constants(compiler.parse(source)).statements
+    assert "console.log" not in compiler.compile_source(source)
+    assert not isinstance(statement.expression, MethodCall)
@@ -0,0 +1,47 @@
+import os
+
+import lark
+import pytest
+
+import main as compiler
+import zuv_format
+from parsers import corpus
+
+# top-level statements that start like the target of an assignment
+TABLE_STATEMENTS = [
+    '({a, b ""}->b)\n',
+    '({a, b ""} @a: )\n',
+    'x = 1\n({a, b ""}->b @m 1)\n',
+    '([a, b] @each! x: x.)\n',
+]
+
+
+@pytest.mark.parametrize("source", TABLE_STATEMENTS)
+def test_top_level_statements_starting_with_a_table_round_trip(source):
+    formatted = zuv_format.format_source(source)
+    assert compiler.parse(formatted) == compiler.parse(source)
+    assert zuv_format.format_source(formatted) == formatted
+
+
+@pytest.mark.parametrize("name", ["program", "program_annotated"])
+def test_example_programs_round_trip(name):
+    with open(os.path.join(os.path.dirname(os.path.dirname(__file__)), name)) as file:
+        source = file.read()
+    formatted = zuv_format.format_source(source)
+    assert compiler.parse(formatted) == compiler.parse(source)
+    assert zuv_format.format_source(formatted) == formatted
+
+
+def _valid(sources):
+    for (name, source) in sources:
+        try:
+            compiler.parse(source)
+        except (lark.exceptions.LarkError, ValueError):
+            continue
+        yield (name, source)
+
+
+@pytest.mark.parametrize(("name", "source"), list(_valid(corpus(30, seed=0))))
+def test_corpus_round_trips(name, source):
+    formatted = zuv_format.format_source(source)
+    assert zuv_format.format_source(formatted) == formatted
@@ -0,0 +1,42 @@
+import pytest
+
+import main as compiler
+import zuv_ast
+import zuv_link
+
+PROGRAMS = {
+    "plain": """
+f = fn x: (concat: (String: 5) "!").
+console @debug (f: 0) (f: 1).
+""",
+    "Integer": """
+Integer = fn x: (concat: "int " x).
+f = fn x: 5.
+console @debug (f: 0).
+""",
+}
+
+HOISTED = compiler.CompileFlags(hoist_literals=True)
+
+
+@pytest.mark.parametrize("name", list(PROGRAMS))
+def test_hoisted_program_prints_the_same(node, name):
+    source = PROGRAMS[name]
+    assert node(compiler.compile_source(source, HOISTED)) == node(compiler.compile_source(source))
+
+
+def test_shadowed_constructors_are_not_hoisted():
+    ast = compiler.parse(PROGRAMS["Integer"])
+    assert ("Integer", 5) in zuv_ast.collect_constants(ast, set())
+    pool = zuv_ast.collect_constants(ast, {"Integer"})
+    assert ("Integer", 5) not in pool
+    assert ("String", "int ") in pool
+    # `lib.js` prints through `String`, so this one is only checked here
+    ast = compiler.parse('String = fn x: 7.\nf = fn x: "five".\n')
+    assert ("String", "five") not in zuv_ast.collect_constants(ast, {"String"})
+
+
+def test_compiled_literals_of_shadowed_constructors_stay_in_place():
+    assert "return (Integer(5))" in zuv_link.compile_unit(PROGRAMS["Integer"], HOISTED).js
+    js = compiler.compile_source('String = fn x: 7.\nf = fn x: "five".\n', HOISTED)
+    assert 'return (String("five"))' in js
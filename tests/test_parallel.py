@@ -0,0 +1,30 @@
+import io
+
+import pytest
+
+import main as compiler
+import zuv_parallel
+from memory import make_source
+
+
+class Sink(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+
+@pytest.mark.parametrize("minify", [False, True])
+def test_pieces_are_written_in_order(minify):
+    flags = compiler.CompileFlags(minify=minify)
+    source = make_source(3000)
+    cuts = zuv_parallel.split_source(source, 2 * zuv_parallel.PIECES_PER_JOB)
+    assert len(cuts) > 1
+    sink = Sink()
+    zuv_parallel.write_parallel(source, sink, flags, jobs=2)
+    assert sink.getvalue() == compiler.compile_source(source, flags)
+    # "{", the pieces, and "}", rather than the serial compiler's buffers
+    assert sink.writes == len(cuts) + 3
@@ -0,0 +1,24 @@
+import random
+
+import pytest
+
+import zuv_descent
+import zuv_format
+from depth import SHAPES
+from parsers import agree, corpus, mutate
+
+PROGRAMS = 30
+MUTANTS = 3
+
+
+@pytest.mark.parametrize(("label", "source"), corpus(PROGRAMS, seed=0))
+def test_parsers_agree(label, source):
+    rng = random.Random(label)
+    for text in [source] + [mutate(source, rng) for _ in range(MUTANTS)]:
+        assert agree(text) is None, text
+
+
+@pytest.mark.parametrize("shape", list(SHAPES))
+def test_descent_parser_handles_deep_nesting(shape):
+    tree = SHAPES[shape](2000)
+    assert zuv_descent.parse(zuv_format.format_ast(tree, indent_width=0)) == tree
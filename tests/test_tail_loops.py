@@ -0,0 +1,53 @@
+import pytest
+
+import main as compiler
+from tail_loops import WORKLOADS
+
+LOOPS = compiler.CompileFlags()
+RECURSION = compiler.CompileFlags(tail_loops=False)
+
+# a program that redefines what the inlined branches compare against
+SHADOWED = {
+    "True": """
+True = False
+count = fn n acc:
+    (n @gt 0) @? (fn: (count: (n @sub 1) (acc @add 1))) (fn: acc)..
+console @debug (count: N 0).
+""",
+    "False": """
+False = True
+count = fn n acc:
+    (n @eq 0) @? (fn: acc) (fn: (count: (n @sub 1) (acc @add 1)))..
+console @debug (count: N 0).
+""",
+}
+
+# what each workload prints after a million iterations
+MILLION = {
+    "count": "2000000\n",
+    "chain": "500000500000\n",
+    "closures": "1000000\n999999\n",
+    "replaced": '"replaced at 999999"\n"replaced at 1000000"\n',
+}
+
+
+def iterations(source: str, n: int) -> str:
+    return source.replace(" N", f" {n}")
+
+
+@pytest.mark.parametrize(("name", "source"), list(WORKLOADS.items()) + list(SHADOWED.items()))
+def test_loops_print_the_same_as_recursion(node, name, source):
+    source = iterations(source, 1000)
+    assert node(compiler.compile_source(source, LOOPS)) == node(compiler.compile_source(source, RECURSION))
+
+
+@pytest.mark.parametrize("name", list(SHADOWED))
+def test_branches_on_shadowed_globals_are_called(name):
+    js = compiler.compile_source(iterations(SHADOWED[name], 3), LOOPS)
+    assert "while (true)" not in js
+    assert f"=== {name})" not in js
+
+
+@pytest.mark.parametrize("name", list(MILLION))
+def test_loops_run_a_million_iterations(node, name):
+    assert node(compiler.compile_source(iterations(WORKLOADS[name], 1_000_000), LOOPS)) == MILLION[name]
@@ -0,0 +1,59 @@
+import pytest
+
+import main as compiler
+import zuv_incremental
+import zuv_types
+from unboxed import WORKLOADS
+
+BOXED = compiler.CompileFlags(unbox=False)
+
+# programs that redefine the globals unboxed code boxes its results with
+SHADOWED = {
+    "local True": """
+f = fn n:
+    True = "mine"
+    (n @lt 3).
+console @debug (f: 1) (f: 5).
+""",
+    "local False": """
+f = fn n s:
+    False = "mine"
+    [(n @ge 3), (eq: s "a")].
+console @debug (f: 1 "b").
+""",
+    "top-level True": """
+True = "mine"
+f = fn n: (n @lt 3).
+console @debug (f: 1) (f: 5).
+""",
+}
+
+
+@pytest.mark.parametrize(("name", "source"), list(WORKLOADS.items()) + list(SHADOWED.items()))
+def test_unboxed_program_prints_the_same(node, name, source):
+    source = source.replace(" N", " 100")
+    assert node(compiler.compile_source(source)) == node(compiler.compile_source(source, BOXED))
+
+
+@pytest.mark.parametrize("name", list(SHADOWED))
+def test_no_bool_results_when_true_or_false_is_redefined(name):
+    js = compiler.compile_source(SHADOWED[name])
+    assert "? True : False" not in js
+    # the same statements compiled one at a time
+    assert zuv_incremental.IncrementalCompilation(SHADOWED[name]).to_js() == js
+
+
+def test_integer_results_are_still_unboxed():
+    ast = compiler.prepare_program(compiler.parse(SHADOWED["local True"].replace("(n @lt 3)", "(n @add 1)")))
+    typings = []
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if getattr(node, "typing", None) is not None:
+            typings.append(node.typing[0])
+        stack.extend(node.children())
+    assert typings == ["Integer"]
+
+
+def test_unboxed_globals_cover_true_and_false():
+    assert {"True", "False"} <= zuv_types.UNBOXED_GLOBALS
@@ -1,65 +1,358 @@
-from dataclasses import dataclass
-from typing import Iterator, List, Literal, Optional, Set, Tuple, Union, Generic, TypeVar
+import re
+import string
+from dataclasses import dataclass, field, fields, replace
+from functools import partial
+from typing import AbstractSet, Callable, Dict, Iterable, Iterator, List, TextIO, Literal, Optional, Set, Tuple, Union
 from sum_type import SumType
 
 
-T = TypeVar("T")
+# (constructor, value) of a literal -> name of the hoisted constant
+ConstantPool = Dict[Tuple[str, object], str]
 
+# the globals that the hoisted constants are made with
+LITERAL_CONSTRUCTORS = frozenset({"Integer", "String"})
 
-class Box(Generic[T]):
-    def __init__(self, value: T):
-        self.boxed = value
+# How `zuv_types.infer` marks an operation that can run on unboxed values:
+# the type of its result and the types of its operands (the receiver first).
+# The types are "Integer" and "String", and "Bool" for results only.
+Typing = Tuple[str, Tuple[str, ...]]
+
+# the property of each box that holds the bigint or JS string
+UNBOXED_PROPERTIES = {"Integer": "__n", "String": "__s"}
+
+# the globals that box an unboxed result of each type
+BOXES = {"Integer": ("Integer",), "String": ("String",), "Bool": ("True", "False")}
+
+# the methods of `Integer`, as operators on bigints
+INTEGER_OPERATORS = {
+    "add": "+",
+    "sub": "-",
+    "mul": "*",
+    "div": "/",
+    "mod": "%",
+    "gt": ">",
+    "lt": "<",
+    "eq": "===",
+    "ge": ">=",
+    "le": "<=",
+}
 
 
 @dataclass
-class JsContext:
-    parent: Optional["JsContext"]
-    nonlocal_names: Set[str]
-    local_names: Set[str]
+class JsOptions:
+    """Code generation settings for one program."""
+    constants: Optional[ConstantPool] = None
+    lower_chains: bool = False
+    # run functions that call themselves in tail position as loops
+    tail_loops: bool = False
+    # the runtime globals that the program redefines, which the generated
+    # code can't compare against
+    shadowed: AbstractSet[str] = frozenset()
+    # drop unneeded whitespace; short names are chosen by `zuv_scope.resolve`
+    minify: bool = False
+    # the JS name of the exports of each imported module, set by `zuv_link`
+    imports: Optional[Dict[str, str]] = None
+    # id() of the nodes whose JS is generated once -> that JS, or None until
+    # then (see `shared_nodes`)
+    memo: Optional[Dict[int, Optional[str]]] = None
+
+
+SymbolKind = Literal["local", "outer", "global"]
+
+
+@dataclass(frozen=True, eq=False, slots=True)
+class Symbol:
+    """
+    What a name refers to, as found by `zuv_scope.resolve`. All the uses of a
+    name that resolve the same way share one `Symbol`.
+    """
+    name: str
+    kind: SymbolKind
+    # the function body (or top-level block) that declares it; None for globals
+    block: Optional["AstElement"]
+    js_name: str
 
-    def can_local_name_be_used(self, name: str) -> bool:
-        return name not in self.nonlocal_names
 
-    def can_outer_name_be_used(self, name: str) -> bool:
-        return name not in self.local_names
+def _symbol_field():
+    # filled in by `zuv_scope.resolve`
+    return field(default=None, compare=False, repr=False)
 
 
-# the _as_source_iter method yields (indent_level?, string) parts
-AsSource = Iterator[Tuple[Optional[int], str]]
+def _symbols_field():
+    return field(default_factory=list, compare=False, repr=False)
 
-class AstElement:
-    def to_js(self, ctx: Box[JsContext]) -> str:
-        return self.as_source()
 
-    def _as_source_iter(self) -> AsSource:
-        raise NotImplementedError
+def _typing_field():
+    # filled in by `zuv_types.infer`
+    return field(default=None, compare=False, repr=False)
+
 
-    def _indented_source(self) -> Iterator[str]:
-        for (indent, part) in self._as_source_iter():
-            if indent is not None:
-                yield "\n"
-                for _ in range(indent):
-                    yield "    "
-            yield part
+# pieces of JS code, in order
+JsParts = Iterator[str]
+# What `_js_iter` yields: pieces of JS code, the nodes whose JS goes in
+# between, and callbacks to run when the output gets there (see `js_parts`).
+JsPieces = Iterator[Union[str, "AstElement", Callable[[], None]]]
 
-    def as_source(self):
-        return "".join(self._indented_source())
+# how many characters `write_js` collects before writing them to the sink
+WRITE_CHUNK_SIZE = 1 << 16
+
+class AstElement:
+    # Nodes are slotted dataclasses: large programs have millions of them, and
+    # a per-instance `__dict__` would more than double their size. They are
+    # not frozen, since `zuv_scope.resolve` fills in their symbols in place.
+    #
+    # Everything that walks a tree does it with a stack of its own, never by
+    # recursion, so that trees can be as deep as memory allows. That is also
+    # why the dataclasses are declared with `eq=False`: the `==` below is
+    # iterative, the one dataclasses write would recurse.
+    __slots__ = ()
+
+    def __eq__(self, other: object) -> bool:
+        return trees_equal(self, other)
+
+    __hash__ = None  # type: ignore
+
+    def to_js(self, options: JsOptions) -> str:
+        return "".join(js_parts(self._js_iter(options), options))
+
+    def _js_iter(self, options: JsOptions) -> JsPieces:
+        yield self.as_source()
+
+    def write_js(self, options: JsOptions, sink: TextIO) -> None:
+        """
+        Stream the generated JS into `sink` (anything with a `write` method)
+        instead of building the whole program as one string.
+        """
+        write_js_parts(js_parts(self._js_iter(options), options), options, sink)
+
+    def children(self) -> Iterator["AstElement"]:
+        """Direct sub-elements, in source order."""
+        for name in structure_fields(type(self)):
+            value = getattr(self, name)
+            if isinstance(value, AstElement):
+                yield value
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, AstElement):
+                        yield item
+                    elif isinstance(item, TableEntry.KeyValue):
+                        yield item[1]
+
+    def map_children(self, fn: Callable[["AstElement"], "AstElement"]) -> "AstElement":
+        """
+        A copy of this element with `fn` applied to the direct sub-elements,
+        or the element itself if nothing changed.
+        """
+        changes = {}
+        for f in fields(self):  # type: ignore
+            value = getattr(self, f.name)
+            if isinstance(value, AstElement):
+                new_value = fn(value)
+                if new_value is not value:
+                    changes[f.name] = new_value
+            elif isinstance(value, list):
+                new_items = [_map_item(item, fn) for item in value]
+                if any(new is not old for (new, old) in zip(new_items, value)):
+                    changes[f.name] = new_items
+        return replace(self, **changes) if changes else self  # type: ignore
+
+    def as_source(self) -> str:
+        """A debugging view of the tree; `zuv_format.format_ast` writes real zuv."""
+        import zuv_format
+        return zuv_format.legacy_source(self)
+
+
+def js_parts(pieces: JsPieces, options: JsOptions) -> JsParts:
+    """
+    The JS code for what a `_js_iter` yields. Nodes are expanded with a
+    stack of iterators instead of recursion, so each piece of code is passed
+    on once, however deep the node that made it.
+    """
+    if options.memo is not None:
+        return _memoized_js_parts(pieces, options, options.memo)
+    return _js_parts(pieces, options)
+
+
+def _js_parts(pieces: JsPieces, options: JsOptions) -> JsParts:
+    stack = [pieces]
+    while stack:
+        for piece in stack[-1]:
+            if type(piece) is str:
+                yield piece
+            elif isinstance(piece, AstElement):
+                stack.append(piece._js_iter(options))
+                break
+            else:
+                piece()  # type: ignore
+        else:
+            stack.pop()
+
+
+def _memoized_js_parts(pieces: JsPieces, options: JsOptions, memo: Dict[int, Optional[str]]) -> JsParts:
+    # `js_parts`, but the JS of the nodes in `memo` is kept the first time
+    # and passed on as one piece after that
+    stack = [pieces]
+    # the memoized nodes being expanded: the stack size that their iterator
+    # makes, and where their parts start in `captured`
+    capturing: List[Tuple[int, int, int]] = []
+    captured: List[str] = []
+    while stack:
+        for piece in stack[-1]:
+            if type(piece) is str:
+                if capturing:
+                    captured.append(piece)
+                yield piece
+            elif isinstance(piece, AstElement):
+                if id(piece) in memo:
+                    js = memo[id(piece)]
+                    if js is not None:
+                        if capturing:
+                            captured.append(js)
+                        yield js
+                        continue
+                    capturing.append((len(stack) + 1, id(piece), len(captured)))
+                stack.append(piece._js_iter(options))
+                break
+            else:
+                piece()  # type: ignore
+        else:
+            stack.pop()
+            while capturing and capturing[-1][0] > len(stack):
+                (_, key, start) = capturing.pop()
+                js = memo[key] = "".join(captured[start:])
+                # an enclosing node takes it as one part
+                captured[start:] = [js] if capturing else []
+
+
+def shared_nodes(root: "AstElement") -> Dict[int, Optional[str]]:
+    """
+    The nodes that occur more than once in `root`, which only
+    `zuv_optimize.intern_subtrees` makes, as an empty `JsOptions.memo`.
+    """
+    seen: Set[int] = set()
+    shared: Dict[int, Optional[str]] = {}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            shared[id(node)] = None
+            continue
+        seen.add(id(node))
+        stack.extend(node.children())
+    return shared
+
+
+# the fields that `==` compares, by class
+_compared_fields: Dict[type, Tuple[str, ...]] = {}
+
+
+def structure_fields(cls: type) -> Tuple[str, ...]:
+    """The fields of a node class that `==` compares: not the annotations of later passes."""
+    names = _compared_fields.get(cls)
+    if names is None:
+        names = _compared_fields[cls] = tuple(f.name for f in fields(cls) if f.compare)  # type: ignore
+    return names
+
+
+def trees_equal(a: object, b: object) -> bool:
+    """`a == b` for trees, without recursing."""
+    stack = [(a, b)]
+    while stack:
+        (a, b) = stack.pop()
+        if a is b:
+            continue
+        if type(a) is not type(b):
+            return False
+        if isinstance(a, AstElement):
+            stack.extend((getattr(a, name), getattr(b, name)) for name in structure_fields(type(a)))
+        elif isinstance(a, (list, tuple)):
+            # lists of nodes, and table entries
+            if len(a) != len(b):  # type: ignore
+                return False
+            stack.extend(zip(a, b))  # type: ignore
+        elif a != b:
+            return False
+    return True
+
+
+def map_tree(root: AstElement, fn: Callable[[AstElement], AstElement]) -> AstElement:
+    """
+    Rebuild the tree from the leaves up: each node gets what `fn` returned
+    for its children (see `map_children`), then goes through `fn` itself.
+    """
+    order = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        stack.extend(node.children())
+    results: Dict[int, AstElement] = {}
+
+    def mapped(child: AstElement) -> AstElement:
+        return results[id(child)]
+
+    # children come after their parents in `order`
+    for node in reversed(order):
+        results[id(node)] = fn(node.map_children(mapped))
+    return results[id(root)]
+
+
+def write_js_parts(parts: JsParts, options: JsOptions, sink: TextIO) -> None:
+    chunk: List[str] = []
+    size = 0
+    if options.minify:
+        parts = minify_js(parts)
+    for part in parts:
+        chunk.append(part)
+        size += len(part)
+        if size >= WRITE_CHUNK_SIZE:
+            sink.write("".join(chunk))
+            chunk.clear()
+            size = 0
+    sink.write("".join(chunk))
 
 
 class Expression(AstElement):
-    pass
+    __slots__ = ()
 
 
 class Statement(AstElement):
-    pass
+    __slots__ = ()
 
 
 class AssignmentTarget(AstElement):
-    pass
+    __slots__ = ()
 
 
 class FunctionParameter(AstElement):
-    pass
+    __slots__ = ()
+
+
+def _js_join(elements: List["AstElement"], options: JsOptions, separator: str = ", ") -> JsPieces:
+    for (i, e) in enumerate(elements):
+        if i:
+            yield separator
+        yield e
+
+
+def _same(node: "AstElement") -> "AstElement":
+    return node
+
+
+def _map_item(item, fn):
+    if isinstance(item, AstElement):
+        return fn(item)
+    elif isinstance(item, TableEntry.KeyValue):
+        [k, v] = item
+        new_v = fn(v)
+        return item if new_v is v else TableEntry.KeyValue(k, new_v)
+    else:
+        return item
+
+
+def _property_js(key: str, symbol: Symbol) -> str:
+    # `{name}` in a table or a destructuring pattern is also a property key
+    return key if symbol.js_name == key else f"{key}: {symbol.js_name}"
 
 
 def var_prefix_for(stmt):
@@ -71,113 +364,382 @@ def var_prefix_for(stmt):
         return ""
 
 
-@dataclass
-class BlockExpression(Expression):
-    statements: List[Statement]
-    implicit_return: bool = True
-
-    def to_js(self, ctx: Box[JsContext]):
-        ctx.boxed = JsContext(ctx.boxed, set(), set())
-        result = "{ "
-        if self.implicit_return:
-            for stmt in self.statements[:-1]:
-                result += var_prefix_for(stmt)
-                result += stmt.to_js(ctx) + "; "
-            for stmt in self.statements[-1:]:
-                if isinstance(stmt, Assignment):
-                    result += var_prefix_for(stmt) + stmt.to_js(ctx) + ";"
-                else:
-                    result += "return (" + var_prefix_for(stmt) + stmt.to_js(ctx) + "); "
+def _declaration(stmt: "Statement", declare: bool) -> Tuple[str, str]:
+    # what goes around an assignment whose names are declared already: only
+    # a destructuring `{...} = ` needs parentheses to not be a block
+    if declare:
+        return (var_prefix_for(stmt), "")
+    if isinstance(stmt, Assignment) and isinstance(stmt.target, LvalueTable):
+        return ("(", ")")
+    return ("", "")
+
+
+def statement_js_iter(stmt: "Statement", options: JsOptions, returned: bool, declare: bool = True) -> JsPieces:
+    """
+    JS for one statement of a block; `returned` if it's the block's value.
+    Without `declare`, the names it assigns are declared by the caller.
+    """
+    chain = None
+    if options.lower_chains:
+        chain = _lowerable_chain(stmt)
+    (before, after) = _declaration(stmt, declare)
+    if chain is not None:
+        yield from _lowered_statement(stmt, chain, options, returned, declare)
+    elif returned and isinstance(stmt, Assignment):
+        yield before
+        yield stmt
+        yield after + ";"
+    elif returned:
+        yield "return ("
+        yield before
+        yield stmt
+        yield "); "
+    else:
+        yield before
+        yield stmt
+        yield after + "; "
+
+
+# A chain that is a whole statement, or the value assigned by one, is run
+# as a sequence of statements in a block instead of in an immediately
+# invoked closure:
+#
+#     { let $s, $x; $s = <subject>; $x = $s.a(...); $x = $x.b(...); ...; var y = $x; }
+#
+# zuv names can't contain `$`. Two names are enough: a chain used as the
+# subject of another chain is finished before the outer one starts, and
+# closures in the arguments get their own. They are block-scoped so that
+# chains at the top level don't leave globals behind.
+def _lowerable_chain(stmt: "Statement") -> Optional["ChainedMethodCall"]:
+    if isinstance(stmt, ChainedMethodCall):
+        return stmt
+    if isinstance(stmt, Assignment) and isinstance(stmt.expression, ChainedMethodCall):
+        return stmt.expression
+    return None
+
+
+def _lowered_statement(
+    stmt: "Statement", chain: "ChainedMethodCall", options: JsOptions, returned: bool, declare: bool = True
+) -> JsPieces:
+    target = None
+    if isinstance(stmt, Assignment):
+        # the target is generated first, like in the unlowered form
+        target = "".join(js_parts(stmt.target._js_iter(options), options))
+    yield "{ let $s, $x; "
+    yield from _chain_steps(chain, options, declare=False)
+    if target is not None:
+        (before, after) = _declaration(stmt, declare)
+        yield before + target + " = $x " + after + (";" if returned else "; ")
+    elif returned:
+        yield "return ($x); "
+    yield "} "
+
+
+def _chain_steps(chain: "ChainedMethodCall", options: JsOptions, declare: bool = True) -> JsPieces:
+    # without `declare`, `$s` and `$x` are declared by the caller
+    var = "var " if declare else ""
+    # this chain and the chains that are its subject, the innermost runs first
+    chains = [chain]
+    while isinstance(chains[-1].subject, ChainedMethodCall):
+        chains.append(chains[-1].subject)
+    for (depth, link) in enumerate(reversed(chains)):
+        if depth == 0:
+            yield var + "$s = "
+            yield link.subject
+            yield "; "
+        else:
+            yield var + "$s = $x; "
+        for (i, call) in enumerate(link.calls):
+            # before the first call, `$x` is the same as `$s`
+            receiver = "$s" if call.kind == "@" or i == 0 else "$x"
+            yield (var + "$x = " if i == 0 else "$x = ") + receiver + "."
+            yield call.method_name.replace("?", "__QMARK") + "("
+            yield from _js_join(call.arguments, options)
+            yield "); "
+
+
+# A function bound with `f = fn ...` that calls `f` in tail position runs
+# as a loop instead of recursing (`JsOptions.tail_loops`):
+#
+#     var f = function $f($p0, $p1) { while (true) { let n = $p0, acc = $p1, x; ...
+#         var $g = f; $p0 = <argument>; $p1 = <argument>;
+#         if ($g === $f) continue; return $g($p0, $p1); } }
+#
+# The tail positions are the last statement of the body, and the bodies of
+# the closures that it calls right away: `(fn: ...)!`, and the branches of
+# `@if`, `@else` and `@?` (also as the last call of a chain), which are run
+# inline when the condition is `True` or `False`, unless the program
+# redefines either. Any other receiver still gets the closures. The call
+# goes through `f` as before, and only loops if `f` is still this function.
+# Each iteration has `let` bindings of its own, so closures made in the body
+# see the same values as with recursion.
+
+# the runtime globals for which each method runs its closures right away,
+# in the order of its arguments
+BRANCH_METHODS = {"if": ("True",), "else": ("False",), "?": ("True", "False")}
+BRANCH_GLOBALS = frozenset({"True", "False"})
+
+
+def _branches(call: Union["MethodCall", "SingleChainedCall"]) -> Optional[List[Tuple[str, "FunctionDefinition"]]]:
+    values = BRANCH_METHODS.get(call.method_name)
+    if values is None or len(call.arguments) != len(values):
+        return None
+    if not all(is_thunk(argument) for argument in call.arguments):
+        return None
+    return list(zip(values, call.arguments))  # type: ignore
+
+
+def _last_call(node: AstElement) -> Optional[Union["MethodCall", "SingleChainedCall"]]:
+    if isinstance(node, MethodCall):
+        return node
+    if isinstance(node, ChainedMethodCall):
+        return node.calls[-1]
+    return None
+
+
+def _tail_expressions(body: "BlockExpression", inline_branches: bool) -> Iterator[AstElement]:
+    """The expressions whose value `body` returns, as far as loops can see."""
+    stack: List[AstElement] = [body]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, BlockExpression):
+            if node.implicit_return and node.statements and not isinstance(node.statements[-1], Assignment):
+                stack.append(node.statements[-1])
+            continue
+        call = _last_call(node)
+        branches = _branches(call) if call is not None and inline_branches else None
+        if branches is not None:
+            stack.extend(thunk.body for (_, thunk) in branches)
+        elif isinstance(node, FunctionCall) and not node.arguments and is_thunk(node.function):
+            stack.append(node.function.body)  # type: ignore
         else:
-            for stmt in self.statements:
-                result += var_prefix_for(stmt)
-                result += stmt.to_js(ctx) + "; "
-        result += "}"
-        ctx.boxed = ctx.boxed.parent  # type: ignore
-        return result
-
-    def _as_source_iter(self) -> AsSource:
-        if len(self.statements) == 0:
-            yield (None, " ")
-        elif len(self.statements) == 1:
-            yield from self.statements[0]._as_source_iter()
+            yield node
+
+
+@dataclass(frozen=True)
+class _Loop:
+    # what the function is bound to, and the variables that carry its
+    # arguments from one iteration to the next
+    symbol: Symbol
+    carriers: List[str]
+    # whether branches on `True` and `False` can run inline
+    inline_branches: bool
+
+    def is_call(self, node: AstElement) -> bool:
+        if not isinstance(node, FunctionCall) or len(node.arguments) != len(self.carriers):
+            return False
+        # the name resolves as an outer name in the body, to the same scope
+        symbol = node.function.symbol if isinstance(node.function, Name) else None
+        return symbol is not None and symbol.name == self.symbol.name and symbol.block is self.symbol.block
+
+    def is_in(self, body: "BlockExpression") -> bool:
+        return any(self.is_call(node) for node in _tail_expressions(body, self.inline_branches))
+
+
+@dataclass(slots=True, eq=False)
+class _InlineBody(AstElement):
+    """The body of a closure that a loop runs inline; not part of any tree."""
+    block: "BlockExpression"
+    loop: _Loop
+
+    def _js_iter(self, options: JsOptions) -> JsPieces:
+        return _loop_block(self.block, self.loop, options)
+
+
+def _loop_for(assignment: "Assignment", options: JsOptions) -> Optional[_Loop]:
+    (target, function) = (assignment.target, assignment.expression)
+    if not isinstance(target, LvalueName) or not isinstance(function, FunctionDefinition):
+        return None
+    if target.symbol is None or not isinstance(function.body, BlockExpression):
+        return None
+    carriers = [f"$p{i}" for i in range(len(function.parameters))]
+    loop = _Loop(target.symbol, carriers, not (options.shadowed & BRANCH_GLOBALS))
+    return loop if loop.is_in(function.body) else None
+
+
+def _declared_names(block: "BlockExpression") -> Dict[str, None]:
+    """The JS names that the statements of `block` declare with `var`."""
+    names: Dict[str, None] = {}
+    for stmt in block.statements:
+        if not isinstance(stmt, Assignment) or isinstance(stmt.target, LvalueNameNonlocal):
+            continue
+        stack: List[AstElement] = [stmt.target]
+        while stack:
+            target = stack.pop()
+            if isinstance(target, LvalueName):
+                names[target.symbol.js_name] = None  # type: ignore
+            elif isinstance(target, LvalueTable):
+                names.update(dict.fromkeys(symbol.js_name for symbol in target.symbols))
+            elif isinstance(target, LvalueArray):
+                stack.extend(reversed(target.targets))
+    return names
+
+
+def _loop_function(function: "FunctionDefinition", loop: _Loop, options: JsOptions) -> JsPieces:
+    bindings = []
+    bound: Set[str] = set()
+    for (parameter, carrier) in zip(function.parameters, loop.carriers):
+        bindings.append("".join(js_parts(parameter._js_iter(options), options)) + " = " + carrier)
+        if isinstance(parameter, NamedParameter):
+            bound.add(parameter.symbol.js_name)  # type: ignore
         else:
-            for stmt in self.statements:
-                yield (0, "")
-                for (indent, part) in stmt._as_source_iter():
-                    if indent is None:
-                        yield (None, part)
-                    else:
-                        yield (indent + 1, part)
+            bound.update(symbol.js_name for symbol in parameter.symbols)  # type: ignore
+    body: BlockExpression = function.body  # type: ignore
+    bindings += [name for name in _declared_names(body) if name not in bound]
+    yield "function $f(" + ", ".join(loop.carriers) + ") { while (true) { "
+    if bindings:
+        yield "let " + ", ".join(bindings) + "; "
+    yield from _loop_statements(body, loop, options)
+    yield "} }"
+
+
+def _loop_block(block: "BlockExpression", loop: _Loop, options: JsOptions) -> JsPieces:
+    # the body of a closure, run inline
+    yield "{ "
+    names = _declared_names(block)
+    if names:
+        yield "let " + ", ".join(names) + "; "
+    yield from _loop_statements(block, loop, options)
+    yield "} "
+
+
+def _loop_statements(block: "BlockExpression", loop: _Loop, options: JsOptions) -> JsPieces:
+    # every way out of the loop body ends in `return` or `continue`
+    statements = block.statements
+    for stmt in statements[:-1]:
+        yield from statement_js_iter(stmt, options, False, declare=False)
+    if statements and block.implicit_return and not isinstance(statements[-1], Assignment):
+        yield from _loop_tail(statements[-1], loop, options)
+        return
+    if statements:
+        yield from statement_js_iter(statements[-1], options, False, declare=False)
+    yield "return; "
+
+
+def _loop_tail(node: AstElement, loop: _Loop, options: JsOptions) -> JsPieces:
+    if loop.is_call(node):
+        call: FunctionCall = node  # type: ignore
+        yield "var $g = "
+        yield call.function
+        yield "; "
+        for (carrier, argument) in zip(loop.carriers, call.arguments):
+            yield carrier + " = "
+            yield argument
+            yield "; "
+        yield "if ($g === $f) continue; return $g(" + ", ".join(loop.carriers) + "); "
+        return
+    call = _last_call(node)  # type: ignore
+    branches = _branches(call) if call is not None and loop.inline_branches else None
+    if branches is not None and any(loop.is_in(thunk.body) for (_, thunk) in branches):  # type: ignore
+        if isinstance(node, ChainedMethodCall):
+            # the calls before the last one, like a lowered chain
+            yield from _chain_steps(ChainedMethodCall(node.subject, node.calls[:-1]), options)
+            receiver = "$s" if call.kind == "@" or len(node.calls) == 1 else "$x"  # type: ignore
+        else:
+            yield "var $c = "
+            yield node.expression  # type: ignore
+            yield "; "
+            receiver = "$c"
+        for (value, thunk) in branches:
+            yield f"if ({receiver} === {value}) "
+            yield _InlineBody(thunk.body, loop)  # type: ignore
+        yield f"return {receiver}." + call.method_name.replace("?", "__QMARK") + "("  # type: ignore
+        yield from _js_join(call.arguments, options)  # type: ignore
+        yield "); "
+    elif isinstance(node, FunctionCall) and not node.arguments and is_thunk(node.function) and loop.is_in(node.function.body):  # type: ignore
+        yield _InlineBody(node.function.body, loop)  # type: ignore
+    else:
+        yield from statement_js_iter(node, options, True, declare=False)  # type: ignore
 
 
-@dataclass
+@dataclass(slots=True, eq=False)
+class BlockExpression(Expression):
+    statements: List[Statement]
+    implicit_return: bool = True
+
+    def _js_iter(self, options: JsOptions) -> JsPieces:
+        return self.hooked_js_iter(options, None)
+
+    def hooked_js_iter(self, options: JsOptions, hooks) -> JsPieces:
+        """`_js_iter`, calling the statement hooks of `main.CompileHooks`."""
+        yield "{ "
+        last = len(self.statements) - 1
+        for (i, stmt) in enumerate(self.statements):
+            if hooks is not None:
+                yield partial(hooks.before_statement, i, stmt)
+            yield from statement_js_iter(stmt, options, self.implicit_return and i == last)
+            if hooks is not None:
+                yield partial(hooks.after_statement, i, stmt)
+        yield "}"
+
+
+def module_js_iter(block: BlockExpression, options: JsOptions, exports: List[Symbol]) -> JsPieces:
+    """
+    A program compiled as a module: a function that takes the exports of the
+    modules it imports, in the order of `options.imports`, runs the program
+    and returns the values of `exports`.
+    """
+    yield "((" + ", ".join((options.imports or {}).values()) + ") => { "
+    if options.constants:
+        yield constants_declaration(options.constants)
+    for stmt in block.statements:
+        yield from statement_js_iter(stmt, options, False)
+    yield "return {" + ", ".join(_property_js(symbol.name, symbol) for symbol in exports) + "}; })"
+
+
+@dataclass(slots=True, eq=False)
 class ExpressionStatement(Statement):
     expression: Expression
 
-    def to_js(self, ctx):
-        return self.expression.to_js(ctx) + "; "
-
-    def _as_source_iter(self) -> AsSource:
-        yield from self.expression._as_source_iter()
+    def _js_iter(self, options) -> JsPieces:
+        yield self.expression
+        yield "; "
 
 
-@dataclass
+@dataclass(slots=True, eq=False)
 class Name(AstElement):
     value: str
+    symbol: Optional[Symbol] = _symbol_field()
 
-    def to_js(self, ctx):
-        return self.value.replace("?", "__QMARK")
-
-    def _as_source_iter(self) -> AsSource:
-        yield (None, self.value)
+    def _js_iter(self, options) -> JsPieces:
+        yield self.symbol.js_name  # type: ignore
 
 
-@dataclass
+@dataclass(slots=True, eq=False)
 class IntLiteral(AstElement):
     value: int
 
-    def to_js(self, ctx):
-        return f"Integer({self.value})"
-
-    def _as_source_iter(self) -> AsSource:
-        yield (None, str(self.value))
+    def _js_iter(self, options) -> JsPieces:
+        constants = options.constants
+        if constants is not None and ("Integer", self.value) in constants:
+            yield constants["Integer", self.value]
+        else:
+            yield f"Integer({self.value})"
 
 
-@dataclass
+@dataclass(slots=True, eq=False)
 class StrLiteral(AstElement):
     value: str
 
-    def to_js(self, ctx):
-        return f"String({self._encode()})"
+    def _js_iter(self, options) -> JsPieces:
+        constants = options.constants
+        if constants is not None and ("String", self.value) in constants:
+            yield constants["String", self.value]
+        else:
+            yield f"String({self._encode()})"
 
     def _encode(self):
         return '"' + "".join("\\" + c if c in {"\\" , '"'} else c for c in self.value) + '"'
 
-    def _as_source_iter(self) -> AsSource:
-        yield (None, self._encode())
-
 
-@dataclass
+@dataclass(slots=True, eq=False)
 class ArrayLiteral(AstElement):
     elements: List[AstElement]
 
-    def to_js(self, ctx):
-        return "Array([" + ", ".join(e.to_js(ctx) for e in self.elements) + "])"
-
-    def _as_source_iter(self) -> AsSource:
-        if self.elements == []:
-            yield (None, "[]")
-        else:
-            yield (None, "[")
-            for e in self.elements:
-                for (indent, part) in e._as_source_iter():
-                    if indent is None:
-                        yield (None, part)
-                    else:
-                        yield (indent + 1, part)
-                yield (None, ", ")
-            yield (None, "]")
+    def _js_iter(self, options) -> JsPieces:
+        yield "Array(["
+        yield from _js_join(self.elements, options)
+        yield "])"
 
 
 class TableEntry(SumType):
@@ -185,327 +747,437 @@ class TableEntry(SumType):
     KeyShorthand(str)      # type: ignore
     GetterShorthand(str)   # type: ignore
 
-def render_table_entry(e: TableEntry) -> AsSource:
-    if isinstance(e, TableEntry.KeyValue):
-        [k, v] = e
-        yield (None, k + " ")
-        it = iter(v._as_source_iter())
-        for (_indent, part) in it:
-            yield (None, part)
-            break
-        yield from it
-    elif isinstance(e, TableEntry.KeyShorthand):
-        [k] = e
-        yield (None, k)
-    elif isinstance(e, TableEntry.GetterShorthand):
-        [k] = e
-        yield (None, k + "()")
-    else:
-        assert False
+def table_entry_to_js(e: TableEntry, options: JsOptions, symbol: Optional[Symbol] = None) -> str:
+    return "".join(js_parts(table_entry_js_iter(e, options, symbol), options))
 
-def table_entry_to_js(e: TableEntry, ctx: Box[JsContext]) -> str:
+def table_entry_js_iter(e: TableEntry, options: JsOptions, symbol: Optional[Symbol] = None) -> JsPieces:
+    # `symbol` is what the name of a shorthand entry refers to
     if isinstance(e, TableEntry.KeyValue):
         [k, v] = e
-        return k + ": " + v.to_js(ctx)
+        yield k + ": "
+        yield v
     elif isinstance(e, TableEntry.KeyShorthand):
         [k] = e
-        return k
+        yield _property_js(k, symbol)  # type: ignore
     elif isinstance(e, TableEntry.GetterShorthand):
         [k] = e
-        return f"{k}: () => {k}"
+        yield f"{k}: () => {symbol.js_name}"  # type: ignore
     else:
         assert False
 
 
-@dataclass
+@dataclass(slots=True, eq=False)
 class TableLiteral(AstElement):
     entries: List[TableEntry]
+    # for the shorthand entries, what their names refer to
+    symbols: List[Optional[Symbol]] = _symbols_field()
 
-    def to_js(self, ctx):
-        return "({" + ", ".join(table_entry_to_js(e, ctx) for e in self.entries) + "})"
-
-    def _as_source_iter(self) -> AsSource:
-        if self.entries == []:
-            yield (None, "{}")
-        else:
-            yield (None, "{")
-            for e in self.entries:
-                for (indent, part) in render_table_entry(e):
-                    if indent is None:
-                        yield (None, part)
-                    else:
-                        yield (indent + 1, part)
-                yield (None, ", ")
-            yield (None, "}")
+    def _js_iter(self, options) -> JsPieces:
+        yield "({"
+        for (i, e) in enumerate(self.entries):
+            if i:
+                yield ", "
+            yield from table_entry_js_iter(e, options, self.symbols[i])
+        yield "})"
 
 
-@dataclass
+@dataclass(slots=True, eq=False)
 class LvalueName(AssignmentTarget):
     name: str
+    symbol: Optional[Symbol] = _symbol_field()
 
-    def to_js(self, ctx: Box[JsContext]):
-        if not ctx.boxed.can_local_name_be_used(self.name):
-            raise TypeError(f"Cannot use name {self.name} as local here.")
-        ctx.boxed.local_names.add(self.name)
-        return self.name.replace("?", "__QMARK")
+    def _js_iter(self, options: JsOptions) -> JsPieces:
+        yield self.symbol.js_name  # type: ignore
 
-    def _as_source_iter(self) -> AsSource:
-        yield (None, self.name)
 
-
-@dataclass
+@dataclass(slots=True, eq=False)
 class LvalueNameNonlocal(AssignmentTarget):
     name: str
+    symbol: Optional[Symbol] = _symbol_field()
 
-    def to_js(self, ctx: Box[JsContext]):
-        if not ctx.boxed.can_outer_name_be_used(self.name):
-            raise TypeError(f"Cannot use name {self.name} as outer here.")
-        ctx.boxed.nonlocal_names.add(self.name)
-        return self.name.replace("?", "__QMARK")
-
-    def _as_source_iter(self) -> AsSource:
-        yield (None, "outer ")
-        yield (None, self.name)
+    def _js_iter(self, options: JsOptions) -> JsPieces:
+        yield self.symbol.js_name  # type: ignore
 
 
 
-@dataclass
+@dataclass(slots=True, eq=False)
 class LvalueArray(AssignmentTarget):
     targets: List[AssignmentTarget]
 
-    def to_js(self, ctx):
-        for t in self.targets:
-            if isinstance(t, LvalueNameNonlocal):
-                raise TypeError("Cannot use nonlocal name in array destructuring.")
-        return "[" + ", ".join(t.to_js(ctx) for t in self.targets) + "]"
-
-    def _as_source_iter(self) -> AsSource:
-        yield (None, "[")
-        for t in self.targets:
-            yield from t._as_source_iter()
-            yield (None, ", ")
-        yield (None, "]")
+    def _js_iter(self, options) -> JsPieces:
+        yield "["
+        yield from _js_join(self.targets, options)
+        yield "]"
 
 
-@dataclass
+@dataclass(slots=True, eq=False)
 class LvalueTable(AssignmentTarget):
     names: List[str]
+    symbols: List[Symbol] = _symbols_field()
 
-    def to_js(self, ctx):
-        return "{" + ", ".join(self.names) + "}"
+    def _js_iter(self, options) -> JsPieces:
+        yield "{" + ", ".join(map(_property_js, self.names, self.symbols)) + "}"
 
-    def _as_source_iter(self) -> AsSource:
-        yield (None, "{" + ", ".join(self.names) + "}")
 
-
-@dataclass
+@dataclass(slots=True, eq=False)
 class Assignment(Statement):
     target: AssignmentTarget
     expression: Expression
 
-    def to_js(self, ctx):
-        return self.target.to_js(ctx) + " = " + self.expression.to_js(ctx) + " "
-
-    def _as_source_iter(self) -> AsSource:
-        yield from self.target._as_source_iter()
-        yield (None, " = ")
-        yield from self.expression._as_source_iter()
+    def _js_iter(self, options) -> JsPieces:
+        yield self.target
+        yield " = "
+        loop = _loop_for(self, options) if options.tail_loops else None
+        if loop is not None:
+            yield from _loop_function(self.expression, loop, options)  # type: ignore
+        else:
+            yield self.expression
+        yield " "
 
 
-@dataclass
+@dataclass(slots=True, eq=False)
 class NamedParameter(FunctionParameter):
     name: str
+    symbol: Optional[Symbol] = _symbol_field()
 
-    def to_js(self, ctx):
-        return self.name.replace("?", "__QMARK")
+    def _js_iter(self, options) -> JsPieces:
+        yield self.symbol.js_name  # type: ignore
 
-    def _as_source_iter(self) -> AsSource:
-        yield (None, self.name)
 
-
-@dataclass
+@dataclass(slots=True, eq=False)
 class ObjectParameter(FunctionParameter):
     names: List[str]
+    symbols: List[Symbol] = _symbols_field()
 
-    def to_js(self, ctx):
-        return "{" + ", ".join(name.replace("?", "__QMARK") for name in self.names) + "}"
-
-    def _as_source_iter(self) -> AsSource:
-        yield (None, "{")
-        for name in self.names:
-            yield (None, name)
-            yield (None, ",")
-        yield (None, "}")
+    def _js_iter(self, options) -> JsPieces:
+        yield "{" + ", ".join(
+            _property_js(name.replace("?", "__QMARK"), symbol)
+            for (name, symbol) in zip(self.names, self.symbols)
+        ) + "}"
 
 
-@dataclass
+@dataclass(slots=True, eq=False)
 class ArrayParameter(FunctionParameter):
     names: List[str]
+    symbols: List[Symbol] = _symbols_field()
 
-    def to_js(self, ctx):
-        return "[" + ", ".join(name.replace("?", "__QMARK") for name in self.names) + "]"
-
-    def _as_source_iter(self) -> AsSource:
-        yield (None, "[")
-        for name in self.names:
-            yield (None, name)
-            yield (None, ",")
-        yield (None, "]")
+    def _js_iter(self, options) -> JsPieces:
+        yield "[" + ", ".join(symbol.js_name for symbol in self.symbols) + "]"
 
 
-@dataclass
+@dataclass(slots=True, eq=False)
 class MemberAccess(Expression):
     expression: Expression
     member_name: str
 
-    def to_js(self, ctx):
-        return self.expression.to_js(ctx) + "." + self.member_name.replace("?", "__QMARK")
+    def _js_iter(self, options) -> JsPieces:
+        yield self.expression
+        yield "." + self.member_name.replace("?", "__QMARK")
 
-    def _as_source_iter(self) -> AsSource:
-        yield from self.expression._as_source_iter()
-        yield (None, "->")
-        yield (None, self.member_name)
 
+@dataclass(slots=True, eq=False)
+class ModuleReference(Expression):
+    """The exports of a module, which `import "path" {...}` assigns from."""
+    path: str
 
-@dataclass
+    def _js_iter(self, options) -> JsPieces:
+        if options.imports is None:
+            raise ValueError(f'"{self.path}" is imported: modules are put together by `main.py link`')
+        yield options.imports[self.path]
+
+
+@dataclass(slots=True, eq=False)
 class MethodCall(Expression):
     expression: Expression
     method_name: str
     arguments: List[Expression]
+    typing: Optional[Typing] = _typing_field()
 
-    def to_js(self, ctx):
-        return (
-            self.expression.to_js(ctx)
-            + "."
-            + self.method_name.replace("?", "__QMARK")
-            + "("
-            + ", ".join(arg.to_js(ctx) for arg in self.arguments)
-            + ")"
-        )
-
-    def _as_source_iter(self) -> AsSource:
-        yield (None, "(")
-        yield from self.expression._as_source_iter()
-        yield (None, " @")
-        yield (None, self.method_name)
-        for arg in self.arguments:
-            yield (None, " ")
-            yield from arg._as_source_iter()
-        yield (None, ")")
+    def _js_iter(self, options) -> JsPieces:
+        if self.typing is not None:
+            return _typed_js(self, self.typing)
+        return self._boxed_js_iter(options)
 
+    def _boxed_js_iter(self, options, operand=_same) -> JsPieces:
+        yield operand(self.expression)
+        yield "." + self.method_name.replace("?", "__QMARK") + "("
+        yield from _js_join([operand(a) for a in self.arguments], options)
+        yield ")"
 
-@dataclass
+
+@dataclass(slots=True, eq=False)
 class SingleChainedCall(AstElement):
     kind: Union[Literal["@"], Literal["|>"]]
     method_name: str
     arguments: List[Expression]
 
-    def to_js(self, ctx):
+    def _js_iter(self, options) -> JsPieces:
         if self.kind == "@":
-            return (
-                "__x = __s."
-                + self.method_name.replace("?", "__QMARK")
-                + "("
-                + ", ".join(arg.to_js(ctx) for arg in self.arguments)
-                + ");"
-            )
+            yield "__x = __s."
         elif self.kind == "|>":
-            return (
-                "__x = __x."
-                + self.method_name.replace("?", "__QMARK")
-                + "("
-                + ", ".join(arg.to_js(ctx) for arg in self.arguments)
-                + ");"
-            )
+            yield "__x = __x."
         else:
             assert False
+        yield self.method_name.replace("?", "__QMARK") + "("
+        yield from _js_join(self.arguments, options)
+        yield ");"
 
-    def _as_source_iter(self) -> AsSource:
-        yield (None, self.kind)
-        yield (None, self.method_name)
-        for arg in self.arguments:
-            yield (None, " ")
-            yield from arg._as_source_iter()
 
-
-@dataclass
+@dataclass(slots=True, eq=False)
 class ChainedMethodCall(Expression):
     subject: Expression
     calls: List[SingleChainedCall]
 
-    def to_js(self, ctx):
-        return (
-            "((__s) => { "
-            + "var __x = __s; "
-            + "; ".join(call.to_js(ctx) for call in self.calls)
-            + "; return __x })("
-            + self.subject.to_js(ctx)
-            + ")"
-        )
-
-    def _as_source_iter(self) -> AsSource:
-        yield (None, "(")
+    def _js_iter(self, options) -> JsPieces:
+        yield "((__s) => { var __x = __s; "
+        yield from _js_join(self.calls, options, "; ")
+        yield "; return __x })("
+        yield self.subject
+        yield ")"
 
-        yield from self.subject._as_source_iter()
-        yield (None, "...")
 
-        for call in self.calls:
-            yield (0, "")
-            for (indent, part) in call._as_source_iter():
-                if indent is None:
-                    yield (None, part)
-                else:
-                    yield (indent + 1, part)
-        yield (None, " .)")
-
-
-@dataclass
+@dataclass(slots=True, eq=False)
 class FunctionDefinition(Expression):
     parameters: List[FunctionParameter]
     body: Expression
 
-    def to_js(self, ctx):
-        return (
-            "("
-            + ", ".join(p.to_js(ctx) for p in self.parameters)
-            + ") => "
-            + self.body.to_js(ctx)
-        )
-
-    def _as_source_iter(self) -> AsSource:
-        yield (None, "(")
-        yield (None, "fn")
-        for param in self.parameters:
-            yield (None, " ")
-            yield from param._as_source_iter()
-        yield (None, ": ")
-        yield from self.body._as_source_iter()
-        yield (None, ")")
+    def _js_iter(self, options) -> JsPieces:
+        yield "("
+        yield from _js_join(self.parameters, options)
+        yield ") => "
+        yield self.body
 
 
-@dataclass
+@dataclass(slots=True, eq=False)
 class FunctionCall(Expression):
     function: Expression
     arguments: List[Expression]
-
-    def to_js(self, ctx):
-        return (
-            "("
-            + self.function.to_js(ctx)
-            + ")("
-            + ", ".join(arg.to_js(ctx) for arg in self.arguments)
-            + ")"
-        )
-
-    def _as_source_iter(self) -> AsSource:
-        if self.arguments == []:
-            yield from self.function._as_source_iter()
-            yield (None, "!")
-        else:
-            yield (None, "(")
-            yield from self.function._as_source_iter()
-            yield (None, ":")
-            for arg in self.arguments:
-                yield (None, " ")
-                yield from arg._as_source_iter()
-            yield (None, ")")
\ No newline at end of file
+    typing: Optional[Typing] = _typing_field()
+
+    def _js_iter(self, options) -> JsPieces:
+        if self.typing is not None:
+            return _typed_js(self, self.typing)
+        return self._boxed_js_iter(options)
+
+    def _boxed_js_iter(self, options, operand=_same) -> JsPieces:
+        yield "("
+        yield self.function
+        yield ")("
+        yield from _js_join([operand(a) for a in self.arguments], options)
+        yield ")"
+
+
+# Unboxed operations. Their JS reads the operands out of their boxes and
+# boxes the result once; nested operations stay unboxed in between. Reading
+# a variable unboxed needs its type to be right, so that is checked first:
+#
+#     (a?.__T === "Integer" ? Integer((a.__n + 1n)) : a.add(Integer(1)))
+
+Operation = Union[MethodCall, FunctionCall]
+
+
+def _operands(operation: Operation) -> List[Expression]:
+    if isinstance(operation, MethodCall):
+        return [operation.expression, *operation.arguments]
+    return operation.arguments
+
+
+def _typed_js(operation: Operation, typing: Typing) -> JsPieces:
+    checks: Dict[str, None] = {}
+    stack = [operation]
+    while stack:
+        node = stack.pop()
+        for (operand, t) in zip(_operands(node), node.typing[1]):  # type: ignore
+            if isinstance(operand, Name):
+                checks[f'{operand.symbol.js_name}?.__T === "{t}"'] = None  # type: ignore
+            elif isinstance(operand, (MethodCall, FunctionCall)):
+                stack.append(operand)
+    if checks:
+        yield "(" + " && ".join(checks) + " ? "
+    if typing[0] == "Bool":
+        yield "("
+        yield _Unboxed(operation)
+        yield " ? True : False)"
+    else:
+        yield typing[0] + "("
+        yield _Unboxed(operation)
+        yield ")"
+    if checks:
+        yield " : "
+        yield _Boxed(operation)
+        yield ")"
+
+
+def _boxed(node: AstElement) -> AstElement:
+    if isinstance(node, (MethodCall, FunctionCall)) and node.typing is not None:
+        return _Boxed(node)
+    return node
+
+
+@dataclass(slots=True, eq=False)
+class _Boxed(AstElement):
+    """The plain JS of an unboxed operation, for when a check fails; not part of any tree."""
+    operation: Operation
+
+    def _js_iter(self, options: JsOptions) -> JsPieces:
+        return self.operation._boxed_js_iter(options, _boxed)
+
+
+@dataclass(slots=True, eq=False)
+class _Unboxed(AstElement):
+    """The unboxed result of an operation; not part of any tree."""
+    operation: Operation
+
+    def _js_iter(self, options: JsOptions) -> JsPieces:
+        operation = self.operation
+        types = operation.typing[1]  # type: ignore
+        operands = [_unboxed(operand, t) for (operand, t) in zip(_operands(operation), types)]
+        if isinstance(operation, FunctionCall):
+            function = operation.function.value  # type: ignore
+            if function == "eq":
+                yield "("
+                yield operands[0]
+                yield " === "
+                yield operands[1]
+                yield ")"
+            else:
+                # `concat` and `String`: `+` joins strings once one side is one
+                if not types:
+                    yield '""'
+                    return
+                yield "(" if types[0] == "String" else '("" + '
+                yield from _js_join(operands, options, " + ")  # type: ignore
+                yield ")"
+            return
+        (n, m) = operands
+        yield "("
+        yield n
+        yield f" {INTEGER_OPERATORS[operation.method_name]} "
+        yield m
+        if operation.method_name == "mod":
+            # the sign of the result follows the divisor, as in `lib.js`
+            divisor = operation.arguments[0]
+            if not isinstance(divisor, IntLiteral):
+                yield " + ("
+                yield m
+                yield " < 0n ? "
+                yield m
+                yield " : 0n)"
+            elif divisor.value < 0:
+                yield " + "
+                yield m
+        yield ")"
+
+
+def _unboxed(operand: Expression, t: str) -> Union[str, AstElement]:
+    if isinstance(operand, Name):
+        return f"{operand.symbol.js_name}.{UNBOXED_PROPERTIES[t]}"  # type: ignore
+    elif isinstance(operand, IntLiteral):
+        return f"{operand.value}n" if operand.value >= 0 else f"({operand.value}n)"
+    elif isinstance(operand, StrLiteral):
+        return operand._encode()
+    return _Unboxed(operand)  # type: ignore
+
+
+def declared_names(root: AstElement) -> Set[str]:
+    """Every name that is assigned or bound as a parameter anywhere in `root`."""
+    result: Set[str] = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (LvalueName, LvalueNameNonlocal, NamedParameter)):
+            result.add(node.name)
+        elif isinstance(node, (LvalueTable, ObjectParameter, ArrayParameter)):
+            result.update(node.names)
+        stack.extend(node.children())
+    return result
+
+
+def is_thunk(node: AstElement) -> bool:
+    """A function without parameters: creating it has no effects."""
+    return isinstance(node, FunctionDefinition) and not node.parameters and isinstance(node.body, BlockExpression)
+
+
+def collect_constants(root: AstElement, shadowed: Set[str]) -> ConstantPool:
+    """
+    Choose the literals worth hoisting into module-level constants: the ones
+    that are evaluated inside a function (maybe many times), or written more
+    than once. The names start with `$`, which zuv identifiers can't contain.
+    The constants are made before the program runs, so literals of the
+    constructors in `shadowed` (that the program redefines) stay where they are.
+    """
+    counts: Dict[Tuple[str, object], int] = {}
+    in_function: Set[Tuple[str, object]] = set()
+    stack: List[Tuple[AstElement, bool]] = [(root, False)]
+    while stack:
+        (node, inside) = stack.pop()
+        key: Optional[Tuple[str, object]] = None
+        if isinstance(node, IntLiteral):
+            key = ("Integer", node.value)
+        elif isinstance(node, StrLiteral):
+            key = ("String", node.value)
+        if key is not None:
+            if key[0] not in shadowed:
+                counts[key] = counts.get(key, 0) + 1
+                if inside:
+                    in_function.add(key)
+            continue
+        inside = inside or isinstance(node, FunctionDefinition)
+        stack.extend((child, inside) for child in reversed(list(node.children())))
+
+    pool: ConstantPool = {}
+    for (key, count) in counts.items():
+        if count > 1 or key in in_function:
+            pool[key] = f"${len(pool)}"
+    return pool
+
+
+def constants_declaration(pool: ConstantPool) -> str:
+    if not pool:
+        return ""
+    definitions = []
+    for ((constructor, value), name) in pool.items():
+        literal = StrLiteral(value)._encode() if constructor == "String" else str(value)  # type: ignore
+        definitions.append(f"{name} = {constructor}({literal})")
+    return "var " + ", ".join(definitions) + ";\n"
+
+
+_JS_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|\s+|;|[^\s";]+', re.DOTALL)
+
+_IDENTIFIER_CHARS = frozenset(string.ascii_letters + string.digits + "_$")
+
+
+def minify_js(parts: Iterable[str]) -> JsParts:
+    """
+    Drop whitespace that doesn't separate two words, and semicolons that are
+    repeated or come right before a `}`. String literals must not be split
+    between parts.
+    """
+    last = ""
+    space = False
+    semicolon = False
+    for part in parts:
+        out = []
+        for token in _JS_TOKEN.findall(part):
+            first = token[0]
+            if first == ";":
+                semicolon = True
+                space = False
+                continue
+            if first.isspace():
+                space = True
+                continue
+            if semicolon:
+                if first != "}":
+                    out.append(";")
+                    last = ";"
+                semicolon = False
+            elif space and last in _IDENTIFIER_CHARS and first in _IDENTIFIER_CHARS:
+                out.append(" ")
+            space = False
+            out.append(token)
+            last = token[-1]
+        if out:
+            yield "".join(out)
+    if semicolon:
+        yield ";"
@@ -0,0 +1,241 @@
+"""
+Batch compilation: `python main.py batch [options] PATH...`
+
+Compiles many files at once, spreading the work over a process pool. Results
+are stored in a content-addressed cache, keyed by the source, the grammar and
+the compiler itself, so files that did not change are not compiled again.
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import main as compiler
+
+
+SOURCE_EXTENSION = ".zuv"
+
+# files whose contents decide what the compiler outputs
+COMPILER_SOURCES = [
+    "main.py",
+    "zuv_ast.py",
+    "zuv_optimize.py",
+    "zuv_scope.py",
+    "zuv_types.py",
+    "zuv_link.py",
+    "sum_type.py",
+    "zuv_descent.py",
+    "zuv_serialize.py",
+]
+
+
+_fingerprint: Optional[str] = None
+
+
+def compiler_fingerprint() -> str:
+    """Hash of the grammar, the transformer and the code generator."""
+    global _fingerprint
+    if _fingerprint is None:
+        h = hashlib.sha256(compiler.parser_cache_key().encode())
+        root = os.path.dirname(os.path.abspath(__file__))
+        for name in COMPILER_SOURCES:
+            with open(os.path.join(root, name), "rb") as file:
+                h.update(file.read())
+        _fingerprint = h.hexdigest()
+    return _fingerprint
+
+
+def source_key(source: bytes, flags: compiler.CompileFlags = compiler.CompileFlags()) -> str:
+    h = hashlib.sha256(compiler_fingerprint().encode())
+    h.update(repr(flags).encode())
+    h.update(source)
+    return h.hexdigest()
+
+
+def output_path_for(path: str, out_dir: Optional[str], root: Optional[str]) -> str:
+    base, ext = os.path.splitext(path)
+    if ext != SOURCE_EXTENSION:
+        base = path
+    if out_dir is None:
+        return base + ".js"
+    relative = os.path.relpath(base, root) if root is not None else os.path.basename(base)
+    return os.path.join(out_dir, relative + ".js")
+
+
+def collect_sources(paths: Iterable[str]) -> List[Tuple[str, Optional[str]]]:
+    """
+    Expand directories into the `.zuv` files inside them. Returns pairs of
+    (file, directory it was found in).
+    """
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            for (dirpath, dirnames, filenames) in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if filename.endswith(SOURCE_EXTENSION):
+                        result.append((os.path.join(dirpath, filename), path))
+        else:
+            result.append((path, None))
+    return result
+
+
+class OutputCache:
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".js")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self.path_for(key)
+        return path if os.path.exists(path) else None
+
+    def put(self, key: str, js: str) -> str:
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_atomically(path, js)
+        return path
+
+
+def write_atomically(path: str, text: str) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write(text)
+    os.replace(tmp_path, path)
+
+
+def _compile_job(job: Tuple[str, compiler.CompileFlags]) -> Tuple[Optional[str], Optional[str], float]:
+    (source, flags) = job
+    start = time.perf_counter()
+    try:
+        js = compiler.compile_source(source, flags, cache=True) + "\n"
+    except Exception as e:
+        return (None, f"{type(e).__name__}: {e}", time.perf_counter() - start)
+    return (js, None, time.perf_counter() - start)
+
+
+@dataclass
+class FileResult:
+    path: str
+    output: str
+    hit: bool
+    seconds: float
+    error: Optional[str] = None
+
+
+def _install(cached: str, output: str) -> None:
+    # Don't touch outputs that are already up to date. Only the bytes tell:
+    # reverting an edit makes an older cached output current again.
+    try:
+        if os.path.getsize(output) == os.path.getsize(cached):
+            with open(output, "rb") as out_file, open(cached, "rb") as cached_file:
+                if out_file.read() == cached_file.read():
+                    return
+    except OSError:
+        pass
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{output}.{os.getpid()}.tmp"
+    shutil.copyfile(cached, tmp_path)
+    os.replace(tmp_path, output)
+
+
+def build(
+    paths: Iterable[str],
+    *,
+    out_dir: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    jobs: Optional[int] = None,
+    flags: compiler.CompileFlags = compiler.CompileFlags(),
+) -> List[FileResult]:
+    cache = OutputCache(cache_dir or os.path.join(compiler.CACHE_DIR, "zuv_outputs"))
+    results: List[FileResult] = []
+    misses: Dict[str, List[Tuple[str, str]]] = {}
+    sources: Dict[str, str] = {}
+
+    for (path, root) in collect_sources(paths):
+        start = time.perf_counter()
+        output = output_path_for(path, out_dir, root)
+        with open(path, "rb") as file:
+            source = file.read()
+        key = source_key(source, flags)
+        cached = cache.get(key)
+        if cached is not None:
+            _install(cached, output)
+            results.append(FileResult(path, output, True, time.perf_counter() - start))
+        else:
+            # identical sources only need to be compiled once
+            misses.setdefault(key, []).append((path, output))
+            sources[key] = source.decode()
+
+    if not misses:
+        return results
+
+    keys = list(misses)
+    work = [(sources[key], flags) for key in keys]
+    if jobs == 1 or len(keys) == 1:
+        compiled = map(_compile_job, work)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(jobs)
+        compiled = executor.map(_compile_job, work, chunksize=4)
+    try:
+        for (key, (js, error, seconds)) in zip(keys, compiled):
+            for (path, output) in misses[key]:
+                if js is not None:
+                    _install(cache.put(key, js), output)
+                results.append(FileResult(path, output, False, seconds, error))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return results
+
+
+def main(argv: List[str]) -> int:
+    argparser = argparse.ArgumentParser(
+        prog="main.py batch",
+        description="Compile many zuv files, skipping the ones that did not change.",
+    )
+    argparser.add_argument("paths", nargs="+", help="files or directories with .zuv files")
+    argparser.add_argument("-o", "--out-dir", help="where to put the .js files (default: next to the sources)")
+    argparser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes")
+    argparser.add_argument("--cache-dir", default=None, help="where to keep compiled outputs")
+    argparser.add_argument("-q", "--quiet", action="store_true", help="only print the summary")
+    compiler.add_flag_arguments(argparser)
+    args = argparser.parse_args(argv)
+
+    start = time.perf_counter()
+    results = build(
+        args.paths,
+        out_dir=args.out_dir,
+        cache_dir=args.cache_dir,
+        jobs=args.jobs,
+        flags=compiler.flags_from_args(args),
+    )
+    elapsed = time.perf_counter() - start
+
+    failed = 0
+    for r in results:
+        if r.error is not None:
+            failed += 1
+            print(f"error {r.path}: {r.error}", file=sys.stderr)
+        elif not args.quiet:
+            status = "hit " if r.hit else "miss"
+            print(f"{status} {r.seconds * 1000:8.2f} ms  {r.path} -> {r.output}", file=sys.stderr)
+
+    hits = sum(r.hit for r in results)
+    print(
+        f"{len(results)} files, {hits} cache hits, {len(results) - hits} misses,"
+        f" {failed} errors in {elapsed:.3f} s",
+        file=sys.stderr,
+    )
+    return 1 if failed else 0
+
@@ -0,0 +1,442 @@
+"""
+Bundling: `python main.py bundle [options] PATH`
+
+Writes one self-contained script with the compiled program and only the
+part of the runtime (`lib.js`) that it can reach, instead of loading all of
+`lib.js` first.
+
+The runtime is split into units: its top-level statements, and the members
+of the object literals inside them (the methods of `Integer`, `Table`, ...).
+A unit is kept if the unit it's in is kept and:
+
+  - a top-level statement `G = ...` or `G.m = ...`: the global G is used
+    (and so is the property m),
+  - a member `m: ...`: some kept code uses a property called m,
+  - any other statement: it mentions a global that is kept.
+
+Properties are matched by name only, like the runtime itself dispatches
+methods, so `x @add y` keeps every `add`. The program uses the globals that
+`zuv_scope` couldn't resolve to a local, the constructors of its literals,
+and the method and member names it mentions.
+"""
+
+import argparse
+import io
+import os
+import re
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from zuv_ast import (
+    BOXES,
+    BRANCH_METHODS,
+    UNBOXED_PROPERTIES,
+    ArrayLiteral,
+    AstElement,
+    FunctionCall,
+    IntLiteral,
+    LvalueNameNonlocal,
+    LvalueTable,
+    MemberAccess,
+    MethodCall,
+    Name,
+    ObjectParameter,
+    SingleChainedCall,
+    StrLiteral,
+    TableLiteral,
+)
+
+import main as compiler
+
+
+RUNTIME_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lib.js")
+
+# a reason why something is kept: who uses it
+Reason = str
+
+PROGRAM = "the program"
+
+
+# Tokens of the runtime. Template literals are split into their text and the
+# expressions inside `${...}`, so that the names in those count too.
+_TOKEN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<word>[A-Za-z_$][A-Za-z0-9_$]*)
+  | (?P<number>[0-9][0-9a-zA-Z_.]*)
+  | (?P<punct>===|!==|==|!=|=>|\.\.\.|&&|\|\||>=|<=|\+=|-=|[^\s])
+""", re.VERBOSE | re.DOTALL)
+
+_TEMPLATE_TEXT = re.compile(r"(?:[^`\\$]|\\.|\$(?!\{))*", re.DOTALL)
+
+
+@dataclass
+class Token:
+    kind: str
+    text: str
+    start: int
+    end: int
+    # the first token on its line, in column 0
+    line_start: bool
+
+
+def tokenize(source: str) -> List[Token]:
+    tokens: List[Token] = []
+    # for each `${` that is open, how many braces are open inside it
+    templates: List[int] = []
+    pos = 0
+    while pos < len(source):
+        if source[pos] == "`" or (source[pos] == "}" and templates and templates[-1] == 0):
+            # template text, up to the end of the literal or the next `${`
+            if source[pos] == "}":
+                templates.pop()
+            text_end = _TEMPLATE_TEXT.match(source, pos + 1).end()  # type: ignore
+            if source.startswith("${", text_end):
+                templates.append(0)
+                tokens.append(Token("template", source[pos:text_end + 2], pos, text_end + 2, False))
+                pos = text_end + 2
+            else:
+                tokens.append(Token("template", source[pos:text_end + 1], pos, text_end + 1, False))
+                pos = text_end + 1
+            continue
+        match = _TOKEN.match(source, pos)
+        assert match is not None
+        kind = match.lastgroup
+        if kind not in ("space", "comment"):
+            text = match.group()
+            if templates and text in "{}":
+                templates[-1] += 1 if text == "{" else -1
+            line_start = pos == 0 or source[pos - 1] == "\n"
+            tokens.append(Token(kind, text, pos, match.end(), line_start))  # type: ignore
+        pos = match.end()
+    return tokens
+
+
+@dataclass
+class Unit:
+    """A top-level statement of the runtime, or a member of an object literal."""
+    name: str
+    # position in the list of units
+    index: int
+    start: int
+    end: int
+    parent: Optional["Unit"] = None
+    # for top-level statements: the global they define, and the property
+    # for `G.m = ...`
+    defines: Optional[str] = None
+    defines_property: Optional[str] = None
+    # for members: the property name
+    member: Optional[str] = None
+    names: Set[str] = field(default_factory=set)
+    properties: Set[str] = field(default_factory=set)
+
+
+_OPENING = {"(": ")", "[": "]", "{": "}"}
+_CLOSING = frozenset(_OPENING.values())
+
+
+def _statements(tokens: List[Token]) -> Iterator[List[Token]]:
+    # A top-level statement ends with a `;`, or right before a line that
+    # starts in column 0 (the runtime doesn't always use semicolons).
+    depth = 0
+    current: List[Token] = []
+    for token in tokens:
+        if depth == 0 and current and token.line_start and token.text not in _CLOSING:
+            yield current
+            current = []
+        current.append(token)
+        if token.text in _OPENING:
+            depth += 1
+        elif token.text in _CLOSING:
+            depth -= 1
+        elif token.text == ";" and depth == 0:
+            yield current
+            current = []
+    if current:
+        yield current
+
+
+def _is_key(tokens: List[Token], i: int) -> bool:
+    return (
+        i + 1 < len(tokens)
+        and tokens[i].kind == "word"
+        and tokens[i + 1].text == ":"
+    )
+
+
+def parse_runtime(source: str) -> List[Unit]:
+    """Split the runtime into units, parents before their members."""
+    units: List[Unit] = []
+    for tokens in _statements(tokenize(source)):
+        if tokens[-1].text == ";" and len(tokens) == 1:
+            continue
+        # named after what it defines, or after its first words
+        name = " ".join(t.text for t in tokens[:2] if t.kind == "word")
+        top = Unit(name, len(units), tokens[0].start, tokens[-1].end)
+        if len(tokens) > 1 and tokens[0].kind == "word" and tokens[1].text == "=":
+            top.name = tokens[0].text
+            top.defines = tokens[0].text
+        elif (
+            len(tokens) > 3 and tokens[0].kind == "word" and tokens[1].text == "."
+            and tokens[2].kind == "word" and tokens[3].text == "="
+        ):
+            top.name = f"{tokens[0].text}.{tokens[2].text}"
+            top.defines = tokens[0].text
+            top.defines_property = tokens[2].text
+        units.append(top)
+        _scan(tokens, top, units)
+    return units
+
+
+def _scan(tokens: List[Token], top: Unit, units: List[Unit]) -> None:
+    # (closing bracket, whether it's an object literal, unit of that level)
+    stack: List[Tuple[str, bool, Unit]] = []
+    unit = top
+    in_object = False
+    start = 1 if top.defines_property is None else 3
+    if top.defines is None:
+        start = 0
+    for i in range(start, len(tokens)):
+        token = tokens[i]
+        text = token.text
+        if text in _OPENING:
+            stack.append((_OPENING[text], in_object, unit))
+            in_object = text == "{" and _is_key(tokens, i + 1)
+            if in_object:
+                unit = _member(tokens, i + 1, unit, units)
+            continue
+        if text in _CLOSING:
+            (_, in_object, outer) = stack.pop()
+            if unit is not outer:
+                unit.end = tokens[i - 1].end
+            unit = outer
+            continue
+        if in_object and text == "," and stack:
+            # the next member starts after the comma
+            owner = stack[-1][2]
+            if unit is not owner:
+                unit.end = token.end
+            if _is_key(tokens, i + 1):
+                unit = _member(tokens, i + 1, owner, units)
+            else:
+                unit = owner
+            continue
+        if token.kind == "word":
+            if i > 0 and tokens[i - 1].text == ".":
+                unit.properties.add(text)
+            elif not (in_object and _is_key(tokens, i) and tokens[i - 1].text in ("{", ",")):
+                unit.names.add(text)
+        elif token.kind == "string":
+            # `"name" in x` looks a property up too
+            unit.properties.add(text[1:-1])
+
+
+def _member(tokens: List[Token], i: int, parent: Unit, units: List[Unit]) -> Unit:
+    name = tokens[i].text
+    member = Unit(
+        f"{_owner_name(parent)}.{name}", len(units), tokens[i].start, tokens[i].end, parent, member=name
+    )
+    units.append(member)
+    return member
+
+
+def _owner_name(unit: Unit) -> str:
+    while unit.parent is not None and unit.member is None:
+        unit = unit.parent
+    return unit.name
+
+
+@dataclass
+class Usage:
+    """The globals and properties something uses, with who uses them."""
+    names: Dict[str, Reason] = field(default_factory=dict)
+    properties: Dict[str, Reason] = field(default_factory=dict)
+
+    def use_name(self, name: str, reason: Reason) -> None:
+        self.names.setdefault(name, reason)
+
+    def use_property(self, name: str, reason: Reason) -> None:
+        self.properties.setdefault(name.replace("?", "__QMARK"), reason)
+
+
+def program_usage(ast: AstElement) -> Usage:
+    """What the JS generated for `ast` (after `prepare_program`) uses."""
+    usage = Usage()
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Name):
+            if node.symbol is not None and node.symbol.kind == "global":
+                usage.use_name(node.symbol.js_name, PROGRAM)
+        elif isinstance(node, LvalueNameNonlocal):
+            if node.symbol is not None and node.symbol.kind == "global":
+                usage.use_name(node.symbol.js_name, PROGRAM)
+        elif isinstance(node, IntLiteral):
+            usage.use_name("Integer", PROGRAM)
+        elif isinstance(node, StrLiteral):
+            usage.use_name("String", PROGRAM)
+        elif isinstance(node, ArrayLiteral):
+            usage.use_name("Array", PROGRAM)
+        elif isinstance(node, (MethodCall, SingleChainedCall)):
+            usage.use_property(node.method_name, PROGRAM)
+            # loops compare the conditions of branches with these
+            for name in BRANCH_METHODS.get(node.method_name, ()):
+                usage.use_name(name, PROGRAM)
+        elif isinstance(node, MemberAccess):
+            usage.use_property(node.member_name, PROGRAM)
+        elif isinstance(node, (LvalueTable, ObjectParameter)):
+            for name in node.names:
+                usage.use_property(name, PROGRAM)
+        elif isinstance(node, TableLiteral):
+            for symbol in node.symbols:
+                if symbol is not None and symbol.kind == "global":
+                    usage.use_name(symbol.js_name, PROGRAM)
+        if isinstance(node, (MethodCall, FunctionCall)) and node.typing is not None:
+            # unboxed operations check `__T`, read the bigints and strings,
+            # and box their result
+            (result, operands) = node.typing
+            for name in BOXES[result]:
+                usage.use_name(name, PROGRAM)
+            usage.use_property("__T", PROGRAM)
+            for t in operands:
+                usage.use_property(UNBOXED_PROPERTIES[t], PROGRAM)
+        stack.extend(node.children())
+    return usage
+
+
+def shake(units: List[Unit], usage: Usage) -> Tuple[Set[int], Usage]:
+    """
+    The indices of the units to keep, and everything that ended up used
+    (with the first reason for each).
+    """
+    live: Set[int] = set()
+    changed = True
+    while changed:
+        changed = False
+        for (i, unit) in enumerate(units):
+            if i in live:
+                continue
+            if unit.parent is not None and unit.parent.index not in live:
+                continue
+            if unit.member is not None:
+                wanted = unit.member in usage.properties
+            elif unit.defines is not None:
+                wanted = unit.defines in usage.names and (
+                    unit.defines_property is None or unit.defines_property in usage.properties
+                )
+            else:
+                wanted = any(name in usage.names for name in unit.names)
+            if not wanted:
+                continue
+            live.add(i)
+            changed = True
+            for name in unit.names:
+                usage.use_name(name, unit.name)
+            for name in unit.properties:
+                usage.use_property(name, unit.name)
+    return (live, usage)
+
+
+def _outermost_dropped(units: List[Unit], live: Set[int]) -> Iterator[Unit]:
+    for unit in units:
+        if unit.index not in live and (unit.parent is None or unit.parent.index in live):
+            yield unit
+
+
+def _kept_source(source: str, units: List[Unit], live: Set[int]) -> str:
+    cuts: List[Tuple[int, int]] = []
+    for unit in _outermost_dropped(units, live):
+        (start, end) = (unit.start, unit.end)
+        # whole lines, if the unit is on lines of its own
+        line_start = source.rfind("\n", 0, start) + 1
+        if source[line_start:start].strip() == "":
+            start = line_start
+            while end < len(source) and source[end] in " \t":
+                end += 1
+            if end < len(source) and source[end] == "\n":
+                end += 1
+        cuts.append((start, end))
+    cuts.sort()
+    parts = []
+    pos = 0
+    for (start, end) in cuts:
+        parts.append(source[pos:start])
+        pos = end
+    parts.append(source[pos:])
+    # the blank lines between the statements that are gone
+    return re.sub(r"\n{3,}", "\n\n", "".join(parts)).strip() + "\n"
+
+
+@dataclass
+class Bundle:
+    js: str
+    runtime_size: int
+    kept_size: int
+    # unit name -> why it was kept, in runtime order
+    kept: Dict[str, Reason]
+    dropped: List[str]
+
+    def report(self) -> str:
+        lines = [f"kept {name}: used by {reason}" for (name, reason) in self.kept.items()]
+        if self.dropped:
+            lines.append("dropped " + ", ".join(self.dropped))
+        lines.append(
+            f"runtime: {self.kept_size} of {self.runtime_size} bytes"
+            f" ({len(self.kept)} of {len(self.kept) + len(self.dropped)} definitions)"
+        )
+        return "\n".join(lines)
+
+
+def bundle_ast(ast: AstElement, flags: compiler.CompileFlags = compiler.CompileFlags(), runtime: Optional[str] = None) -> Bundle:
+    if runtime is None:
+        with open(RUNTIME_PATH, "r") as file:
+            runtime = file.read()
+    ast = compiler.prepare_program(ast, flags)
+    units = parse_runtime(runtime)
+    (live, usage) = shake(units, program_usage(ast))
+
+    kept: Dict[str, Reason] = {}
+    for unit in units:
+        if unit.index not in live:
+            continue
+        if unit.member is not None:
+            kept[unit.name] = usage.properties[unit.member]
+        elif unit.defines_property is not None:
+            kept[unit.name] = usage.properties[unit.defines_property]
+        elif unit.defines is not None:
+            kept[unit.name] = usage.names[unit.defines]
+        else:
+            kept[unit.name] = next(usage.names[n] for n in sorted(unit.names) if n in usage.names)
+    dropped = [unit.name for unit in _outermost_dropped(units, live)]
+
+    runtime_js = _kept_source(runtime, units, live)
+    sink = io.StringIO()
+    compiler.emit_program(ast, sink, flags)
+    return Bundle(runtime_js + sink.getvalue() + "\n", len(runtime), len(runtime_js), kept, dropped)
+
+
+def main(argv: List[str]) -> int:
+    argparser = argparse.ArgumentParser(
+        prog="main.py bundle",
+        description="Compile a zuv file together with the part of lib.js it uses.",
+    )
+    argparser.add_argument("path")
+    argparser.add_argument("-o", "--output", help="where to write the bundle (default: stdout)")
+    argparser.add_argument("-q", "--quiet", action="store_true", help="don't report what was kept")
+    compiler.add_flag_arguments(argparser)
+    args = argparser.parse_args(argv)
+
+    flags = compiler.flags_from_args(args)
+    with open(args.path, "r") as file:
+        ast = compiler.parse_cached(file.read(), flags.parser)
+    result = bundle_ast(ast, flags)
+    if args.output is None:
+        sys.stdout.write(result.js)
+    else:
+        with open(args.output, "w") as file:
+            file.write(result.js)
+    if not args.quiet:
+        print(result.report(), file=sys.stderr)
+    return 0
@@ -0,0 +1,555 @@
+"""
+A hand-written parser for the language of `grammar.lark`, several times
+faster than the Lark one: `python main.py --parser descent PATH`.
+
+A single regex splits the source into tokens, and a recursive-descent
+parser builds the `zuv_ast` nodes directly. It accepts exactly the same
+programs as the Lark LALR parser and builds the same trees, down to the
+choices that parser makes on its own:
+
+- At the start of a statement, `[` and `{` may open an assignment target
+  or a literal. Lark decides on the first element: a name followed by `,`
+  or `]` is a target (`lvalue_name.2` beats `name_literal.1`), a name
+  followed by `}` is a table entry (`table_literal_entry.1`), and a name
+  followed by `,` inside `{` is a target (a shift beats a reduction).
+  So `[a, 1]` and `{a, b}` are syntax errors at the start of a statement,
+  and `{a}` is a table.
+- In the arguments of a chained call, `x = y @m` is a method call on `y`
+  rather than `x = y` followed by the next call of the chain.
+- Lark's lexer only looks for the tokens that the parser accepts next: `...`
+  is three dots only after an expression that can start a chain, and `()`
+  is one token only after the key of a table entry. Runs of dots are kept
+  as one token here and taken apart one dot at a time.
+
+The parser recurses once per level of nesting. Programs nested deeper than
+the Python stack allows are parsed again on a bigger one.
+
+    ast = parse(source)      # raises ParseError
+"""
+
+import json
+import re
+from sys import intern
+from typing import List, NoReturn, Optional, Tuple
+
+from zuv_ast import (
+    ArrayLiteral,
+    ArrayParameter,
+    Assignment,
+    AssignmentTarget,
+    AstElement,
+    BlockExpression,
+    ChainedMethodCall,
+    FunctionCall,
+    FunctionDefinition,
+    IntLiteral,
+    LvalueArray,
+    LvalueName,
+    LvalueNameNonlocal,
+    LvalueTable,
+    MemberAccess,
+    MethodCall,
+    ModuleReference,
+    Name,
+    NamedParameter,
+    ObjectParameter,
+    SingleChainedCall,
+    StrLiteral,
+    TableEntry,
+    TableLiteral,
+)
+
+
+class ParseError(ValueError):
+    def __init__(self, message: str, line: int, column: int):
+        super().__init__(f"{message} at line {line}, column {column}")
+        self.line = line
+        self.column = column
+
+
+# Whitespace and comments (as `%ignore`d by the grammar) match with the
+# group empty; anything that is not a token is matched by `.` on its own.
+# The regex for strings only differs from the grammar's where that one
+# backtracks, and then `json.loads` rejects what it matched anyway.
+_TOKEN = re.compile(
+    r'[ \t\f\r\n]+|//[^\n]*|('
+    r'(?!(?:fn|outer|import)\b)(?![0-9])[_a-zA-Z0-9?]+'
+    r'|[+-]?(?:0|[1-9][0-9]*)'
+    r'|"[^"\\]*(?:\\.[^"\\]*)*"'
+    r'|fn|outer|import'
+    r'|\.+|\|>|->|<=|\(\)|[()\[\]{},;=:!@]'
+    r'|.)'
+)
+
+# token kinds: the punctuation is its own kind
+NAME = "NAME"
+INT = "INT"
+STR = "STR"
+DOTS = "DOTS"
+BAD = "BAD"
+EOF = "EOF"
+
+_KINDS = {
+    p: p for p in ["fn", "import", "|>", "->", "<=", "()", "(", ")", "[", "]", "{", "}", ",", ";", "=", ":", "!", "@"]
+}
+# `outer` is not a name, and these are what's left of invalid tokens
+_KINDS.update({"outer": BAD, "+": BAD, "-": BAD, '"': BAD})
+_FIRST_CHAR_KINDS = {
+    **{c: NAME for c in "_?abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"},
+    **{c: INT for c in "+-0123456789"},
+    '"': STR,
+    ".": DOTS,
+}
+
+EXPRESSION_START = frozenset([NAME, INT, STR, "fn", "(", "{", "["])
+# what can start the arguments of a method call (`stmt_no_method_call`)
+ARGUMENT_START = EXPRESSION_START | {"<="}
+STATEMENT_START = ARGUMENT_START | {"import"}
+
+_DESCRIPTIONS = {NAME: "a name", INT: "an integer", STR: "a string", DOTS: "`.`", EOF: "end of file"}
+
+
+def tokenize(source: str) -> Tuple[List[str], List[str]]:
+    """The kind and the text of each token, followed by two `EOF`s."""
+    texts = [text for text in _TOKEN.findall(source) if text]
+    get_kind = _KINDS.get
+    first_char_kind = _FIRST_CHAR_KINDS.get
+    kinds = [get_kind(text) or first_char_kind(text[0], BAD) for text in texts]
+    kinds += [EOF, EOF]
+    texts += ["", ""]
+    return (kinds, texts)
+
+
+def parse(source: str) -> BlockExpression:
+    try:
+        return Parser(source).parse()
+    except RecursionError:
+        pass
+    import zuv_eval
+    return zuv_eval.with_deep_stack(Parser(source).parse)
+
+
+class Parser:
+    def __init__(self, source: str):
+        self.source = source
+        (self.kinds, self.texts) = tokenize(source)
+        self.i = 0
+
+    def parse(self) -> BlockExpression:
+        kinds = self.kinds
+        statements = []
+        while kinds[self.i] in STATEMENT_START:
+            statements.append(self.statement(True))
+        if kinds[self.i] != EOF:
+            self.error("a statement")
+        return BlockExpression(statements, implicit_return=False)
+
+    # Errors
+
+    def error(self, expected: str) -> NoReturn:
+        # find where the token is: it's only worth it now
+        texts = self.texts
+        offset = 0
+        token = 0
+        for match in _TOKEN.finditer(self.source):
+            offset = match.start()
+            if match.group(1):
+                if token == self.i:
+                    break
+                token += 1
+        else:
+            offset = len(self.source)
+        if self.kinds[self.i] == DOTS:
+            # the dots of the run that were already taken
+            offset += len(match.group()) - len(texts[self.i])
+        line = self.source.count("\n", 0, offset) + 1
+        column = offset - self.source.rfind("\n", 0, offset)
+        kind = self.kinds[self.i]
+        found = _DESCRIPTIONS.get(kind) or f"`{texts[self.i]}`"
+        if kind in (NAME, INT, STR):
+            found += f" `{texts[self.i]}`"
+        raise ParseError(f"Unexpected {found}, expected {expected},", line, column)
+
+    def expect(self, kind: str) -> str:
+        i = self.i
+        if self.kinds[i] != kind:
+            self.error(_DESCRIPTIONS.get(kind) or f"`{kind}`")
+        self.i = i + 1
+        return self.texts[i]
+
+    def name(self) -> str:
+        i = self.i
+        if self.kinds[i] != NAME:
+            self.error("a name")
+        self.i = i + 1
+        return intern(self.texts[i])
+
+    def dot(self) -> None:
+        """Take one `.` from the run of dots at the current token."""
+        i = self.i
+        if self.kinds[i] != DOTS:
+            self.error("`.`")
+        text = self.texts[i]
+        if len(text) == 1:
+            self.i = i + 1
+        else:
+            self.texts[i] = text[1:]
+
+    # Statements
+
+    def statement(self, method_calls: bool) -> AstElement:
+        """
+        A statement, or only an assignment or an expression that isn't a
+        method call (`stmt_no_method_call`) without `method_calls`.
+        """
+        kinds = self.kinds
+        i = self.i
+        kind = kinds[i]
+        if kind == NAME:
+            if kinds[i + 1] == "=":
+                self.i = i + 1
+                return self.assignment(LvalueName(intern(self.texts[i])))
+            self.i = i + 1
+            expression = self.postfix(Name(intern(self.texts[i])))
+        elif kind == "<=":
+            self.i = i + 1
+            return self.assignment(LvalueNameNonlocal(self.name()))
+        elif kind == "import":
+            self.i = i + 1
+            path = json.loads(self.expect(STR))
+            self.expect("{")
+            return Assignment(self.target_table([self.name()]), ModuleReference(path))
+        elif kind == "[" or kind == "{":
+            target_or_literal = self.target_or_literal()
+            if isinstance(target_or_literal, AssignmentTarget):
+                return self.assignment(target_or_literal)
+            expression = self.postfix(target_or_literal)
+        else:
+            expression = self.expr_no_method_call()
+        return self.method_calls(expression) if method_calls else expression
+
+    def assignment(self, target: AstElement) -> Assignment:
+        self.expect("=")
+        value = self.expression()
+        if self.kinds[self.i] == ";":
+            self.i += 1
+        return Assignment(target, value)
+
+    def target(self) -> AstElement:
+        kind = self.kinds[self.i]
+        if kind == NAME:
+            return LvalueName(self.name())
+        if kind == "<=":
+            self.i += 1
+            return LvalueNameNonlocal(self.name())
+        if kind == "[":
+            self.i += 1
+            return self.target_array([self.target()])
+        if kind == "{":
+            self.i += 1
+            return self.target_table([self.name()])
+        self.error("an assignment target")
+
+    def target_array(self, targets: List[AstElement]) -> LvalueArray:
+        """The rest of `[target, ...]` after the first target."""
+        kinds = self.kinds
+        while kinds[self.i] == ",":
+            self.i += 1
+            if kinds[self.i] == "]":
+                break
+            targets.append(self.target())
+        self.expect("]")
+        return LvalueArray(targets)
+
+    def target_table(self, names: List[str]) -> LvalueTable:
+        """The rest of `{name, ...}` after the first name."""
+        kinds = self.kinds
+        while kinds[self.i] == ",":
+            self.i += 1
+            if kinds[self.i] == "}":
+                break
+            names.append(self.name())
+        self.expect("}")
+        return LvalueTable(names)
+
+    def target_or_literal(self) -> AstElement:
+        """`[` or `{` at the start of a statement: see the module docstring."""
+        kinds = self.kinds
+        i = self.i
+        self.i = i + 1
+        if kinds[i] == "[":
+            kind = kinds[i + 1]
+            if kind == NAME and (kinds[i + 2] == "," or kinds[i + 2] == "]"):
+                return self.target_array([self.target()])
+            if kind == "<=":
+                return self.target_array([self.target()])
+            if kind == "[" or kind == "{":
+                first = self.target_or_literal()
+                if isinstance(first, AssignmentTarget):
+                    return self.target_array([first])
+                return self.array([self.method_calls(self.postfix(first))])
+            if kind == "]":
+                self.i += 1
+                return ArrayLiteral([])
+            return self.array([self.expression()])
+        if kinds[i + 1] == NAME and kinds[i + 2] == ",":
+            names = [self.name()]
+            return self.target_table(names)
+        return self.table()
+
+    # Expressions
+
+    def expression(self) -> AstElement:
+        # `method_calls(expr_no_method_call())`, without the calls
+        expression = self.atom()
+        kinds = self.kinds
+        kind = kinds[self.i]
+        if kind == "!" or kind == "->" or kind == ":":
+            expression = self.postfix(expression)
+            kind = kinds[self.i]
+        if kind == "@":
+            return self.method_call(expression, False)[0]
+        if kind == DOTS and len(self.texts[self.i]) >= 3:
+            return self.chain(expression)
+        return expression
+
+    def method_calls(self, expression: AstElement) -> AstElement:
+        """`expression` followed by a method call or a chain, if there is one."""
+        kind = self.kinds[self.i]
+        if kind == "@":
+            return self.method_call(expression, False)[0]
+        if kind == DOTS and len(self.texts[self.i]) >= 3:
+            return self.chain(expression)
+        return expression
+
+    def expr_no_method_call(self) -> AstElement:
+        return self.postfix(self.atom())
+
+    def atom(self) -> AstElement:
+        """`expr_no_method_call` without what `postfix` takes."""
+        kinds = self.kinds
+        i = self.i
+        kind = kinds[i]
+        if kind == NAME:
+            self.i = i + 1
+            return Name(intern(self.texts[i]))
+        if kind == INT:
+            self.i = i + 1
+            return IntLiteral(int(self.texts[i]))
+        if kind == STR:
+            self.i = i + 1
+            return StrLiteral(json.loads(self.texts[i]))
+        if kind == "fn":
+            return self.function(False)[0]
+        if kind == "(":
+            return self.parenthesized()
+        if kind == "[":
+            self.i = i + 1
+            return self.array([])
+        if kind == "{":
+            self.i = i + 1
+            return self.table()
+        self.error("an expression")
+
+    def postfix(self, expression: AstElement) -> AstElement:
+        """`expression` followed by any `!`, `->name` and `: arguments.`"""
+        kinds = self.kinds
+        while True:
+            kind = kinds[self.i]
+            if kind == "!":
+                self.i += 1
+                expression = FunctionCall(expression, [])
+            elif kind == "->":
+                self.i += 1
+                expression = MemberAccess(expression, self.name())
+            elif kind == ":":
+                self.i += 1
+                expression = FunctionCall(expression, self.call_arguments())
+                self.dot()
+            else:
+                return expression
+
+    def call_arguments(self) -> List[AstElement]:
+        kinds = self.kinds
+        if kinds[self.i] not in EXPRESSION_START:
+            self.error("an expression")
+        arguments = [self.expression()]
+        while kinds[self.i] in EXPRESSION_START:
+            arguments.append(self.expression())
+        return arguments
+
+    def parenthesized(self) -> AstElement:
+        """
+        `(expression)`, or a function definition, function call or method
+        call that the `)` ends instead of a `.`.
+        """
+        kinds = self.kinds
+        self.i += 1
+        if kinds[self.i] == "fn":
+            (expression, closed) = self.function(True)
+            if closed:
+                return expression
+        else:
+            expression = self.atom()
+        while True:
+            kind = kinds[self.i]
+            if kind == "!":
+                self.i += 1
+                expression = FunctionCall(expression, [])
+            elif kind == "->":
+                self.i += 1
+                expression = MemberAccess(expression, self.name())
+            elif kind == ":":
+                self.i += 1
+                expression = FunctionCall(expression, self.call_arguments())
+                if kinds[self.i] == ")":
+                    self.i += 1
+                    return expression
+                self.dot()
+            else:
+                break
+        if kind == "@":
+            (expression, closed) = self.method_call(expression, True)
+            if closed:
+                return expression
+        elif kind == DOTS and len(self.texts[self.i]) >= 3:
+            expression = self.chain(expression)
+        self.expect(")")
+        return expression
+
+    def array(self, items: List[AstElement]) -> ArrayLiteral:
+        """The rest of `[expression, ...]`, after `items`."""
+        kinds = self.kinds
+        if items:
+            if kinds[self.i] != ",":
+                self.expect("]")
+                return ArrayLiteral(items)
+            self.i += 1
+        while kinds[self.i] != "]":
+            items.append(self.expression())
+            if kinds[self.i] != ",":
+                break
+            self.i += 1
+        self.expect("]")
+        return ArrayLiteral(items)
+
+    def table(self) -> TableLiteral:
+        """The rest of a table literal after the `{`."""
+        kinds = self.kinds
+        entries = []
+        while kinds[self.i] != "}":
+            key = self.name()
+            kind = kinds[self.i]
+            if kind == "()":
+                self.i += 1
+                entries.append(TableEntry.GetterShorthand(key))
+            elif kind in EXPRESSION_START:
+                entries.append(TableEntry.KeyValue(key, self.expression()))
+            else:
+                entries.append(TableEntry.KeyShorthand(key))
+            if kinds[self.i] != ",":
+                break
+            self.i += 1
+        self.expect("}")
+        return TableLiteral(entries)
+
+    def parameters(self) -> List[AstElement]:
+        kinds = self.kinds
+        parameters: List[AstElement] = []
+        while True:
+            kind = kinds[self.i]
+            if kind == NAME:
+                parameters.append(NamedParameter(self.name()))
+            elif kind == "{":
+                self.i += 1
+                parameters.append(ObjectParameter(self.names("}")))
+            elif kind == "[":
+                self.i += 1
+                parameters.append(ArrayParameter(self.names("]")))
+            else:
+                return parameters
+
+    def names(self, end: str) -> List[str]:
+        kinds = self.kinds
+        names = []
+        while kinds[self.i] != end:
+            names.append(self.name())
+            if kinds[self.i] != ",":
+                break
+            self.i += 1
+        self.expect(end)
+        return names
+
+    def function(self, parenthesized: bool) -> Tuple[FunctionDefinition, bool]:
+        """`fn parameters: statements.`, and whether a `)` ended it instead."""
+        kinds = self.kinds
+        self.i += 1
+        parameters = self.parameters()
+        self.expect(":")
+        body = []
+        while kinds[self.i] in STATEMENT_START:
+            body.append(self.statement(True))
+        closed = parenthesized and kinds[self.i] == ")"
+        if closed:
+            self.i += 1
+        else:
+            self.dot()
+        return (FunctionDefinition(parameters, BlockExpression(body)), closed)
+
+    # Method calls
+
+    def shorthand_parameters(self) -> Optional[List[AstElement]]:
+        """The parameters of `@method!parameters: ...` (or `@method: ...`)."""
+        kind = self.kinds[self.i]
+        if kind == "!":
+            self.i += 1
+            parameters = self.parameters()
+            self.expect(":")
+            return parameters
+        if kind == ":":
+            self.i += 1
+            return []
+        return None
+
+    def method_arguments(self, parameters: Optional[List[AstElement]]) -> List[AstElement]:
+        kinds = self.kinds
+        arguments = []
+        while kinds[self.i] in ARGUMENT_START:
+            arguments.append(self.statement(False))
+        if parameters is not None:
+            return [FunctionDefinition(parameters, BlockExpression(arguments))]
+        return arguments
+
+    def method_call(self, receiver: AstElement, parenthesized: bool) -> Tuple[MethodCall, bool]:
+        """`receiver @method arguments.`, and whether a `)` ended it instead."""
+        self.i += 1
+        method_name = self.name()
+        arguments = self.method_arguments(self.shorthand_parameters())
+        closed = parenthesized and self.kinds[self.i] == ")"
+        if closed:
+            self.i += 1
+        else:
+            self.dot()
+        return (MethodCall(receiver, method_name, arguments), closed)
+
+    def chain(self, subject: AstElement) -> ChainedMethodCall:
+        """`subject... @method arguments |>method arguments.`"""
+        kinds = self.kinds
+        text = self.texts[self.i]
+        if len(text) == 3:
+            self.i += 1
+        else:
+            self.texts[self.i] = text[3:]
+        calls = []
+        while True:
+            kind = kinds[self.i]
+            if kind != "@" and kind != "|>":
+                break
+            self.i += 1
+            method_name = self.name()
+            arguments = self.method_arguments(self.shorthand_parameters())
+            calls.append(SingleChainedCall("@" if kind == "@" else "|>", method_name, arguments))
+        if not calls:
+            self.error("`@` or `|>`")
+        self.dot()
+        return ChainedMethodCall(subject, calls)
@@ -0,0 +1,583 @@
+"""
+Running zuv in-process: `python main.py run [--no-fold] PATH`
+
+Runs a program without a JS engine, on `zuv_runtime`, the Python port of
+`lib.js`. The tree is compiled once into nested Python closures, one per
+node, each taking the frame of the function it runs in:
+
+    code = compile_program(ast)       # resolves the names in `ast`
+    top_level = code.run()            # name -> value of each top-level name
+
+Names are resolved ahead of time like for code generation (`zuv_scope`),
+and each function's parameters and locals get a slot in its frame, a list
+that starts with the frame of the function around it. So reading a name is
+an index into a frame, a few frames up for outer names, and never a lookup
+by name. Globals are looked up once, at compile time.
+
+Compiling walks the tree with a stack, like everything else. Running it
+can't: every call to a closure is a Python call, as deep as the nesting of
+the code it runs, and zuv loops are recursion. `run` allows for that with a
+deep stack (see `with_deep_stack`).
+"""
+
+import argparse
+import sys
+import threading
+from operator import itemgetter
+from typing import Any, Callable, Dict, List, Tuple
+
+import main as compiler
+import zuv_optimize
+import zuv_scope
+from zuv_ast import (
+    ArrayLiteral,
+    ArrayParameter,
+    Assignment,
+    AstElement,
+    BlockExpression,
+    ChainedMethodCall,
+    ExpressionStatement,
+    FunctionCall,
+    FunctionDefinition,
+    IntLiteral,
+    LvalueArray,
+    LvalueName,
+    LvalueNameNonlocal,
+    LvalueTable,
+    MemberAccess,
+    MethodCall,
+    ModuleReference,
+    Name,
+    NamedParameter,
+    ObjectParameter,
+    SingleChainedCall,
+    StrLiteral,
+    Symbol,
+    TableEntry,
+    TableLiteral,
+)
+from zuv_runtime import (
+    GLOBALS,
+    UNDEFINED,
+    Array,
+    Integer,
+    Record,
+    String,
+    ZuvError,
+    member,
+    template,
+    type_error,
+)
+
+# the slots of one call of a function: the frame of the function it was
+# defined in, then its parameters and locals
+Frame = List[Any]
+Code = Callable[[Frame], Any]
+Setter = Callable[[Frame, Any], None]
+
+# how deep `run` lets Python recurse, and the stack it gives the thread
+RECURSION_LIMIT = 1_000_000
+STACK_SIZE = 512 * 1024 * 1024
+
+_MISSING = object()
+
+
+class Program:
+    def __init__(self, code: Code, top_level: Dict[str, int], assigned_globals: Dict[str, Any]):
+        self.code = code
+        # name -> slot of the top-level names
+        self.top_level = top_level
+        # the globals the program assigns with `outer` without declaring them
+        self.assigned_globals = assigned_globals
+
+    def run(self) -> Dict[str, Any]:
+        """Run the program, and return the values of its top-level names."""
+        self.assigned_globals.clear()
+        frame: Frame = [None] + [UNDEFINED] * len(self.top_level)
+        try:
+            self.code(frame)
+        except RecursionError:
+            raise ZuvError("RangeError", "Maximum call stack size exceeded") from None
+        return {name: frame[slot] for (name, slot) in self.top_level.items()}
+
+
+def compile_program(ast: AstElement, flags: compiler.CompileFlags = compiler.CompileFlags()) -> Program:
+    """Compile a parsed program. Raises `zuv_scope.ScopeError`."""
+    if flags.fold_constants:
+        ast = zuv_optimize.fold_constants(ast)
+    resolver = zuv_scope.Resolver()
+    top = resolver.resolve(ast)
+    closures = ClosureCompiler(resolver.scopes)
+    code = closures.compile(ast)
+    return Program(code, closures.slots[id(top.block)], closures.assigned_globals)
+
+
+def _reader(depth: int, slot: int) -> Code:
+    if depth == 0:
+        return itemgetter(slot)
+    if depth == 1:
+        return lambda f: f[0][slot]
+    if depth == 2:
+        return lambda f: f[0][0][slot]
+
+    def read(f: Frame) -> Any:
+        for _ in range(depth):
+            f = f[0]
+        return f[slot]
+    return read
+
+
+def _writer(depth: int, slot: int) -> Setter:
+    if depth == 0:
+        def write(f: Frame, value: Any) -> None:
+            f[slot] = value
+    elif depth == 1:
+        def write(f: Frame, value: Any) -> None:
+            f[0][slot] = value
+    else:
+        def write(f: Frame, value: Any) -> None:
+            for _ in range(depth):
+                f = f[0]
+            f[slot] = value
+    return write
+
+
+def _constant(value: Any) -> Code:
+    return lambda f: value
+
+
+def _describe(node: AstElement) -> str:
+    """How JS names the value of `node` in errors, like `x.a.b`."""
+    names = []
+    while isinstance(node, MemberAccess):
+        names.append(_mangle(node.member_name))
+        node = node.expression
+    names.append(node.symbol.js_name if isinstance(node, Name) else "(intermediate value)")  # type: ignore
+    return ".".join(reversed(names))
+
+
+def _mangle(name: str) -> str:
+    return name.replace("?", "__QMARK")
+
+
+def _iterate(value: Any) -> List[Any]:
+    """The elements that destructuring `[a, b]` takes from `value`."""
+    if type(value) is Array:
+        return value.xs
+    if type(value) in (list, str):
+        return list(value)
+    raise type_error(f"{template(value) if value is None or value is UNDEFINED else 'object'} is not iterable")
+
+
+class ClosureCompiler:
+    def __init__(self, scopes: List[zuv_scope.Scope]):
+        # id() of each scope's block -> name -> slot, and how many functions
+        # it is nested in
+        self.slots: Dict[int, Dict[str, int]] = {}
+        self.levels: Dict[int, int] = {}
+        for scope in scopes:
+            self.slots[id(scope.block)] = {name: i + 1 for (i, name) in enumerate(scope.declared)}
+            self.levels[id(scope.block)] = 0 if scope.parent is None else self.levels[id(scope.parent.block)] + 1
+        self.assigned_globals: Dict[str, Any] = {}
+        self._assigned_names: set = set()
+        self._codes: Dict[int, Any] = {}
+        # the level of the node being compiled
+        self._level = 0
+
+    def compile(self, root: AstElement) -> Code:
+        # Compiles the children before their parents, from a list of the
+        # nodes in pre-order with how many functions each one is in.
+        order: List[Tuple[AstElement, int]] = []
+        stack = [(root, 0)]
+        while stack:
+            (node, level) = stack.pop()
+            order.append((node, level))
+            if isinstance(node, LvalueNameNonlocal) and node.symbol.kind == "global":  # type: ignore
+                self._assigned_names.add(node.symbol.js_name)  # type: ignore
+            inner = level + 1 if isinstance(node, FunctionDefinition) else level
+            stack.extend((child, inner) for child in node.children())
+        for (node, level) in reversed(order):
+            self._level = level
+            self._codes[id(node)] = RULES[type(node)](self, node)
+        return self._codes.pop(id(root))
+
+    def code(self, node: AstElement) -> Any:
+        return self._codes.pop(id(node))
+
+    def _slot(self, symbol: Symbol) -> Tuple[int, int]:
+        """The depth and the slot of a local or outer name."""
+        block = id(symbol.block)
+        return (self._level - self.levels[block], self.slots[block][symbol.name])
+
+    def read(self, symbol: Symbol) -> Code:
+        if symbol.kind != "global":
+            return _reader(*self._slot(symbol))
+        name = symbol.js_name
+        value = GLOBALS.get(name, _MISSING)
+        if name in self._assigned_names:
+            assigned = self.assigned_globals
+
+            def read(f: Frame) -> Any:
+                result = assigned.get(name, value)
+                if result is _MISSING:
+                    raise ZuvError("ReferenceError", f"{name} is not defined")
+                return result
+            return read
+        if value is _MISSING:
+            def undefined(f: Frame) -> Any:
+                raise ZuvError("ReferenceError", f"{name} is not defined")
+            return undefined
+        return _constant(value)
+
+    def write(self, symbol: Symbol) -> Setter:
+        if symbol.kind != "global":
+            return _writer(*self._slot(symbol))
+        (assigned, name) = (self.assigned_globals, symbol.js_name)
+
+        def write(f: Frame, value: Any) -> None:
+            assigned[name] = value
+        return write
+
+    def block(self, node: BlockExpression) -> Code:
+        codes = [self.code(statement) for statement in node.statements]
+        if not node.implicit_return or not codes or isinstance(node.statements[-1], Assignment):
+            # like a JS block that ends without `return`
+            def run(f: Frame) -> Any:
+                for code in codes:
+                    code(f)
+                return UNDEFINED
+            return run
+        if len(codes) == 1:
+            return codes[0]
+        (init, last) = (codes[:-1], codes[-1])
+
+        def run_and_return(f: Frame) -> Any:
+            for code in init:
+                code(f)
+            return last(f)
+        return run_and_return
+
+    def expression_statement(self, node: ExpressionStatement) -> Code:
+        return self.code(node.expression)
+
+    def name(self, node: Name) -> Code:
+        return self.read(node.symbol)  # type: ignore
+
+    def int_literal(self, node: IntLiteral) -> Code:
+        # integers and strings never change, so one object will do
+        return _constant(Integer(node.value))
+
+    def str_literal(self, node: StrLiteral) -> Code:
+        return _constant(String(node.value))
+
+    def array_literal(self, node: ArrayLiteral) -> Code:
+        codes = [self.code(element) for element in node.elements]
+        return lambda f: Array([code(f) for code in codes])
+
+    def table_literal(self, node: TableLiteral) -> Code:
+        entries: List[Tuple[str, Code]] = []
+        for (entry, symbol) in zip(node.entries, node.symbols):
+            attribute = "js_" + _mangle(entry[0])
+            if isinstance(entry, TableEntry.KeyValue):
+                entries.append((attribute, self.code(entry[1])))
+            elif isinstance(entry, TableEntry.KeyShorthand):
+                entries.append((attribute, self.read(symbol)))  # type: ignore
+            else:
+                entries.append((attribute, self._getter(self.read(symbol))))  # type: ignore
+
+        def table(f: Frame) -> Record:
+            record = Record()
+            record.__dict__ = {attribute: code(f) for (attribute, code) in entries}
+            return record
+        return table
+
+    def _getter(self, read: Code) -> Code:
+        return lambda f: lambda *_: read(f)
+
+    def lvalue_name(self, node: LvalueName) -> Setter:
+        return self.write(node.symbol)  # type: ignore
+
+    def lvalue_array(self, node: LvalueArray) -> Setter:
+        targets = [self.code(target) for target in node.targets]
+        padding = [UNDEFINED] * len(targets)
+
+        def write(f: Frame, value: Any) -> None:
+            for (target, item) in zip(targets, _iterate(value) + padding):
+                target(f, item)
+        return write
+
+    def lvalue_table(self, node: LvalueTable) -> Setter:
+        return self._destructure(node.names, node.symbols, self.write)
+
+    def _destructure(self, names: List[str], symbols: List[Symbol], write) -> Setter:
+        targets = [(_mangle(name), write(symbol)) for (name, symbol) in zip(names, symbols)]
+
+        def destructure(f: Frame, value: Any) -> None:
+            if (value is None or value is UNDEFINED) and targets:
+                raise type_error(
+                    f"Cannot destructure property '{targets[0][0]}' of '{template(value)}' as it is {template(value)}."
+                )
+            for (name, target) in targets:
+                target(f, member(value, name))
+        return destructure
+
+    def assignment(self, node: Assignment) -> Code:
+        (target, expression) = (self.code(node.target), self.code(node.expression))
+        if isinstance(node.target, LvalueName):
+            (depth, slot) = self._slot(node.target.symbol)  # type: ignore
+            if depth == 0:
+                def assign_local(f: Frame) -> Any:
+                    value = f[slot] = expression(f)
+                    return value
+                return assign_local
+
+        def assign(f: Frame) -> Any:
+            value = expression(f)
+            target(f, value)
+            return value
+        return assign
+
+    def parameter(self, node: AstElement) -> Setter:
+        if isinstance(node, NamedParameter):
+            return self.write(node.symbol)  # type: ignore
+        if isinstance(node, ObjectParameter):
+            return self._destructure(node.names, node.symbols, self.write)
+        writes = [self.write(symbol) for symbol in node.symbols]  # type: ignore
+        padding = [UNDEFINED] * len(writes)
+
+        def unpack(f: Frame, value: Any) -> None:
+            for (write, item) in zip(writes, _iterate(value) + padding):
+                write(f, item)
+        return unpack
+
+    def member_access(self, node: MemberAccess) -> Code:
+        (expression, name) = (self.code(node.expression), _mangle(node.member_name))
+        attribute = "js_" + name
+
+        def access(f: Frame) -> Any:
+            value = expression(f)
+            try:
+                return getattr(value, attribute)
+            except AttributeError:
+                return member(value, name)
+        return access
+
+    def module_reference(self, node: ModuleReference) -> Code:
+        raise ValueError(f'"{node.path}" is imported: modules are put together by `main.py link`')
+
+    def method_call(self, node: MethodCall) -> Code:
+        expression = self.code(node.expression)
+        arguments = [self.code(argument) for argument in node.arguments]
+        name = _mangle(node.method_name)
+        (attribute, description) = ("js_" + name, _describe(node.expression) + "." + name)
+        if len(arguments) == 1:
+            [argument] = arguments
+
+            def call_1(f: Frame) -> Any:
+                receiver = expression(f)
+                try:
+                    method = getattr(receiver, attribute)
+                except AttributeError:
+                    method = member(receiver, name)
+                try:
+                    return method(argument(f))
+                except TypeError:
+                    if callable(method):
+                        raise
+                    raise type_error(f"{description} is not a function") from None
+            return call_1
+        if len(arguments) == 2:
+            [first, second] = arguments
+
+            def call_2(f: Frame) -> Any:
+                receiver = expression(f)
+                try:
+                    method = getattr(receiver, attribute)
+                except AttributeError:
+                    method = member(receiver, name)
+                try:
+                    return method(first(f), second(f))
+                except TypeError:
+                    if callable(method):
+                        raise
+                    raise type_error(f"{description} is not a function") from None
+            return call_2
+
+        def call(f: Frame) -> Any:
+            receiver = expression(f)
+            try:
+                method = getattr(receiver, attribute)
+            except AttributeError:
+                method = member(receiver, name)
+            try:
+                return method(*[argument(f) for argument in arguments])
+            except TypeError:
+                if callable(method):
+                    raise
+                raise type_error(f"{description} is not a function") from None
+        return call
+
+    def single_chained_call(self, node: SingleChainedCall) -> Tuple:
+        name = _mangle(node.method_name)
+        arguments = [self.code(argument) for argument in node.arguments]
+        return (node.kind == "@", "js_" + name, name, arguments, "__x." + name)
+
+    def chained_method_call(self, node: ChainedMethodCall) -> Code:
+        subject = self.code(node.subject)
+        calls = [self.code(call) for call in node.calls]
+
+        def chain(f: Frame) -> Any:
+            s = x = subject(f)
+            for (on_subject, attribute, name, arguments, description) in calls:
+                receiver = s if on_subject else x
+                try:
+                    method = getattr(receiver, attribute)
+                except AttributeError:
+                    method = member(receiver, name)
+                try:
+                    x = method(*[argument(f) for argument in arguments])
+                except TypeError:
+                    if callable(method):
+                        raise
+                    raise type_error(f"{description} is not a function") from None
+            return x
+        return chain
+
+    def function_call(self, node: FunctionCall) -> Code:
+        function = self.code(node.function)
+        arguments = [self.code(argument) for argument in node.arguments]
+        description = _describe(node.function)
+        if len(arguments) == 1:
+            [argument] = arguments
+
+            def call_1(f: Frame) -> Any:
+                callee = function(f)
+                try:
+                    return callee(argument(f))
+                except TypeError:
+                    if callable(callee):
+                        raise
+                    raise type_error(f"{description} is not a function") from None
+            return call_1
+
+        def call(f: Frame) -> Any:
+            callee = function(f)
+            try:
+                return callee(*[argument(f) for argument in arguments])
+            except TypeError:
+                if callable(callee):
+                    raise
+                raise type_error(f"{description} is not a function") from None
+        return call
+
+    def function_definition(self, node: FunctionDefinition) -> Code:
+        block = node.body if isinstance(node.body, BlockExpression) else node
+        slots = self.slots[id(block)]
+        parameters = [self.code(parameter) for parameter in node.parameters]
+        body = self.code(node.body)
+        n = len(parameters)
+        padding = (UNDEFINED,) * n
+        rest = [UNDEFINED] * (len(slots) - n)
+        if all(isinstance(p, NamedParameter) for p in node.parameters) and (
+            [slots[p.name] for p in node.parameters] == list(range(1, n + 1))  # type: ignore
+        ):
+            # the arguments are the first slots
+            def define(f: Frame) -> Callable[..., Any]:
+                def function(*args: Any) -> Any:
+                    if len(args) != n:
+                        args = (args + padding)[:n]
+                    return body([f, *args, *rest])
+                return function
+            return define
+
+        blank = [UNDEFINED] * len(slots)
+
+        def define_destructuring(f: Frame) -> Callable[..., Any]:
+            def function(*args: Any) -> Any:
+                frame = [f, *blank]
+                for (parameter, value) in zip(parameters, args + padding):
+                    parameter(frame, value)
+                return body(frame)
+            return function
+        return define_destructuring
+
+
+RULES: Dict[type, Callable[[ClosureCompiler, Any], Any]] = {
+    BlockExpression: ClosureCompiler.block,
+    ExpressionStatement: ClosureCompiler.expression_statement,
+    Name: ClosureCompiler.name,
+    IntLiteral: ClosureCompiler.int_literal,
+    StrLiteral: ClosureCompiler.str_literal,
+    ArrayLiteral: ClosureCompiler.array_literal,
+    TableLiteral: ClosureCompiler.table_literal,
+    LvalueName: ClosureCompiler.lvalue_name,
+    LvalueNameNonlocal: ClosureCompiler.lvalue_name,
+    LvalueArray: ClosureCompiler.lvalue_array,
+    LvalueTable: ClosureCompiler.lvalue_table,
+    Assignment: ClosureCompiler.assignment,
+    NamedParameter: ClosureCompiler.parameter,
+    ObjectParameter: ClosureCompiler.parameter,
+    ArrayParameter: ClosureCompiler.parameter,
+    MemberAccess: ClosureCompiler.member_access,
+    ModuleReference: ClosureCompiler.module_reference,
+    MethodCall: ClosureCompiler.method_call,
+    SingleChainedCall: ClosureCompiler.single_chained_call,
+    ChainedMethodCall: ClosureCompiler.chained_method_call,
+    FunctionDefinition: ClosureCompiler.function_definition,
+    FunctionCall: ClosureCompiler.function_call,
+}
+
+
+def with_deep_stack(fn: Callable[[], Any]) -> Any:
+    """
+    Call `fn` in a thread with a stack of `STACK_SIZE`, so that it can
+    recurse `RECURSION_LIMIT` Python calls deep, and return what it returns.
+    """
+    result: List[Any] = []
+    error: List[BaseException] = []
+
+    def target() -> None:
+        try:
+            result.append(fn())
+        except BaseException as e:
+            error.append(e)
+
+    limit = sys.getrecursionlimit()
+    size = threading.stack_size(STACK_SIZE)
+    sys.setrecursionlimit(RECURSION_LIMIT)
+    try:
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+    finally:
+        threading.stack_size(size)
+        sys.setrecursionlimit(limit)
+    if error:
+        raise error[0]
+    return result[0]
+
+
+def main(argv: List[str]) -> int:
+    argparser = argparse.ArgumentParser(
+        prog="main.py run",
+        description="Run a zuv file in-process, with the Python port of lib.js.",
+    )
+    argparser.add_argument("path")
+    argparser.add_argument(
+        "--no-fold",
+        dest="fold_constants",
+        action="store_false",
+        help="don't evaluate constant expressions before running",
+    )
+    args = argparser.parse_args(argv)
+
+    with open(args.path, "r") as file:
+        ast = compiler.parse_cached(file.read())
+    program = compile_program(ast, compiler.CompileFlags(fold_constants=args.fold_constants))
+    try:
+        with_deep_stack(program.run)
+    except ZuvError as e:
+        sys.stdout.flush()
+        print(f"Uncaught {e}", file=sys.stderr)
+        return 1
+    return 0
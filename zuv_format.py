@@ -0,0 +1,662 @@
+"""
+Formatting trees as source code: `python main.py fmt [options] PATH...`
+
+A tree is first flattened into a stream of document tokens: text, line
+breaks, indentation and groups. The layout then takes two linear passes. The
+first measures every group. The second prints each group on one line if it
+fits in what is left of the line, and breaks all of its lines otherwise. The
+work is linear in the size of the output, however deep the tree is.
+
+    format_ast(ast, width=80)   # zuv that parses back to the same tree
+    legacy_source(ast)          # what `as_source()` has always printed
+
+Formatting a file keeps its comments and blank lines between top-level
+statements. A statement with a comment inside it is copied unchanged.
+"""
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import lark
+
+import main as compiler
+from zuv_ast import (
+    ArrayLiteral,
+    ArrayParameter,
+    Assignment,
+    AstElement,
+    BlockExpression,
+    ChainedMethodCall,
+    ExpressionStatement,
+    FunctionCall,
+    FunctionDefinition,
+    IntLiteral,
+    LvalueArray,
+    LvalueName,
+    LvalueNameNonlocal,
+    LvalueTable,
+    MemberAccess,
+    MethodCall,
+    ModuleReference,
+    Name,
+    NamedParameter,
+    ObjectParameter,
+    SingleChainedCall,
+    StrLiteral,
+    TableEntry,
+    TableLiteral,
+)
+from zuv_batch import collect_sources, write_atomically
+from zuv_incremental import parse_statements
+
+
+DEFAULT_WIDTH = 80
+INDENT_WIDTH = 4
+
+# Document tokens: text is a str, everything else is one of these.
+LINE = 0       # a space, or a line break if its group is broken
+SOFTLINE = 1   # nothing, or a line break if its group is broken
+HARDLINE = 2   # always a line break; the groups around it are broken too
+BEGIN = 3      # start of a group
+END = 4
+INDENT = 5     # the line breaks up to the matching DEDENT are indented more
+DEDENT = 6
+
+Token = Union[str, int]
+
+# Where a node is written, in the zuv style. Method calls and chains can only
+# be written without parentheses in a statement (or on the right of `=`),
+# and the ones after a method's `:` can't contain method calls at all.
+STATEMENT = 0
+SHORTHAND = 1
+ARGUMENT = 2
+# a chained call followed by an `@` call, see `_ending`
+BEFORE_CALL = 3
+
+# a piece is a token, or a node to expand in its place
+Piece = Union[Token, Tuple[AstElement, int]]
+Rule = Callable[[AstElement, int], List[Piece]]
+
+
+class FormatError(ValueError):
+    pass
+
+
+def document(root: AstElement, rules: Dict[type, Rule], context: int = STATEMENT) -> List[Token]:
+    """
+    Expand `root` into document tokens. Each rule returns the pieces for one
+    node, and the nodes among them are expanded later, so every token is
+    produced exactly once.
+    """
+    tokens: List[Token] = []
+    stack: List[Piece] = [(root, context)]
+    while stack:
+        piece = stack.pop()
+        if isinstance(piece, tuple):
+            (node, node_context) = piece
+            rule = rules.get(type(node))
+            if rule is None:
+                raise NotImplementedError(f"can't format {type(node).__name__}")
+            stack.extend(reversed(rule(node, node_context)))
+        else:
+            tokens.append(piece)
+    return tokens
+
+
+def layout(tokens: List[Token], width: int = DEFAULT_WIDTH, indent_width: int = INDENT_WIDTH) -> str:
+    # Backwards: how much text follows each group before the next line break.
+    after = [0] * len(tokens)
+    run = 0
+    for i in range(len(tokens) - 1, -1, -1):
+        token = tokens[i]
+        if type(token) is str:
+            run += len(token)
+        elif token <= HARDLINE:
+            run = 0
+        elif token == END:
+            after[i] = run
+
+    # Forwards: the size of each group on one line, plus what follows it.
+    # Groups with a hard line break inside never fit.
+    size = [0] * len(tokens)
+    open_groups: List[Tuple[int, int, int]] = []
+    position = 0
+    hard_lines = 0
+    for (i, token) in enumerate(tokens):
+        if type(token) is str:
+            position += len(token)
+        elif token == LINE:
+            position += 1
+        elif token == HARDLINE:
+            hard_lines += 1
+        elif token == BEGIN:
+            open_groups.append((i, position, hard_lines))
+        elif token == END:
+            (begin, start, hard_lines_before) = open_groups.pop()
+            if hard_lines == hard_lines_before:
+                size[begin] = position - start + after[i]
+            else:
+                size[begin] = sys.maxsize
+
+    out: List[str] = []
+    column = 0
+    indent = 0
+    # how many groups deep we are inside a group printed on one line
+    flat = 0
+    for (i, token) in enumerate(tokens):
+        if type(token) is str:
+            out.append(token)
+            column += len(token)
+        elif token == BEGIN:
+            if flat or size[i] <= width - column:
+                flat += 1
+        elif token == END:
+            if flat:
+                flat -= 1
+        elif token == INDENT:
+            indent += indent_width
+        elif token == DEDENT:
+            indent -= indent_width
+        elif flat and token != HARDLINE:
+            if token == LINE:
+                out.append(" ")
+                column += 1
+        else:
+            out.append("\n" + " " * indent)
+            column = indent
+    return "".join(out)
+
+
+def format_ast(node: AstElement, width: int = DEFAULT_WIDTH, indent_width: int = INDENT_WIDTH) -> str:
+    """
+    `node` as zuv source, in lines of at most `width` characters where
+    possible. Each level is indented by `indent_width` more spaces, so for
+    machine-generated trees nested thousands of levels deep, 0 keeps the
+    output from growing with the square of the depth.
+    """
+    tokens = document(node, ZUV_RULES)
+    _separate_dots(tokens)
+    return layout(tokens, width, indent_width)
+
+
+def _separate_dots(tokens: List[Token]) -> None:
+    # three `.` that end nested calls in a row would be read as `...`
+    dots = 0
+    for (i, token) in enumerate(tokens):
+        if token == ".":
+            if dots == 2:
+                tokens[i] = " ."
+                dots = 0
+            dots += 1
+        elif type(token) is str or token <= HARDLINE:
+            dots = 0
+
+
+def legacy_source(node: AstElement) -> str:
+    return layout(document(node, LEGACY_RULES))
+
+
+# The zuv style
+
+def _enclose(pieces: List[Piece], context: int) -> List[Piece]:
+    # `f: x.` can be written as is in a statement, and as `(f: x)` elsewhere
+    if context == ARGUMENT:
+        return [BEGIN, "(", *pieces, ")", END]
+    return [BEGIN, *pieces, ".", END]
+
+
+def _sequence(open: str, items: List[List[Piece]], close: str) -> List[Piece]:
+    if not items:
+        return [open + close]
+    pieces: List[Piece] = [BEGIN, open, INDENT, SOFTLINE]
+    for (i, item) in enumerate(items):
+        if i:
+            pieces += [",", LINE]
+        pieces += item
+    pieces += [DEDENT, SOFTLINE, close, END]
+    return pieces
+
+
+def _body(body: AstElement, context: int, before_call: bool = False) -> List[Piece]:
+    """The statements after a `:`, on separate lines if there are several."""
+    statements = body.statements if isinstance(body, BlockExpression) else [body]
+    if not statements:
+        return [" "]
+    if len(statements) == 1:
+        return [
+            BEGIN, INDENT, LINE, *_statement(statements[0], context),
+            *_ending(statements[0], before_call), DEDENT, END,
+        ]
+    pieces: List[Piece] = [INDENT]
+    for stmt in statements:
+        pieces += [HARDLINE, *_statement(stmt, context)]
+    pieces += [*_ending(statements[-1], before_call), DEDENT]
+    return pieces
+
+
+def _ending(last: AstElement, before_call: bool) -> List[Piece]:
+    # The value of an assignment would go on with the `@` call that follows,
+    # as a method call. `;` ends the assignment.
+    return [";"] if before_call and isinstance(last, Assignment) else []
+
+
+def _starts_with_target(node: AstElement, context: int) -> bool:
+    # the parser decides from the first tokens: `[a,`, `[[a,`, `{a,` and so on
+    while True:
+        if isinstance(node, ArrayLiteral):
+            if not node.elements:
+                return False
+            if isinstance(node.elements[0], Name):
+                return True
+            (node, context) = (node.elements[0], ARGUMENT)
+        elif isinstance(node, TableLiteral):
+            return bool(node.entries) and isinstance(node.entries[0], TableEntry.KeyShorthand)
+        elif isinstance(node, ExpressionStatement):
+            node = node.expression
+        elif isinstance(node, MemberAccess):
+            (node, context) = (node.expression, ARGUMENT)
+        elif isinstance(node, FunctionCall) and (context == STATEMENT or not node.arguments):
+            (node, context) = (node.function, ARGUMENT)
+        elif isinstance(node, (MethodCall, ChainedMethodCall)) and context == STATEMENT:
+            node = node.expression if isinstance(node, MethodCall) else node.subject
+            context = ARGUMENT
+        else:
+            return False
+
+
+def _statement(node: AstElement, context: int) -> List[Piece]:
+    # A statement that starts like `[a, b]` or `{a, b}` would be read as the
+    # target of an assignment, so it goes in parentheses.
+    if not _starts_with_target(node, context):
+        return [(node, context)]
+    if not _starts_with_target(node, ARGUMENT):
+        # the parenthesized form of a call
+        return [(node, ARGUMENT)]
+    return ["(", (node, ARGUMENT), ")"]
+
+
+def _shorthand_function(arguments: List[AstElement]) -> Optional[FunctionDefinition]:
+    # `x @each! item: ...` passes the function that follows as the only argument
+    if len(arguments) != 1:
+        return None
+    function = arguments[0]
+    if (
+        isinstance(function, FunctionDefinition)
+        and isinstance(function.body, BlockExpression)
+        and function.body.implicit_return
+        and not any(_is_import(stmt) for stmt in function.body.statements)
+    ):
+        return function
+    return None
+
+
+def _arguments(arguments: List[AstElement], before_call: bool = False) -> List[Piece]:
+    function = _shorthand_function(arguments)
+    if function is None:
+        pieces: List[Piece] = [INDENT]
+        for arg in arguments:
+            # the arguments of a method are statements
+            pieces += [LINE, *_statement(arg, ARGUMENT)]
+        if arguments:
+            pieces += _ending(arguments[-1], before_call)
+        pieces.append(DEDENT)
+        return pieces
+    pieces = []
+    if function.parameters:
+        pieces.append("!")
+        for (i, param) in enumerate(function.parameters):
+            if i:
+                pieces.append(" ")
+            pieces.append((param, ARGUMENT))
+    pieces.append(":")
+    return pieces + _body(function.body, SHORTHAND, before_call)
+
+
+def _zuv_block(block: BlockExpression, context: int) -> List[Piece]:
+    pieces: List[Piece] = []
+    for (i, stmt) in enumerate(block.statements):
+        if i:
+            pieces.append(HARDLINE)
+        pieces += _statement(stmt, STATEMENT)
+    return pieces
+
+
+def _zuv_function(function: FunctionDefinition, context: int) -> List[Piece]:
+    pieces: List[Piece] = ["fn"]
+    for param in function.parameters:
+        pieces += [" ", (param, ARGUMENT)]
+    pieces.append(":")
+    pieces += _body(function.body, STATEMENT)
+    return _enclose(pieces, context)
+
+
+def _zuv_call(call: FunctionCall, context: int) -> List[Piece]:
+    if not call.arguments:
+        return [(call.function, ARGUMENT), "!"]
+    pieces: List[Piece] = [(call.function, ARGUMENT), ":", INDENT]
+    for arg in call.arguments:
+        pieces += [LINE, (arg, ARGUMENT)]
+    pieces.append(DEDENT)
+    # `f: x.` only as a statement of a function
+    return _enclose(pieces, STATEMENT if context == STATEMENT else ARGUMENT)
+
+
+def _zuv_method_call(call: MethodCall, context: int) -> List[Piece]:
+    pieces: List[Piece] = [(call.expression, ARGUMENT), " @", call.method_name]
+    pieces += _arguments(call.arguments)
+    return _enclose(pieces, STATEMENT if context == STATEMENT else ARGUMENT)
+
+
+def _zuv_chain(chain: ChainedMethodCall, context: int) -> List[Piece]:
+    pieces: List[Piece] = [BEGIN, (chain.subject, ARGUMENT), "...", INDENT]
+    for (i, call) in enumerate(chain.calls):
+        before_call = i + 1 < len(chain.calls) and chain.calls[i + 1].kind == "@"
+        pieces += [LINE, (call, BEFORE_CALL if before_call else ARGUMENT)]
+    pieces += [DEDENT, ".", END]
+    if context == STATEMENT:
+        return pieces
+    return ["(", *pieces, ")"]
+
+
+def _zuv_chained_call(call: SingleChainedCall, context: int) -> List[Piece]:
+    arguments = _arguments(call.arguments, context == BEFORE_CALL)
+    return [BEGIN, call.kind, call.method_name, *arguments, END]
+
+
+def _is_import(node: AstElement) -> bool:
+    return isinstance(node, Assignment) and isinstance(node.expression, ModuleReference)
+
+
+def _import(assignment: Assignment) -> List[Piece]:
+    names = ", ".join(assignment.target.names)  # type: ignore
+    return [f"import {_encode_string(assignment.expression.path)} {{{names}}}"]  # type: ignore
+
+
+def _zuv_assignment(assignment: Assignment, context: int) -> List[Piece]:
+    if _is_import(assignment):
+        return _import(assignment)
+    # the right side is an expression even where statements can't be method calls
+    value_context = ARGUMENT if context == ARGUMENT else STATEMENT
+    if isinstance(assignment.expression, FunctionCall):
+        value_context = ARGUMENT
+    return [(assignment.target, ARGUMENT), " = ", (assignment.expression, value_context)]
+
+
+def _zuv_table_entry(entry: TableEntry) -> List[Piece]:
+    if isinstance(entry, TableEntry.KeyValue):
+        [key, value] = entry
+        return [key + " ", (value, ARGUMENT)]
+    elif isinstance(entry, TableEntry.KeyShorthand):
+        [key] = entry
+        return [key]
+    elif isinstance(entry, TableEntry.GetterShorthand):
+        [key] = entry
+        return [key + "()"]
+    else:
+        assert False
+
+
+def _encode_string(value: str) -> str:
+    # the lexer takes any backslash escape, and the parser decodes it as JSON
+    return json.dumps(value, ensure_ascii=False)
+
+
+ZUV_RULES: Dict[type, Rule] = {
+    BlockExpression: _zuv_block,
+    ExpressionStatement: lambda stmt, context: [(stmt.expression, context)],
+    Name: lambda name, context: [name.value],
+    IntLiteral: lambda literal, context: [str(literal.value)],
+    StrLiteral: lambda literal, context: [_encode_string(literal.value)],
+    ArrayLiteral: lambda array, context: _sequence(
+        "[", [[(e, ARGUMENT)] for e in array.elements], "]"
+    ),
+    TableLiteral: lambda table, context: _sequence(
+        "{", [_zuv_table_entry(e) for e in table.entries], "}"
+    ),
+    LvalueName: lambda target, context: [target.name],
+    LvalueNameNonlocal: lambda target, context: ["<=" + target.name],
+    LvalueArray: lambda target, context: _sequence(
+        "[", [[(t, ARGUMENT)] for t in target.targets], "]"
+    ),
+    # without the trailing comma, `{a} = ...` would start with a table literal
+    LvalueTable: lambda target, context: ["{" + ", ".join(target.names) + ",}"],
+    Assignment: _zuv_assignment,
+    NamedParameter: lambda param, context: [param.name],
+    ObjectParameter: lambda param, context: ["{" + ", ".join(param.names) + "}"],
+    ArrayParameter: lambda param, context: ["[" + ", ".join(param.names) + "]"],
+    MemberAccess: lambda access, context: [(access.expression, ARGUMENT), "->" + access.member_name],
+    MethodCall: _zuv_method_call,
+    SingleChainedCall: _zuv_chained_call,
+    ChainedMethodCall: _zuv_chain,
+    FunctionDefinition: _zuv_function,
+    FunctionCall: _zuv_call,
+}
+
+
+# The legacy style: every part on one line, except for the statements of a
+# block and the calls of a chain, which are indented one more level than the
+# line they start on.
+
+def _legacy_block(block: BlockExpression, context: int) -> List[Piece]:
+    if len(block.statements) == 0:
+        return [" "]
+    elif len(block.statements) == 1:
+        return [(block.statements[0], context)]
+    pieces: List[Piece] = []
+    for stmt in block.statements:
+        pieces += [HARDLINE, INDENT, (stmt, STATEMENT), DEDENT]
+    if context == _NO_LEADING_LINE:
+        del pieces[0]
+    return pieces
+
+
+# a table entry's value starts on the key's line
+_NO_LEADING_LINE = -1
+
+
+def _legacy_items(open: str, items: List[List[Piece]], close: str) -> List[Piece]:
+    pieces: List[Piece] = [open]
+    for item in items:
+        pieces += [INDENT, *item, DEDENT, ", "]
+    pieces.append(close)
+    return pieces
+
+
+def _legacy_table_entry(entry: TableEntry) -> List[Piece]:
+    if isinstance(entry, TableEntry.KeyValue):
+        [key, value] = entry
+        return [key + " ", (value, _NO_LEADING_LINE)]
+    return _zuv_table_entry(entry)
+
+
+def _legacy_arguments(arguments: List[AstElement]) -> List[Piece]:
+    pieces: List[Piece] = []
+    for arg in arguments:
+        pieces += [" ", (arg, STATEMENT)]
+    return pieces
+
+
+def _legacy_chain(chain: ChainedMethodCall, context: int) -> List[Piece]:
+    pieces: List[Piece] = ["(", (chain.subject, STATEMENT), "..."]
+    for call in chain.calls:
+        pieces += [HARDLINE, INDENT, (call, STATEMENT), DEDENT]
+    pieces.append(" .)")
+    return pieces
+
+
+def _legacy_call(call: FunctionCall, context: int) -> List[Piece]:
+    if not call.arguments:
+        return [(call.function, STATEMENT), "!"]
+    return ["(", (call.function, STATEMENT), ":", *_legacy_arguments(call.arguments), ")"]
+
+
+def _legacy_function(function: FunctionDefinition, context: int) -> List[Piece]:
+    pieces: List[Piece] = ["(fn"]
+    for param in function.parameters:
+        pieces += [" ", (param, STATEMENT)]
+    return [*pieces, ": ", (function.body, STATEMENT), ")"]
+
+
+LEGACY_RULES: Dict[type, Rule] = {
+    **ZUV_RULES,
+    BlockExpression: _legacy_block,
+    StrLiteral: lambda literal, context: [literal._encode()],
+    ArrayLiteral: lambda array, context: (
+        _legacy_items("[", [[(e, STATEMENT)] for e in array.elements], "]")
+        if array.elements else ["[]"]
+    ),
+    TableLiteral: lambda table, context: (
+        _legacy_items("{", [_legacy_table_entry(e) for e in table.entries], "}")
+        if table.entries else ["{}"]
+    ),
+    LvalueNameNonlocal: lambda target, context: ["outer ", target.name],
+    LvalueTable: lambda target, context: ["{" + ", ".join(target.names) + "}"],
+    LvalueArray: lambda target, context: [
+        "[", *(p for t in target.targets for p in ((t, STATEMENT), ", ")), "]"
+    ],
+    Assignment: lambda assignment, context: _import(assignment) if _is_import(assignment) else [
+        (assignment.target, STATEMENT), " = ", (assignment.expression, STATEMENT)
+    ],
+    ObjectParameter: lambda param, context: ["{", *(name + "," for name in param.names), "}"],
+    ArrayParameter: lambda param, context: ["[", *(name + "," for name in param.names), "]"],
+    MemberAccess: lambda access, context: [(access.expression, STATEMENT), "->", access.member_name],
+    MethodCall: lambda call, context: [
+        "(", (call.expression, STATEMENT), " @", call.method_name,
+        *_legacy_arguments(call.arguments), ")",
+    ],
+    SingleChainedCall: lambda call, context: [
+        call.kind, call.method_name, *_legacy_arguments(call.arguments)
+    ],
+    ChainedMethodCall: _legacy_chain,
+    FunctionDefinition: _legacy_function,
+    FunctionCall: _legacy_call,
+}
+
+
+# Files
+
+def _separator(source: str, start: int, end: int, before_comment: bool) -> str:
+    # keep up to two blank lines, and comments at the end of a line there
+    newlines = source.count("\n", start, end)
+    if newlines == 0 and before_comment:
+        return " "
+    return "\n" * min(max(newlines, 1), 3)
+
+
+def format_source(source: str, width: int = DEFAULT_WIDTH) -> str:
+    """Format a whole file. Raises `FormatError` if the result would mean something else."""
+    (chunks, _) = parse_statements(source)
+    tokens = list(compiler.get_parser().lex(source, dont_ignore=True))
+    comments = [t for t in tokens if t.type == "COMMENT"]
+    code = [t for t in tokens if t.type not in ("COMMENT", "WS")]
+
+    out: List[str] = []
+    position = 0
+    next_comment = 0
+    next_code = 0
+
+    def copy_comments(limit: int) -> None:
+        nonlocal position, next_comment
+        while next_comment < len(comments) and comments[next_comment].start_pos < limit:
+            comment = comments[next_comment]
+            if out:
+                out.append(_separator(source, position, comment.start_pos, True))
+            out.append(comment.value.rstrip())
+            position = comment.end_pos
+            next_comment += 1
+
+    for (i, chunk) in enumerate(chunks):
+        copy_comments(chunk.start)
+        limit = chunks[i + 1].start if i + 1 < len(chunks) else len(source)
+        while next_code < len(code) and code[next_code].start_pos < limit:
+            next_code += 1
+        end = code[next_code - 1].end_pos
+        if out:
+            out.append(_separator(source, position, chunk.start, False))
+        if next_comment < len(comments) and comments[next_comment].start_pos < end:
+            # comments are only kept between statements
+            out.append(source[chunk.start:end])
+            while next_comment < len(comments) and comments[next_comment].start_pos < end:
+                next_comment += 1
+        else:
+            # as a statement of the top-level block, so that it's parenthesized like one
+            out.append(format_ast(BlockExpression([chunk.statement], implicit_return=False), width))
+        position = end
+    copy_comments(len(source))
+    if out:
+        out.append("\n")
+    result = "".join(out)
+
+    try:
+        reparsed = compiler.parse(result)
+    except lark.exceptions.LarkError as e:
+        raise FormatError(f"the formatted source doesn't parse: {e}") from e
+    assert isinstance(reparsed, BlockExpression)
+    if reparsed.statements != [c.statement for c in chunks]:
+        raise FormatError("the formatted source would parse differently")
+    return result
+
+
+def _format_job(job: Tuple[str, int]) -> Tuple[Optional[str], Optional[str]]:
+    """Returns the formatted file if it changed, and the error if it failed."""
+    (path, width) = job
+    try:
+        with open(path, "r") as file:
+            source = file.read()
+        formatted = format_source(source, width)
+    except Exception as e:
+        return (None, f"{type(e).__name__}: {e}")
+    return (formatted if formatted != source else None, None)
+
+
+def main(argv: List[str]) -> int:
+    argparser = argparse.ArgumentParser(
+        prog="main.py fmt",
+        description="Format zuv files in place.",
+    )
+    argparser.add_argument("paths", nargs="+", help="files or directories with .zuv files")
+    argparser.add_argument("-w", "--width", type=int, default=DEFAULT_WIDTH, help="maximum line width")
+    argparser.add_argument("--check", action="store_true", help="don't write anything, fail if a file isn't formatted")
+    argparser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes")
+    argparser.add_argument("-q", "--quiet", action="store_true", help="only print the summary")
+    args = argparser.parse_args(argv)
+
+    start = time.perf_counter()
+    paths = [path for (path, _root) in collect_sources(args.paths)]
+    work = [(path, args.width) for path in paths]
+    if args.jobs == 1 or len(paths) <= 1:
+        results = map(_format_job, work)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(args.jobs)
+        results = executor.map(_format_job, work, chunksize=4)
+
+    changed = 0
+    failed = 0
+    try:
+        for (path, (formatted, error)) in zip(paths, results):
+            if error is not None:
+                failed += 1
+                print(f"error {path}: {error}", file=sys.stderr)
+            elif formatted is not None:
+                changed += 1
+                if not args.check:
+                    write_atomically(path, formatted)
+                if not args.quiet:
+                    action = "would reformat" if args.check else "formatted"
+                    print(f"{action} {path}", file=sys.stderr)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    elapsed = time.perf_counter() - start
+    action = "would be reformatted" if args.check else "reformatted"
+    print(
+        f"{len(paths)} files, {changed} {action}, {failed} errors in {elapsed:.3f} s",
+        file=sys.stderr,
+    )
+    return 1 if failed or (args.check and changed) else 0
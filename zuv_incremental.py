@@ -0,0 +1,236 @@
+"""
+Incremental compilation of a single file.
+
+The source is kept as a list of top-level statements. An edit only reparses
+the statements around it: parsing starts one statement before the edit and
+stops as soon as the parser reaches a statement boundary that existed before
+the edit, after which the old statements (and their generated JS) are reused.
+
+    compilation = IncrementalCompilation(source)
+    compilation.edit(start, end, "replacement")   # byte offsets
+    js = compilation.to_js()
+
+The output is identical to compiling the whole file from scratch.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Set, Tuple
+
+import zuv_ast
+import zuv_scope
+import zuv_types
+from zuv_optimize import FOLDED_GLOBALS, ConstantFolder, declared_names
+
+import main as compiler
+
+
+@dataclass
+class Chunk:
+    # offset of the first token of the statement
+    start: int
+    # type of that token; a boundary only matches if it is lexed the same way
+    first_token: str
+    statement: zuv_ast.Statement
+    js: Optional[str] = None
+    local_names: Set[str] = frozenset()  # type: ignore
+    nonlocal_names: Set[str] = frozenset()  # type: ignore
+    # runtime globals this statement redefines, and the ones that were
+    # redefined somewhere in the file when `js` was generated
+    shadows: Optional[Set[str]] = None
+    folded_with: Optional[Set[str]] = None
+
+
+def _star_state(parse_conf) -> int:
+    """The parser state after one or more complete top-level statements."""
+    start_state = parse_conf.start_state
+    for (symbol, (_action, new_state)) in parse_conf.states[start_state].items():
+        if symbol.startswith("__start_star"):
+            return new_state
+    raise RuntimeError("`start` is expected to be `statement*`")
+
+
+def parse_statements(
+    text: str,
+    offset: int = 0,
+    sync: Optional[Callable[[int, str], bool]] = None,
+) -> Tuple[List[Chunk], Optional[int]]:
+    """
+    Parse `text` (which starts at `offset` in the file) into top-level
+    statements.
+
+    `sync(position, token_type)` is called at every statement boundary after
+    the first one. If it returns true, parsing stops there and the position is
+    returned alongside the statements parsed so far.
+    """
+    interactive = compiler.get_parser().parse_interactive(text)
+    state = interactive.parser_state
+    star = _star_state(state.parse_conf)
+
+    starts: List[Tuple[int, str]] = []
+    token = None
+    for token in interactive.lexer_thread.lex(state):
+        state.feed_token(token)
+        stack = state.state_stack
+        if len(stack) == 2 or (len(stack) == 3 and stack[1] == star):
+            position = offset + token.start_pos
+            if starts and sync is not None and sync(position, token.type):
+                statements = state.value_stack[0].children if len(stack) == 3 else []
+                return (_chunks(starts, statements), position)
+            starts.append((position, token.type))
+
+    block = interactive.feed_eof(token)
+    assert isinstance(block, zuv_ast.BlockExpression)
+    return (_chunks(starts, block.statements), None)
+
+
+def _chunks(starts: List[Tuple[int, str]], statements) -> List[Chunk]:
+    assert len(starts) == len(statements)
+    return [
+        Chunk(start, first_token, stmt)
+        for ((start, first_token), stmt) in zip(starts, statements)
+    ]
+
+
+class IncrementalCompilation:
+    def __init__(self, source: str, flags: compiler.CompileFlags = compiler.CompileFlags()):
+        if flags.hoist_literals:
+            raise ValueError("hoisting literals needs the whole program")
+        self.source = source
+        self.flags = flags
+        self._chunks: Optional[List[Chunk]] = None
+        self._reparse_all()
+
+    def _reparse_all(self):
+        self._chunks = None
+        (self._chunks, _) = parse_statements(self.source)
+
+    @property
+    def ast(self) -> zuv_ast.BlockExpression:
+        assert self._chunks is not None
+        return zuv_ast.BlockExpression(
+            [c.statement for c in self._chunks], implicit_return=False
+        )
+
+    def _char_offset(self, byte_offset: int) -> int:
+        if self.source.isascii():
+            return byte_offset
+        return len(self.source.encode()[:byte_offset].decode())
+
+    def edit(self, start: int, end: int, replacement: str) -> None:
+        """Replace the bytes `start:end` of the (UTF-8) source with `replacement`."""
+        start = self._char_offset(start)
+        end = self._char_offset(end)
+        old_chunks = self._chunks
+        self.source = self.source[:start] + replacement + self.source[end:]
+
+        if old_chunks is None:
+            # the previous edit left the file unparseable
+            self._reparse_all()
+            return
+
+        # The statement before the edit has to be reparsed too: its end was
+        # decided by looking at the token the edit might have changed.
+        first = 0
+        while first < len(old_chunks) and old_chunks[first].start <= start:
+            first += 1
+        first = max(0, first - 2)
+        region_start = old_chunks[first].start if first > 0 else 0
+
+        delta = len(replacement) - (end - start)
+        by_start = {
+            c.start: (i, c.first_token)
+            for (i, c) in enumerate(old_chunks[first:], first)
+            if c.start >= end
+        }
+
+        def sync(position, token_type):
+            old = by_start.get(position - delta)
+            return old is not None and old[1] == token_type
+
+        self._chunks = None
+        try:
+            (new_chunks, synced_at) = parse_statements(
+                self.source[region_start:], region_start, sync
+            )
+        except Exception:
+            # reparse everything, so that the error points at the right line
+            self._reparse_all()
+            return
+        reused: List[Chunk] = []
+        if synced_at is not None:
+            (index, _) = by_start[synced_at - delta]
+            for c in old_chunks[index:]:
+                c.start += delta
+                reused.append(c)
+        self._chunks = old_chunks[:first] + new_chunks + reused
+
+    def to_js(self) -> str:
+        assert self._chunks is not None
+        # constant folding, unboxing and tail loops depend on which runtime
+        # globals the file redefines
+        shadowed: Set[str] = set()
+        for chunk in self._chunks:
+            if chunk.shadows is None:
+                redefined = declared_names(chunk.statement) & (
+                    FOLDED_GLOBALS | zuv_types.UNBOXED_GLOBALS | zuv_ast.BRANCH_GLOBALS
+                )
+                chunk.shadows = frozenset(redefined)  # type: ignore
+            shadowed |= chunk.shadows  # type: ignore
+
+        # Each statement is resolved on its own. Only the top-level names can
+        # clash between statements, and they keep their names in the JS.
+        local_names: Set[str] = set()
+        nonlocal_names: Set[str] = set()
+        failed = False
+        options = compiler.js_options_for(self.flags)
+        options.shadowed = frozenset(shadowed)
+        for chunk in self._chunks:
+            if chunk.js is None or chunk.folded_with != shadowed:
+                _emit(chunk, shadowed, self.flags, options)
+            if chunk.js is None or (chunk.local_names & nonlocal_names) or (chunk.nonlocal_names & local_names):
+                failed = True
+            local_names |= chunk.local_names
+            nonlocal_names |= chunk.nonlocal_names
+        if failed:
+            # resolve the whole file to raise the same errors that a full
+            # compilation would
+            ast: zuv_ast.AstElement = self.ast
+            if self.flags.fold_constants:
+                ast = ConstantFolder(shadowed).fold(ast)
+            zuv_scope.resolve(ast, self.flags.minify)
+
+        parts = ["{ "]
+        parts.extend(chunk.js for chunk in self._chunks)  # type: ignore
+        parts.append("}")
+        if self.flags.minify:
+            return "".join(zuv_ast.minify_js(parts))
+        return "".join(parts)
+
+
+def _emit(
+    chunk: Chunk,
+    shadowed: Set[str],
+    flags: compiler.CompileFlags,
+    options: zuv_ast.JsOptions,
+) -> None:
+    chunk.folded_with = set(shadowed)
+    chunk.local_names = chunk.nonlocal_names = frozenset()  # type: ignore
+    stmt = chunk.statement
+    if flags.fold_constants:
+        folder = ConstantFolder(shadowed)
+        stmt = folder.fold(stmt)
+        if folder.is_dead(stmt):
+            # folding drops it from the top-level block
+            chunk.js = ""
+            return
+    block = zuv_ast.BlockExpression([stmt], implicit_return=False)
+    try:
+        top = zuv_scope.resolve(block, flags.minify)
+    except zuv_scope.ScopeError:
+        chunk.js = None
+        return
+    if flags.unbox:
+        zuv_types.infer(block, shadowed)
+    chunk.js = "".join(zuv_ast.js_parts(zuv_ast.statement_js_iter(stmt, options, False), options))
+    chunk.local_names = frozenset(top.local_names)  # type: ignore
+    chunk.nonlocal_names = frozenset(top.nonlocal_names)  # type: ignore
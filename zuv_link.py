@@ -0,0 +1,299 @@
+"""
+Modules: `python main.py link [options] ENTRY`
+
+    import "shared/problems" {Problem, assert}
+
+assigns names that another file exports, and every name that a file
+assigns at its top level is exported. The path is relative to the
+importing file, and `.zuv` is added if it has no extension.
+
+Each file is compiled on its own into a unit: a JS function that takes the
+exports of the modules it imports and returns its own. A unit doesn't
+depend on what it imports, so units are cached by their source alone (like
+the outputs of `zuv_batch`), with the names each one imports and exports.
+Linking checks the imported names against the exports, and writes the units
+in dependency order, each one called with the exports of its imports:
+
+    {
+    const $m0 = (() => { ...; return {Problem, assert}; })();
+    (($i0) => { var {Problem, assert} = $i0; ...; return {...}; })($m0);
+    }
+
+A `Linker` remembers the mtime and size of every file it compiled, in
+memory and in a manifest next to the units, so relinking only reads and
+compiles the files that changed; the others cost a `stat` and loading
+their unit. The entry is a unit too: its names are not globals.
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import main as compiler
+import zuv_ast
+from zuv_ast import (
+    Assignment,
+    AstElement,
+    BlockExpression,
+    FunctionDefinition,
+    LvalueName,
+    LvalueTable,
+    ModuleReference,
+    Symbol,
+)
+from zuv_batch import SOURCE_EXTENSION, OutputCache, compiler_fingerprint, source_key, write_atomically
+
+
+class LinkError(ValueError):
+    pass
+
+
+@dataclass
+class Unit:
+    js: str
+    # the paths as written after `import`, in the order of the unit's
+    # parameters, with the names imported from each
+    imports: Dict[str, List[str]]
+    exports: List[str]
+
+
+_UNIT_HEADER = "// zuv unit "
+
+
+def dump_unit(unit: Unit) -> str:
+    header = json.dumps({"imports": unit.imports, "exports": unit.exports}, ensure_ascii=False)
+    return f"{_UNIT_HEADER}{header}\n{unit.js}"
+
+
+def load_unit(text: str) -> Unit:
+    (header, js) = text.split("\n", 1)
+    if not header.startswith(_UNIT_HEADER):
+        raise ValueError("not a compiled unit")
+    fields = json.loads(header[len(_UNIT_HEADER):])
+    return Unit(js, fields["imports"], fields["exports"])
+
+
+def imported_names(root: AstElement) -> Dict[str, List[str]]:
+    """The modules that `root` imports, in order, and the names it takes from each."""
+    imports: Dict[str, List[str]] = {}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Assignment) and isinstance(node.expression, ModuleReference):
+            names = imports.setdefault(node.expression.path, [])
+            names += [name for name in node.target.names if name not in names]  # type: ignore
+        stack.extend(reversed(list(node.children())))
+    return imports
+
+
+def exported_symbols(root: AstElement) -> List[Symbol]:
+    """What `root` assigns at its top level (after `zuv_scope.resolve`)."""
+    symbols: Dict[str, Symbol] = {}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, FunctionDefinition):
+            continue
+        if isinstance(node, LvalueName):
+            symbols.setdefault(node.name, node.symbol)  # type: ignore
+        elif isinstance(node, LvalueTable):
+            for (name, symbol) in zip(node.names, node.symbols):
+                symbols.setdefault(name, symbol)
+        stack.extend(reversed(list(node.children())))
+    return [symbol for symbol in symbols.values() if symbol.kind == "local"]
+
+
+def compile_unit(source: str, flags: compiler.CompileFlags = compiler.CompileFlags()) -> Unit:
+    ast = compiler.prepare_program(compiler.parse_cached(source, flags.parser), flags)
+    assert isinstance(ast, BlockExpression)
+    imports = imported_names(ast)
+    exports = exported_symbols(ast)
+    options = compiler.js_options_for(flags)
+    options.shadowed = zuv_ast.declared_names(ast) & zuv_ast.BRANCH_GLOBALS
+    options.imports = {path: f"$i{i}" for (i, path) in enumerate(imports)}
+    if flags.hoist_literals:
+        options.constants = zuv_ast.collect_constants(ast, zuv_ast.declared_names(ast) & zuv_ast.LITERAL_CONSTRUCTORS)
+    if flags.intern:
+        options.memo = zuv_ast.shared_nodes(ast)
+    sink = io.StringIO()
+    parts = zuv_ast.js_parts(zuv_ast.module_js_iter(ast, options, exports), options)
+    zuv_ast.write_js_parts(parts, options, sink)
+    return Unit(sink.getvalue(), imports, [symbol.name for symbol in exports])
+
+
+def resolve_import(importer: str, path: str) -> str:
+    resolved = os.path.join(os.path.dirname(importer), path)
+    if not os.path.splitext(resolved)[1]:
+        resolved += SOURCE_EXTENSION
+    return os.path.normpath(resolved)
+
+
+class Linker:
+    """
+    Links programs, keeping the units it compiled (or loaded from the cache)
+    between calls to `link`.
+    """
+
+    def __init__(self, flags: compiler.CompileFlags = compiler.CompileFlags(), cache_dir: Optional[str] = None):
+        self.flags = flags
+        self.cache = OutputCache(cache_dir or os.path.join(compiler.CACHE_DIR, "zuv_units"))
+        h = hashlib.sha256(compiler_fingerprint().encode())
+        h.update(repr(flags).encode())
+        self.manifest_path = os.path.join(self.cache.directory, f"manifest.{h.hexdigest()[:16]}.json")
+        # file -> (mtime_ns, size, key) of the source its unit was compiled from
+        self.stamps: Dict[str, Tuple[int, int, str]] = self._load_manifest()
+        self.units: Dict[str, Tuple[str, Unit]] = {}
+        # what the last `link` put together, and which of those it compiled
+        self.modules: List[str] = []
+        self.compiled: List[str] = []
+
+    def _load_manifest(self) -> Dict[str, Tuple[int, int, str]]:
+        try:
+            with open(self.manifest_path) as file:
+                return {path: tuple(stamp) for (path, stamp) in json.load(file).items()}  # type: ignore
+        except (OSError, ValueError):
+            return {}
+
+    def _cached_unit(self, key: str) -> Optional[Unit]:
+        cached = self.cache.get(key)
+        if cached is None:
+            return None
+        try:
+            with open(cached) as file:
+                return load_unit(file.read())
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def unit(self, path: str) -> Unit:
+        """The unit of `path`, compiled only if the file changed."""
+        stat = os.stat(path)
+        stamp = self.stamps.get(path)
+        if stamp is not None and stamp[:2] == (stat.st_mtime_ns, stat.st_size):
+            known = self.units.get(path)
+            if known is not None and known[0] == stamp[2]:
+                return known[1]
+            unit = self._cached_unit(stamp[2])
+            if unit is not None:
+                self.units[path] = (stamp[2], unit)
+                return unit
+        with open(path, "rb") as file:
+            source = file.read()
+        key = source_key(source, self.flags)
+        unit = self._cached_unit(key)
+        if unit is None:
+            try:
+                unit = compile_unit(source.decode(), self.flags)
+            except Exception as e:
+                raise LinkError(f"{os.path.relpath(path)}: {type(e).__name__}: {e}") from e
+            self.cache.put(key, dump_unit(unit))
+            self.compiled.append(path)
+        self.stamps[path] = (stat.st_mtime_ns, stat.st_size, key)
+        self.units[path] = (key, unit)
+        return unit
+
+    def link(self, entry: str) -> str:
+        """The JS of `entry` and everything it imports. Raises `LinkError`."""
+        self.compiled = []
+        entry = os.path.abspath(entry)
+        units: Dict[str, Unit] = {}
+        targets: Dict[str, List[str]] = {}
+        order: List[str] = []
+        # a depth-first walk of the imports: files come after what they import
+        stack: List[Tuple[str, Iterator[str]]] = []
+
+        def visit(path: str, importer: Optional[str]) -> None:
+            try:
+                unit = units[path] = self.unit(path)
+            except OSError as e:
+                imported = f" (imported by {os.path.relpath(importer)})" if importer is not None else ""
+                raise LinkError(f"can't read {os.path.relpath(path)}{imported}: {e.strerror}") from e
+            targets[path] = [resolve_import(path, imported) for imported in unit.imports]
+            stack.append((path, iter(targets[path])))
+
+        visit(entry, None)
+        done = set()
+        while stack:
+            (path, pending) = stack[-1]
+            for target in pending:
+                if target not in units:
+                    visit(target, path)
+                    break
+                if target not in done:
+                    cycle = [p for (p, _) in stack[[p for (p, _) in stack].index(target):]] + [target]
+                    raise LinkError("import cycle: " + " -> ".join(map(os.path.relpath, cycle)))
+            else:
+                stack.pop()
+                done.add(path)
+                order.append(path)
+
+        for path in order:
+            for ((imported, names), target) in zip(units[path].imports.items(), targets[path]):
+                missing = [name for name in names if name not in units[target].exports]
+                if missing:
+                    raise LinkError(
+                        f'{os.path.relpath(path)}: "{imported}" doesn\'t export {", ".join(missing)}'
+                    )
+
+        self._save_manifest()
+        self.modules = order
+        return self._bundle(entry, order, units, targets)
+
+    def _bundle(self, entry: str, order: List[str], units: Dict[str, Unit], targets: Dict[str, List[str]]) -> str:
+        minify = self.flags.minify
+        names = {path: f"$m{i}" for (i, path) in enumerate(order)}
+        out = ["{" if minify else "{\n"]
+        for path in order:
+            if not minify:
+                out.append(f"// {os.path.relpath(path, os.path.dirname(entry))}\n")
+            if path != entry:
+                out.append(f"const {names[path]}=" if minify else f"const {names[path]} = ")
+            arguments = ("," if minify else ", ").join(names[target] for target in targets[path])
+            out.append(f"{units[path].js}({arguments});" if minify else f"{units[path].js}({arguments});\n")
+        out.append("}")
+        return "".join(out)
+
+    def _save_manifest(self) -> None:
+        try:
+            os.makedirs(self.cache.directory, exist_ok=True)
+            write_atomically(self.manifest_path, json.dumps(self.stamps))
+        except OSError:
+            pass
+
+
+def main(argv: List[str]) -> int:
+    argparser = argparse.ArgumentParser(
+        prog="main.py link",
+        description="Compile a zuv file and the modules it imports into one script,"
+        " recompiling only the files that changed.",
+    )
+    argparser.add_argument("entry")
+    argparser.add_argument("-o", "--output", help="where to write the script (default: stdout)")
+    argparser.add_argument("--cache-dir", default=None, help="where to keep compiled units")
+    argparser.add_argument("-q", "--quiet", action="store_true", help="don't report what was compiled")
+    compiler.add_flag_arguments(argparser)
+    args = argparser.parse_args(argv)
+
+    start = time.perf_counter()
+    linker = Linker(compiler.flags_from_args(args), args.cache_dir)
+    try:
+        js = linker.link(args.entry)
+    except LinkError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    if args.output is None:
+        sys.stdout.write(js + "\n")
+    else:
+        write_atomically(args.output, js + "\n")
+    if not args.quiet:
+        print(
+            f"{len(linker.modules)} modules, {len(linker.compiled)} compiled"
+            f" in {time.perf_counter() - start:.3f} s",
+            file=sys.stderr,
+        )
+    return 0
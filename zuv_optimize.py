@@ -0,0 +1,292 @@
+"""
+AST-to-AST optimizations that run between `ZuvTransformer` and `to_js`.
+
+`fold_constants` evaluates the pure runtime operations of `lib.js` when all
+their operands are literals:
+
+    (3 @add 4)                 -> 7
+    (eq: 3 3)                  -> True
+    (concat: "a" 1 "b")        -> "a1b"
+    (True @if: x.)             -> (fn: x.)!
+    False @if: x.  (discarded) -> nothing
+
+Branches are only taken or dropped if their arguments are functions without
+parameters, since any other argument is evaluated either way.
+
+Anything that would fail at runtime, like a division by zero, is left alone
+so that it still fails the same way, and so are integers the runtime can't
+hold exactly (`Integer(...)` of a JS number past 2**53). Runtime globals
+(`eq`, `concat`, `True`, `False`, and the `Integer` and `String` that box
+literals) are only folded if the program never declares a variable with
+that name.
+
+`intern_subtrees` makes identical subtrees that don't contain names one
+shared object (hash-consing), so that their JS can be generated once.
+"""
+
+from typing import Dict, Optional, Set, Union
+
+from zuv_ast import (
+    ArrayLiteral,
+    AstElement,
+    BlockExpression,
+    FunctionCall,
+    IntLiteral,
+    MemberAccess,
+    MethodCall,
+    Name,
+    StrLiteral,
+    TableEntry,
+    TableLiteral,
+    declared_names,
+    is_thunk,
+    map_tree,
+    structure_fields,
+)
+
+
+# the globals from `lib.js` that folding relies on
+FOLDED_GLOBALS = frozenset({"True", "False", "eq", "concat", "Integer", "String"})
+
+# integers outside of this range can't be written as an exact JS number
+_MAX_SAFE_INTEGER = 2**53 - 1
+
+Literal = Union[IntLiteral, StrLiteral]
+
+
+def _js_rem(n: int, m: int) -> int:
+    # BigInt `%`: the sign follows the dividend
+    r = abs(n) % abs(m)
+    return -r if n < 0 else r
+
+
+def _int_method(n: int, method: str, m: int) -> Optional[Union[int, bool]]:
+    if method == "add":
+        return n + m
+    elif method == "sub":
+        return n - m
+    elif method == "mul":
+        return n * m
+    elif method == "div":
+        if m == 0:
+            return None
+        # BigInt division truncates towards zero
+        q = abs(n) // abs(m)
+        return q if (n < 0) == (m < 0) else -q
+    elif method == "mod":
+        if m == 0:
+            return None
+        return _js_rem(n, m) if m >= 0 else _js_rem(n, m) + m
+    elif method == "gt":
+        return n > m
+    elif method == "lt":
+        return n < m
+    elif method == "eq":
+        return n == m
+    elif method == "ge":
+        return n >= m
+    elif method == "le":
+        return n <= m
+    return None
+
+
+def _as_str(literal: Literal) -> str:
+    if isinstance(literal, IntLiteral):
+        return str(literal.value)
+    return literal.value
+
+
+class ConstantFolder:
+    def __init__(self, shadowed: Set[str]):
+        self.shadowed = shadowed
+
+    def _global(self, node: AstElement, name: str) -> bool:
+        return isinstance(node, Name) and node.value == name and name not in self.shadowed
+
+    def _bool(self, value: bool) -> Optional[AstElement]:
+        name = "True" if value else "False"
+        return None if name in self.shadowed else Name(name)
+
+    def _literal(self, node: AstElement) -> bool:
+        """A literal that the runtime's own constructor boxes exactly."""
+        if isinstance(node, IntLiteral):
+            return abs(node.value) <= _MAX_SAFE_INTEGER and "Integer" not in self.shadowed
+        return isinstance(node, StrLiteral) and "String" not in self.shadowed
+
+    def _known_bool(self, node: AstElement) -> Optional[bool]:
+        if self._global(node, "True"):
+            return True
+        if self._global(node, "False"):
+            return False
+        return None
+
+    def fold(self, node: AstElement) -> AstElement:
+        return map_tree(node, self._fold_node)
+
+    def _fold_node(self, node: AstElement) -> AstElement:
+        # the children are folded already
+        if isinstance(node, MethodCall):
+            return self._fold_method_call(node) or node
+        elif isinstance(node, FunctionCall):
+            return self._fold_function_call(node) or node
+        elif isinstance(node, BlockExpression):
+            return self._fold_block(node)
+        return node
+
+    def _fold_method_call(self, node: MethodCall) -> Optional[AstElement]:
+        subject = node.expression
+        args = node.arguments
+        if isinstance(subject, IntLiteral) and len(args) == 1 and isinstance(args[0], IntLiteral):
+            if not (self._literal(subject) and self._literal(args[0])):
+                return None
+            result = _int_method(subject.value, node.method_name, args[0].value)
+            if isinstance(result, bool):
+                return self._bool(result)
+            if result is not None and abs(result) <= _MAX_SAFE_INTEGER:
+                return IntLiteral(result)
+            return None
+
+        condition = self._known_bool(subject)
+        # an argument that isn't a thunk runs whether or not its branch is taken
+        if condition is None or not all(is_thunk(a) for a in args):
+            return None
+        if node.method_name in ("if", "else") and len(args) == 1:
+            if condition == (node.method_name == "if"):
+                return FunctionCall(args[0], [])
+        elif node.method_name == "?" and len(args) == 2:
+            return FunctionCall(args[0] if condition else args[1], [])
+        return None
+
+    def _fold_function_call(self, node: FunctionCall) -> Optional[AstElement]:
+        args = node.arguments
+        if not all(self._literal(a) for a in args):
+            return None
+        if self._global(node.function, "eq") and len(args) == 2:
+            (a, b) = args
+            return self._bool(type(a) is type(b) and a.value == b.value)  # type: ignore
+        if self._global(node.function, "concat") and "String" not in self.shadowed:
+            return StrLiteral("".join(_as_str(a) for a in args))  # type: ignore
+        return None
+
+    def is_dead(self, stmt: AstElement) -> bool:
+        """A statement whose only effect is a branch that is never taken."""
+        if not isinstance(stmt, MethodCall) or len(stmt.arguments) != 1 or not is_thunk(stmt.arguments[0]):
+            return False
+        condition = self._known_bool(stmt.expression)
+        if condition is None:
+            return False
+        return (
+            (stmt.method_name == "if" and not condition)
+            or (stmt.method_name == "else" and condition)
+        )
+
+    def _fold_block(self, node: BlockExpression) -> BlockExpression:
+        # values of all statements but the last one (if it's returned) are unused
+        last = len(node.statements) - 1 if node.implicit_return else len(node.statements)
+        statements = [
+            stmt for (i, stmt) in enumerate(node.statements)
+            if i >= last or not self.is_dead(stmt)
+        ]
+        if len(statements) == len(node.statements):
+            return node
+        return BlockExpression(statements, node.implicit_return)
+
+
+def fold_constants(root: AstElement, shadowed: Optional[Set[str]] = None) -> AstElement:
+    """
+    Fold constant expressions in `root`. `shadowed` are the runtime globals
+    that the program redefines; by default they are looked up in `root`.
+    """
+    if shadowed is None:
+        shadowed = declared_names(root) & FOLDED_GLOBALS
+    return ConstantFolder(shadowed).fold(root)
+
+
+# The nodes that can be shared: their JS doesn't depend on where they are
+# as long as there is no name in them. Functions are never shared, since
+# each is a scope of its own, and neither are names, which get a symbol.
+INTERNED_TYPES = (IntLiteral, StrLiteral, ArrayLiteral, TableLiteral, MemberAccess, MethodCall, FunctionCall)
+
+def _share_children(node: AstElement, interned: Dict[int, AstElement]) -> None:
+    """Replace the children of `node` that have an interned copy with it."""
+    for name in structure_fields(type(node)):
+        value = getattr(node, name)
+        if isinstance(value, AstElement):
+            if id(value) in interned:
+                setattr(node, name, interned[id(value)])
+        elif isinstance(value, list):
+            for (i, item) in enumerate(value):
+                if isinstance(item, TableEntry.KeyValue):
+                    if id(item[1]) in interned:
+                        value[i] = TableEntry.KeyValue(item[0], interned[id(item[1])])
+                elif id(item) in interned:
+                    value[i] = interned[id(item)]
+
+
+def _structural_key(node: AstElement, keys: Dict[int, tuple]) -> Optional[tuple]:
+    """
+    What identifies `node` among the interned nodes: its type, its values,
+    and its children, which are interned already, by identity. None if it
+    can't be shared.
+    """
+    if not isinstance(node, INTERNED_TYPES):
+        return None
+    key: list = [type(node)]
+    for name in structure_fields(type(node)):
+        value = getattr(node, name)
+        if isinstance(value, AstElement):
+            if id(value) not in keys:
+                return None
+            key.append(id(value))
+        elif isinstance(value, list):
+            items = []
+            for item in value:
+                if isinstance(item, TableEntry.KeyValue):
+                    (item_key, item) = item
+                    items.append(item_key)
+                elif not isinstance(item, AstElement):
+                    # shorthand entries use names
+                    return None
+                if id(item) not in keys:
+                    return None
+                items.append(id(item))
+            key.append(tuple(items))
+        else:
+            key.append(value)
+    return tuple(key)
+
+
+def intern_subtrees(root: AstElement) -> AstElement:
+    """
+    Share the identical subtrees of `root` that contain no names: literals,
+    and the arrays, tables and calls made of them. The tree is changed in
+    place. `zuv_ast.shared_nodes` finds the shared nodes for `JsOptions.memo`.
+
+    Run it before `zuv_scope.resolve`. The shared nodes get no symbols, and
+    what `zuv_types.infer` marks on them only depends on what is in them.
+    The tree is for code generation: `zuv_eval` needs every node once.
+    """
+    order = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        stack.extend(node.children())
+    # structure -> the node that has it, and the other way around by id()
+    table: Dict[tuple, AstElement] = {}
+    keys: Dict[int, tuple] = {}
+    # id() of each node that is a copy -> the node shared instead
+    # (`order` keeps them all alive, so the ids stay theirs)
+    interned: Dict[int, AstElement] = {}
+    # children come after their parents in `order`
+    for node in reversed(order):
+        _share_children(node, interned)
+        key = _structural_key(node, keys)
+        if key is None:
+            continue
+        shared = table.setdefault(key, node)
+        if shared is node:
+            keys[id(node)] = key
+        else:
+            interned[id(node)] = shared
+    return interned.get(id(root), root)
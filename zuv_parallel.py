@@ -0,0 +1,202 @@
+"""
+Parallel compilation of one large file: `python main.py --jobs N PATH`.
+
+The source is cut into pieces at top-level statement boundaries, and each
+piece is parsed, folded, resolved, typed and turned into JS in a process pool. The
+pieces are joined in order; the output is identical to a serial compile.
+
+Cuts are only made before a line that starts in column 0, outside of
+brackets, strings and comments. That is a statement boundary in formatted
+code, but not always: a function body or the arguments of a call can go on
+at column 0. Whatever can continue a complete statement (`.`, `:`, `@`,
+`->`...) can't start one, so a wrong cut always leaves the piece before it
+unparseable. Such a piece is joined to the next one and compiled again; if
+that fails too, the whole file is compiled serially, which also reports
+syntax errors the way a serial compile does.
+
+    write_parallel(source, sys.stdout, flags, jobs=8)
+
+The pieces are written to the sink one by one, once they are all compiled
+and checked: until then, the file may still have to be compiled serially.
+"""
+
+import io
+import os
+import re
+from concurrent.futures import Executor, ProcessPoolExecutor
+from itertools import chain, repeat
+from typing import FrozenSet, List, Optional, Set, TextIO, Tuple
+
+import zuv_ast
+import zuv_scope
+import zuv_types
+from zuv_optimize import FOLDED_GLOBALS, ConstantFolder, declared_names, intern_subtrees
+
+import main as compiler
+
+# pieces per worker process, so that a slow piece doesn't hold up the rest
+PIECES_PER_JOB = 4
+# smaller files are compiled serially
+MIN_PIECE_SIZE = 1 << 15
+
+# strings (as in the grammar), comments, brackets, and line breaks before
+# something that can start a statement
+_SCAN = re.compile(r'"(?:\\.|[^"])*"|//[^\n]*|[()\[\]{}]|\n(?=[\w"\[{(]|<=|[+-][0-9])')
+
+# the JS of a piece, the top-level names it assigns and the ones it assigns
+# with `<=`, and the runtime globals it redefines; the JS is None if it
+# didn't resolve. The whole result is None if the piece didn't parse.
+PieceResult = Optional[Tuple[Optional[str], FrozenSet[str], FrozenSet[str], FrozenSet[str]]]
+
+
+def split_source(source: str, pieces: int, min_size: int = MIN_PIECE_SIZE) -> List[int]:
+    """Offsets at which to cut `source` into about `pieces` pieces."""
+    step = max(len(source) // pieces, min_size)
+    cuts: List[int] = []
+    target = step
+    depth = 0
+    for match in _SCAN.finditer(source):
+        first = match.group()[0]
+        if first in "([{":
+            depth += 1
+        elif first in ")]}":
+            depth -= 1
+        elif first == "\n" and depth == 0 and match.start() >= target:
+            if len(source) - match.end() < min_size:
+                break
+            cuts.append(match.end())
+            target = match.end() + step
+    return cuts
+
+
+def _compile_piece(text: str, flags: compiler.CompileFlags, shadowed: FrozenSet[str]) -> PieceResult:
+    try:
+        ast = compiler.parse(text, flags.parser)
+    except Exception:
+        return None
+    shadows = frozenset(declared_names(ast) & (FOLDED_GLOBALS | zuv_types.UNBOXED_GLOBALS | zuv_ast.BRANCH_GLOBALS))
+    if flags.fold_constants:
+        ast = ConstantFolder(shadowed).fold(ast)
+    if flags.intern:
+        ast = intern_subtrees(ast)
+    try:
+        top = zuv_scope.resolve(ast, flags.minify)
+    except zuv_scope.ScopeError:
+        return (None, frozenset(), frozenset(), shadows)
+    if flags.unbox:
+        zuv_types.infer(ast, shadowed)
+    options = compiler.js_options_for(flags)
+    options.shadowed = shadowed
+    if flags.intern:
+        options.memo = zuv_ast.shared_nodes(ast)
+    assert isinstance(ast, zuv_ast.BlockExpression)
+    pieces = chain.from_iterable(zuv_ast.statement_js_iter(stmt, options, False) for stmt in ast.statements)
+    parts = zuv_ast.js_parts(pieces, options)
+    if flags.minify:
+        # every statement ends with "; ", so a piece minifies the same on
+        # its own as in the whole file, except for the last `;` before "}"
+        parts = zuv_ast.minify_js(parts)
+    return ("".join(parts), frozenset(top.local_names), frozenset(top.nonlocal_names), shadows)
+
+
+def write_parallel(
+    source: str,
+    sink: TextIO,
+    flags: compiler.CompileFlags = compiler.CompileFlags(),
+    jobs: Optional[int] = None,
+) -> None:
+    """Compile `source` in `jobs` processes, and write the JS into `sink`."""
+    if flags.hoist_literals:
+        raise ValueError("hoisting literals needs the whole program")
+    jobs = jobs or os.cpu_count() or 1
+    cuts = split_source(source, jobs * PIECES_PER_JOB) if jobs > 1 else []
+    parts = None
+    if cuts:
+        if flags.parser == "lark":
+            # loaded once here, instead of in each worker
+            compiler.get_parser()
+        with ProcessPoolExecutor(jobs) as executor:
+            texts = [source[a:b] for (a, b) in zip([0] + cuts, cuts + [len(source)])]
+            parts = compile_pieces(executor, texts, flags)
+    if parts is None:
+        compiler.write_program(compiler.parse(source, flags.parser), sink, flags)
+    else:
+        write_pieces(parts, sink, flags.minify)
+
+
+def compile_parallel(
+    source: str,
+    flags: compiler.CompileFlags = compiler.CompileFlags(),
+    jobs: Optional[int] = None,
+) -> str:
+    sink = io.StringIO()
+    write_parallel(source, sink, flags, jobs)
+    return sink.getvalue()
+
+
+def write_pieces(parts: List[str], sink: TextIO, minify: bool) -> None:
+    """Write the JS of the pieces of a file into `sink`, as one program."""
+    sink.write("{" if minify else "{ ")
+    # minified, there is no `;` before "}"
+    last = max((i for (i, js) in enumerate(parts) if js), default=-1) if minify else -1
+    for (i, js) in enumerate(parts):
+        sink.write(js[:-1] if i == last and js.endswith(";") else js)
+    sink.write("}")
+
+
+def compile_pieces(executor: Executor, texts: List[str], flags: compiler.CompileFlags) -> Optional[List[str]]:
+    """
+    The JS of each of `texts`, compiled by `executor` as parts of one file,
+    or None if the file has to be compiled serially.
+    """
+    nothing: FrozenSet[str] = frozenset()
+    results: List[PieceResult] = list(executor.map(_compile_piece, texts, repeat(flags), repeat(nothing)))
+
+    if any(result is None for result in results):
+        # join each piece that didn't parse to the next one
+        (old_texts, old_results) = (texts, results)
+        (texts, results) = ([], [])
+        i = 0
+        while i < len(old_texts):
+            if old_results[i] is None and i + 1 < len(old_texts):
+                texts.append(old_texts[i] + old_texts[i + 1])
+                results.append(None)
+                i += 2
+            else:
+                texts.append(old_texts[i])
+                results.append(old_results[i])
+                i += 1
+        _recompile(executor, texts, results, [i for (i, r) in enumerate(results) if r is None], flags, nothing)
+        if any(result is None for result in results):
+            return None
+
+    # constant folding, unboxing and tail loops depend on which runtime
+    # globals the file redefines
+    shadowed = frozenset().union(*(result[3] for result in results))  # type: ignore
+    if (flags.fold_constants or flags.unbox or flags.tail_loops) and shadowed:
+        _recompile(executor, texts, results, list(range(len(texts))), flags, shadowed)
+
+    # the same checks as `IncrementalCompilation.to_js`: only top-level
+    # names can clash between pieces
+    local_names: Set[str] = set()
+    nonlocal_names: Set[str] = set()
+    for (js, piece_locals, piece_nonlocals, _) in results:  # type: ignore
+        if js is None or (piece_locals & nonlocal_names) or (piece_nonlocals & local_names):
+            return None
+        local_names |= piece_locals
+        nonlocal_names |= piece_nonlocals
+
+    return [result[0] for result in results]  # type: ignore
+
+
+def _recompile(
+    executor: Executor,
+    texts: List[str],
+    results: List[PieceResult],
+    indices: List[int],
+    flags: compiler.CompileFlags,
+    shadowed: FrozenSet[str],
+) -> None:
+    redone = executor.map(_compile_piece, [texts[i] for i in indices], repeat(flags), repeat(shadowed))
+    for (i, result) in zip(indices, redone):
+        results[i] = result
@@ -0,0 +1,682 @@
+"""
+The runtime of `lib.js`, ported to Python for `zuv_eval`.
+
+Values are represented like this:
+
+    null, undefined         None, UNDEFINED
+    JS strings, numbers     str, int (for bigints) and float
+    functions               any Python callable; extra arguments are ignored
+    Integer, String, ...    instances of the classes below
+    table literals          `Record`s
+
+Every JS property `p` of an object is its Python attribute `js_p`, so that
+`x @add y` is `getattr(x, "js_add")(y)` whatever `x` is. Thrown errors are
+`ZuvError`s: `panic` throws the kind "Error", and what the JS engine would
+throw (calling something that isn't a function, say) has the kind of the
+JS error, like "TypeError".
+
+This follows `lib.js` closely, including the places where its behaviour is
+surprising (see the comments): a program should print the same in both.
+"""
+
+import json
+import sys
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class ZuvError(Exception):
+    def __init__(self, kind: str, message: str):
+        super().__init__(f"{kind}: {message}")
+        self.kind = kind
+        self.message = message
+
+
+class Undefined:
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "UNDEFINED"
+
+
+UNDEFINED = Undefined()
+
+
+def type_error(message: str) -> ZuvError:
+    return ZuvError("TypeError", message)
+
+
+def js_number(x: float) -> str:
+    """`${x}` for a JS number."""
+    if x != x:
+        return "NaN"
+    if x in (float("inf"), float("-inf")):
+        return "Infinity" if x > 0 else "-Infinity"
+    if x == int(x) and abs(x) < 1e21:
+        return str(int(x))
+    (mantissa, _, exponent) = repr(x).partition("e")
+    power = int(exponent or 0)
+    if -7 < power < 21:
+        return format(Decimal(repr(x)), "f")
+    return f"{mantissa}e{'+' if power > 0 else '-'}{abs(power)}"
+
+
+def template(x: Any) -> str:
+    """`${x}`"""
+    if x is None:
+        return "null"
+    if x is UNDEFINED:
+        return "undefined"
+    if type(x) is str:
+        return x
+    if type(x) is int:
+        return str(x)
+    if type(x) is float:
+        return js_number(x)
+    if callable(x):
+        return "function () { [native code] }"
+    return "[object Object]"
+
+
+def is_object(x: Any) -> bool:
+    """`typeof x === "object" && x !== null`"""
+    return not (x is None or x is UNDEFINED or type(x) in (str, int, float) or callable(x))
+
+
+def member(x: Any, name: str) -> Any:
+    """`x.name`, where `name` is the JS property name."""
+    if x is None or x is UNDEFINED:
+        raise type_error(f"Cannot read properties of {template(x)} (reading '{name}')")
+    return getattr(x, "js_" + name, UNDEFINED)
+
+
+def has(x: Any, name: str) -> bool:
+    """`name in x`"""
+    if not is_object(x) and not callable(x):
+        raise type_error(f"Cannot use 'in' operator to search for '{name}' in {template(x)}")
+    return hasattr(x, "js_" + name)
+
+
+def call(function: Any, arguments: Tuple, description: str) -> Any:
+    if not callable(function):
+        raise type_error(f"{description} is not a function")
+    return function(*arguments)
+
+
+def call_member(x: Any, name: str, *arguments: Any) -> Any:
+    return call(member(x, name), arguments, f"{name}")
+
+
+def _bigint(m: Any) -> int:
+    if type(m) is Integer:
+        return m.js___n
+    n = member(m, "__n")
+    if type(n) is not int:
+        raise type_error("Cannot mix BigInt and other types, use explicit conversions")
+    return n
+
+
+def _compared(m: Any) -> Optional[int]:
+    # comparing a bigint with undefined is false, not an error
+    if type(m) is Integer:
+        return m.js___n
+    n = member(m, "__n")
+    return n if type(n) is int else None
+
+
+def bigint_div(n: int, m: int) -> int:
+    """BigInt `n / m`, which truncates towards zero."""
+    if m == 0:
+        raise ZuvError("RangeError", "Division by zero")
+    q = abs(n) // abs(m)
+    return q if (n < 0) == (m < 0) else -q
+
+
+def bigint_mod(n: int, m: int) -> int:
+    """The `mod` of `Integer`: the sign of the result is the sign of `m`."""
+    if m == 0:
+        raise ZuvError("RangeError", "Division by zero")
+    # BigInt `%`: the sign follows the dividend
+    r = abs(n) % abs(m)
+    r = -r if n < 0 else r
+    return r if m >= 0 else r + m
+
+
+def _bool(value: bool) -> "Bool":
+    return TRUE if value else FALSE
+
+
+class Integer:
+    __slots__ = ("js___n",)
+    js___T = "Integer"
+
+    def __init__(self, n: int):
+        self.js___n = n
+
+    def js___raw__(self, *_: Any) -> int:
+        return self.js___n
+
+    def js___repr__(self, *_: Any) -> str:
+        return str(self.js___n)
+
+    def js_add(self, m: Any = UNDEFINED, *_: Any) -> "Integer":
+        return Integer(self.js___n + _bigint(m))
+
+    def js_sub(self, m: Any = UNDEFINED, *_: Any) -> "Integer":
+        return Integer(self.js___n - _bigint(m))
+
+    def js_mul(self, m: Any = UNDEFINED, *_: Any) -> "Integer":
+        return Integer(self.js___n * _bigint(m))
+
+    def js_div(self, m: Any = UNDEFINED, *_: Any) -> "Integer":
+        return Integer(bigint_div(self.js___n, _bigint(m)))
+
+    def js_mod(self, m: Any = UNDEFINED, *_: Any) -> "Integer":
+        return Integer(bigint_mod(self.js___n, _bigint(m)))
+
+    def js_gt(self, m: Any = UNDEFINED, *_: Any) -> "Bool":
+        other = _compared(m)
+        return _bool(other is not None and self.js___n > other)
+
+    def js_lt(self, m: Any = UNDEFINED, *_: Any) -> "Bool":
+        other = _compared(m)
+        return _bool(other is not None and self.js___n < other)
+
+    def js_eq(self, m: Any = UNDEFINED, *_: Any) -> "Bool":
+        return _bool(self.js___n == _compared(m))
+
+    def js_ge(self, m: Any = UNDEFINED, *_: Any) -> "Bool":
+        other = _compared(m)
+        return _bool(other is not None and self.js___n >= other)
+
+    def js_le(self, m: Any = UNDEFINED, *_: Any) -> "Bool":
+        other = _compared(m)
+        return _bool(other is not None and self.js___n <= other)
+
+    def js___eq__(self, m: Any = UNDEFINED, *_: Any) -> Any:
+        if m is None or member(m, "__T") != "Integer":
+            return NOT_IMPLEMENTED
+        return _bool(self.js___n == member(m, "__n"))
+
+
+def integer(n: Any = UNDEFINED, *_: Any) -> Integer:
+    """The global `Integer`."""
+    if type(n) is Integer:
+        return n
+    if n is None or n is UNDEFINED:
+        panic(f"{template(n)} is not a valid integer")
+    if type(n) is Float:
+        return Integer(int(n.js___x // 1))
+    if type(n) is int:
+        return Integer(n)
+    if type(n) is float:
+        if n != n or n in (float("inf"), float("-inf")) or n != int(n):
+            raise ZuvError(
+                "RangeError",
+                f"The number {js_number(n)} cannot be converted to a BigInt because it is not an integer",
+            )
+        return Integer(int(n))
+    panic(f"{template(n)} is not a valid integer")
+    raise AssertionError  # panic always throws
+
+
+# `is?` tests `n !== undefined` where it meant `===`, so it's always False
+integer.js_is__QMARK = lambda *_: FALSE  # type: ignore
+integer.js___repr__ = lambda *_: "Integer"  # type: ignore
+
+
+class Float:
+    __slots__ = ("js___x",)
+    js___T = "Float"
+
+    def __init__(self, x: float):
+        self.js___x = x
+
+    def js___raw__(self, *_: Any) -> float:
+        return self.js___x
+
+    def js___repr__(self, *_: Any) -> str:
+        return js_number(self.js___x)
+
+    def _other(self, y: Any) -> float:
+        x = member(y, "__x")
+        # undefined makes NaN
+        return x if type(x) is float else float("nan")
+
+    def js_add(self, y: Any = UNDEFINED, *_: Any) -> "Float":
+        return Float(self.js___x + self._other(y))
+
+    def js_sub(self, y: Any = UNDEFINED, *_: Any) -> "Float":
+        return Float(self.js___x - self._other(y))
+
+    def js_mul(self, y: Any = UNDEFINED, *_: Any) -> "Float":
+        return Float(self.js___x * self._other(y))
+
+    def js_div(self, y: Any = UNDEFINED, *_: Any) -> "Float":
+        (x, other) = (self.js___x, self._other(y))
+        if other == 0:
+            if x == 0 or x != x:
+                return Float(float("nan"))
+            # the sign of a zero divisor counts
+            negative = (x < 0) != (str(other)[0] == "-")
+            return Float(float("-inf") if negative else float("inf"))
+        return Float(x / other)
+
+    def js_gt(self, y: Any = UNDEFINED, *_: Any) -> "Bool":
+        return _bool(self.js___x > self._other(y))
+
+    def js_lt(self, y: Any = UNDEFINED, *_: Any) -> "Bool":
+        return _bool(self.js___x < self._other(y))
+
+    def js_eq(self, y: Any = UNDEFINED, *_: Any) -> "Bool":
+        return _bool(self.js___x == self._other(y))
+
+    def js_ge(self, y: Any = UNDEFINED, *_: Any) -> "Bool":
+        return _bool(self.js___x >= self._other(y))
+
+    def js_le(self, y: Any = UNDEFINED, *_: Any) -> "Bool":
+        return _bool(self.js___x <= self._other(y))
+
+    def js___eq__(self, y: Any = UNDEFINED, *_: Any) -> Any:
+        if y is None or member(y, "__T") != "Float":
+            return NOT_IMPLEMENTED
+        # compares with `y.__n`, which floats don't have
+        return FALSE
+
+
+def float_(x: Any = UNDEFINED, *_: Any) -> Float:
+    """The global `Float`."""
+    if type(x) is Float:
+        return x
+    if x is None or x is UNDEFINED:
+        panic(f"{template(x)} is not a valid float")
+    if type(x) is Integer:
+        return Float(float(x.js___n))
+    if type(x) is int:
+        # `Float(Number(n))`, where there is no `n`
+        raise ZuvError("ReferenceError", "n is not defined")
+    if type(x) is float:
+        return Float(x)
+    panic(f"{template(x)} is not a valid float")
+    raise AssertionError
+
+
+float_.js_is__QMARK = lambda *_: FALSE  # type: ignore
+float_.js___repr__ = lambda *_: "Float"  # type: ignore
+
+
+def panic(*s: Any) -> Any:
+    if len(s) == 0:
+        # `panic()` calls itself until the stack overflows
+        raise ZuvError("RangeError", "Maximum call stack size exceeded")
+    if len(s) > 1:
+        panic(concat(*s))
+    message = s[0]
+    if message is None or message is UNDEFINED:
+        panic("Panic when panicking: null message.")
+    if type(message) is str:
+        raise ZuvError("Error", message)
+    if is_object(message) and has(message, "__repr__"):
+        panic(string(message).js___s)
+    panic("Panic when panicking: invalid message: " + json_stringify(message))
+
+
+class Bool:
+    __slots__ = ("name",)
+    js___T = "Bool"
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __repr__(self) -> str:
+        return self.name
+
+    def js_if(self, f: Any = UNDEFINED, *_: Any) -> Any:
+        if self is TRUE:
+            return call(f, (), "f")
+        return UNDEFINED
+
+    def js_else(self, f: Any = UNDEFINED, *_: Any) -> Any:
+        if self is FALSE:
+            return call(f, (), "f")
+        return UNDEFINED
+
+    def js___QMARK(self, t: Any = UNDEFINED, f: Any = UNDEFINED, *_: Any) -> Any:
+        if self is TRUE:
+            return call(t, (), "t")
+        return call(f, (), "f")
+
+    def js___repr__(self, *_: Any) -> str:
+        return self.name
+
+    def js___eq__(self, other: Any = UNDEFINED, *_: Any) -> Any:
+        return TRUE if other is self else NOT_IMPLEMENTED
+
+
+TRUE = Bool("True")
+FALSE = Bool("False")
+
+
+class Record:
+    """A JS object: a table literal, or `NotImplemented` and friends below."""
+
+    def __init__(self, **properties: Any):
+        for (name, value) in properties.items():
+            setattr(self, "js_" + name, value)
+
+    def entries(self) -> Iterator[Tuple[str, Any]]:
+        """`Object.entries(this)`"""
+        for (name, value) in vars(self).items():
+            yield (name[3:], value)
+
+
+def _is_bool(x: Any = UNDEFINED, *_: Any) -> Bool:
+    return _bool(is_object(x) and has(x, "if") and has(x, "else"))
+
+
+BOOL = Record(is__QMARK=_is_bool, __repr__=lambda *_: "Bool")
+
+NOT_IMPLEMENTED = Record(__T="NotImplemented")
+
+
+def _raw_key(k: Any) -> Any:
+    raw = call_member(k, "__raw__")
+    # a `Map` tells 1n and 1 apart
+    return (type(raw) is float, raw)
+
+
+class Table:
+    __slots__ = ("map",)
+    js___T = "Table"
+
+    def __init__(self) -> None:
+        # raw key -> (key, value)
+        self.map: Dict[Any, Tuple[Any, Any]] = {}
+
+    @property
+    def js___map(self) -> Dict[Any, Tuple[Any, Any]]:
+        return self.map
+
+    def js_length(self, *_: Any) -> Any:
+        # `Integer(map.size())`, but `size` isn't a method
+        raise type_error("map.size is not a function")
+
+    def js_has(self, k: Any = UNDEFINED, *_: Any) -> Bool:
+        return _bool(_raw_key(k) in self.map)
+
+    def js_get(self, k: Any = UNDEFINED, *_: Any) -> Any:
+        entry = self.map.get(_raw_key(k))
+        if entry is None:
+            panic(f"Key not found: {repr_(k).js___s}")
+        return entry[1]  # type: ignore
+
+    def js_set(self, k: Any = UNDEFINED, v: Any = UNDEFINED, *_: Any) -> Any:
+        self.map[_raw_key(k)] = (k, v)
+        return UNDEFINED
+
+    def js_forEach(self, f: Any = UNDEFINED, *_: Any) -> Any:
+        for (k, v) in list(self.map.values()):
+            call(f, (k, v), "f")
+        return UNDEFINED
+
+    def js_mapValues(self, f: Any = UNDEFINED, *_: Any) -> "Table":
+        result = Table()
+        for (k, v) in list(self.map.values()):
+            result.js_set(k, call(f, (v,), "f"))
+        return result
+
+    def js___repr__(self, *_: Any) -> str:
+        result = "Table{"
+        for (k, v) in list(self.map.values()):
+            result += repr_(k).js___s + " " + repr_(v).js___s + ", "
+        # lib.js compares with "{" instead of "Table{", so this always cuts
+        return result[:-2] + "}"
+
+    def js___eq__(self, other: Any = UNDEFINED, *_: Any) -> Any:
+        if other is None or member(other, "__T") != "Table":
+            return NOT_IMPLEMENTED
+        theirs = member(other, "__map")
+        if len(self.map) != len(theirs):
+            return FALSE
+        for (raw, (_k, v)) in list(self.map.items()):
+            if raw not in theirs:
+                return FALSE
+            # `!eq(...)` is never true: True and False are both objects
+            eq(theirs[raw][1], v)
+        return TRUE
+
+
+def table(*_: Any) -> Table:
+    """The global `Table`."""
+    return Table()
+
+
+def _index(i: Any) -> int:
+    return integer(i).js___n
+
+
+class Array:
+    __slots__ = ("xs",)
+    js___T = "Array"
+
+    def __init__(self, xs: List[Any]):
+        self.xs = xs
+
+    @property
+    def js___xs(self) -> List[Any]:
+        return self.xs
+
+    def _check(self, n: int) -> None:
+        if len(self.xs) < n:
+            panic(f"Index {n} out of range 0..{len(self.xs) - 1}")
+
+    def js_at(self, i: Any = UNDEFINED, *_: Any) -> Any:
+        n = _index(i)
+        self._check(n)
+        return self.xs[n] if 0 <= n < len(self.xs) else UNDEFINED
+
+    def js_set(self, i: Any = UNDEFINED, v: Any = UNDEFINED, *_: Any) -> None:
+        self._check(_index(i))
+        # `xs[i] = v` with the Integer object as the key: that sets a
+        # property named "[object Object]", not an element
+        return None
+
+    def js_push(self, x: Any = UNDEFINED, *_: Any) -> None:
+        self.xs.append(x)
+        return None
+
+    def js_pop(self, *_: Any) -> Any:
+        return self.xs.pop() if self.xs else UNDEFINED
+
+    def js_forEach(self, fn: Any = UNDEFINED, *_: Any) -> None:
+        xs = self.xs
+        i = 0
+        # like JS, elements pushed meanwhile aren't visited
+        for i in range(len(xs)):
+            if i < len(xs):
+                call(fn, (xs[i], i, xs), "fn")
+        return None
+
+    def js_map(self, fn: Any = UNDEFINED, *_: Any) -> "Array":
+        xs = self.xs
+        return Array([call(fn, (x, i, xs), "fn") for (i, x) in enumerate(list(xs))])
+
+    def js___repr__(self, *_: Any) -> str:
+        return "[" + ", ".join(repr_(x).js___s for x in self.xs) + "]"
+
+
+def array(xs: Any = UNDEFINED, *_: Any) -> Array:
+    """The global `Array`."""
+    if type(xs) is Array:
+        # lib.js spreads `xs.__T` here, the string "Array"
+        return Array(list("Array"))
+    tag = member(xs, "__T")
+    if type(xs) is not list:
+        raise type_error(f"Array of {template(tag)}: only JS arrays are supported")
+    return Array(xs)
+
+
+def repr_(x: Any = UNDEFINED, *_: Any) -> "String":
+    """The global `repr`."""
+    if x is None or x is UNDEFINED:
+        return String(template(x))
+    if is_object(x):
+        method = getattr(x, "js___repr__", UNDEFINED)
+        if method is not UNDEFINED:
+            return string(call(method, (), "x.__repr__"))
+    return string(x)
+
+
+class String:
+    __slots__ = ("js___s",)
+    js___T = "String"
+
+    def __init__(self, s: str):
+        self.js___s = s
+
+    def js___str__(self, *_: Any) -> str:
+        return self.js___s
+
+    def js___repr__(self, *_: Any) -> str:
+        return json_stringify(self.js___s)
+
+    def js___raw__(self, *_: Any) -> str:
+        return self.js___s
+
+    def js___eq__(self, s: Any = UNDEFINED, *_: Any) -> Any:
+        if s is None or member(s, "__T") != "String":
+            return NOT_IMPLEMENTED
+        return _bool(member(s, "__s") == self.js___s)
+
+    def _items(self, ys: Any) -> List[Any]:
+        if member(ys, "__T") != "Array":
+            panic(f"{repr_(ys).js___s} is not an Array")
+        return member(ys, "__xs")
+
+    def js_join(self, ys: Any = UNDEFINED, *_: Any) -> "String":
+        return String(self.js___s.join([string(o).js___s for o in self._items(ys)]))
+
+    def js_rjoin(self, ys: Any = UNDEFINED, *_: Any) -> "String":
+        return String(self.js___s.join([repr_(o).js___s for o in self._items(ys)]))
+
+
+def string(x: Any = UNDEFINED, *_: Any) -> String:
+    """The global `String`."""
+    if type(x) is String:
+        return x
+    if type(x) is str:
+        return String(x)
+    if x is None or x is UNDEFINED:
+        panic(f"{template(x)} is not a valid string")
+    if is_object(x):
+        for name in ("__str__", "__repr__"):
+            method = getattr(x, "js_" + name, UNDEFINED)
+            if method is not UNDEFINED:
+                return string(call(method, (), f"x.{name}"))
+        result = "{"
+        for (k, v) in _entries(x):
+            result += k + " " + repr_(v).js___s + ", "
+        # the same cut as in `Table.__repr__`: `{}` becomes `}`
+        return String(result[:-2] + "}")
+    if callable(x):
+        return String("<FN>")
+    return String(template(x))
+
+
+def _entries(x: Any) -> List[Tuple[str, Any]]:
+    if isinstance(x, Record):
+        return list(x.entries())
+    return [("__T", member(x, "__T"))]
+
+
+def json_stringify(x: Any) -> str:
+    if type(x) is str:
+        return json.dumps(x, ensure_ascii=False)
+    if x is None:
+        return "null"
+    if x is UNDEFINED or callable(x):
+        return "undefined"
+    if type(x) is int:
+        raise type_error("Do not know how to serialize a BigInt")
+    if type(x) is float:
+        return js_number(x) if x == x and abs(x) != float("inf") else "null"
+    if type(x) is list:
+        return "[" + ",".join(
+            "null" if item is UNDEFINED or callable(item) else json_stringify(item) for item in x
+        ) + "]"
+    if isinstance(x, Record):
+        fields = x.entries()
+    elif type(x) is Table:
+        # a `Map` has no enumerable properties
+        fields = iter([("__T", "Table"), ("__map", Record())])
+    else:
+        fields = iter([("__T", member(x, "__T"))] + [
+            (name[3:], getattr(x, name)) for name in type(x).__slots__ if name.startswith("js_")
+        ])
+    return "{" + ",".join(
+        json.dumps(k, ensure_ascii=False) + ":" + json_stringify(v)
+        for (k, v) in fields if v is not UNDEFINED and not callable(v)
+    ) + "}"
+
+
+def _write(stream: str, text: str) -> None:
+    # looked up on every call, so that redirecting sys.stdout works
+    print(text, file=getattr(sys, stream))
+
+
+CONSOLE = Record(
+    log=lambda thing=UNDEFINED, *_: _write("stdout", string(thing).js___s),
+    debug=lambda thing=UNDEFINED, *_: _write("stdout", repr_(thing).js___s),
+    warn=lambda thing=UNDEFINED, *_: _write("stderr", string(thing).js___s),
+    error=lambda thing=UNDEFINED, *_: _write("stderr", string(thing).js___s),
+    __repr__=lambda *_: "console",
+)
+
+
+def eq(a: Any = UNDEFINED, b: Any = UNDEFINED, *_: Any) -> Bool:
+    """The global `eq`."""
+    if a is None and b is None:
+        return TRUE
+    if (a is None) != (b is None):
+        return FALSE
+    if member(a, "__T") != member(b, "__T"):
+        return FALSE
+
+    for_a = call_member(a, "__eq__", b) if has(a, "__eq__") else NOT_IMPLEMENTED
+    if for_a is FALSE:
+        return FALSE
+    if for_a is TRUE:
+        return TRUE
+    if for_a is not NOT_IMPLEMENTED:
+        raise ZuvError("Error", f"__eq__ returned {template(member(for_a, '__t'))}")
+
+    for_b = call_member(b, "__eq__", a) if has(b, "__eq__") else NOT_IMPLEMENTED
+    if for_b is FALSE or for_b is NOT_IMPLEMENTED:
+        return FALSE
+    if for_b is TRUE:
+        return TRUE
+    raise ZuvError("Error", f"__eq__ returned {template(member(for_b, '__t'))}")
+
+
+def concat(*xs: Any) -> String:
+    """The global `concat`."""
+    return String("").js_join(Array(list(xs)))
+
+
+# the names that `lib.js` defines for programs
+GLOBALS: Dict[str, Any] = {
+    "Integer": integer,
+    "Float": float_,
+    "panic": panic,
+    "True": TRUE,
+    "False": FALSE,
+    "Bool": BOOL,
+    "Table": table,
+    "Array": array,
+    "repr": repr_,
+    "String": string,
+    "console": CONSOLE,
+    "NotImplemented": NOT_IMPLEMENTED,
+    "eq": eq,
+    "concat": concat,
+}
@@ -0,0 +1,271 @@
+"""
+Scope resolution, run once between the optimizations and code generation.
+
+Every name in the tree gets a `Symbol` that says how it resolves, with the
+same rules that JS applies to the generated code: a function's parameters
+and the names it assigns with `=` are its own, no matter where in the body
+the assignment is, and other names come from the enclosing functions or
+from the globals. Symbols are interned, so all the uses that resolve the
+same way share one object.
+
+Scope errors in the whole tree are collected and raised together, before
+any JS is generated:
+
+    resolve(ast)                       # raises ScopeError
+    ast.to_js(JsOptions())
+"""
+
+import string
+from bisect import bisect_left
+from typing import Dict, List, Optional, Set, Tuple
+
+from zuv_ast import (
+    ArrayParameter,
+    AstElement,
+    BlockExpression,
+    FunctionDefinition,
+    LvalueArray,
+    LvalueName,
+    LvalueNameNonlocal,
+    LvalueTable,
+    Name,
+    NamedParameter,
+    ObjectParameter,
+    Symbol,
+    SymbolKind,
+    TableEntry,
+    TableLiteral,
+)
+
+
+class ScopeError(TypeError):
+    def __init__(self, errors: List[str]):
+        super().__init__("\n".join(errors))
+        self.errors = errors
+
+
+class Scope:
+    """The names of one function (or of the top level of the program)."""
+
+    def __init__(self, parent: Optional["Scope"], block: AstElement, index: int = 0):
+        self.parent = parent
+        # the BlockExpression that is the function body, or the
+        # FunctionDefinition itself if its body is a single expression
+        self.block = block
+        # parameters and locals, in order of declaration
+        self.declared: Dict[str, None] = {}
+        # the names assigned with `=` and `outer` so far, to check that no
+        # name is used both ways in one block
+        self.local_names: Set[str] = set()
+        self.nonlocal_names: Set[str] = set()
+        # every name used in this scope itself
+        self.used: Set[str] = set()
+        # where it is in `Resolver.scopes`, which lists the scopes in
+        # pre-order, and where the last scope nested in it is
+        self.index = index
+        self.last_nested = index
+        self.js_names: Dict[str, str] = {}
+        self.next_short_name = 0
+        # name -> the scope that declares it, for the names looked up so far
+        self.lookups: Dict[str, Optional["Scope"]] = {}
+
+    def lookup(self, name: str) -> Optional["Scope"]:
+        """
+        Only once all the declarations are known. The answer is kept in each
+        scope on the way up, so that uses in deeply nested functions don't
+        walk up all the way every time.
+        """
+        passed = []
+        scope: Optional[Scope] = self
+        while scope is not None and name not in scope.declared:
+            if name in scope.lookups:
+                scope = scope.lookups[name]
+                break
+            passed.append(scope)
+            scope = scope.parent
+        for other in passed:
+            other.lookups[name] = scope
+        return scope
+
+
+# What to annotate once all the declarations are known: the node, the index
+# into its `symbols` (or None for its `symbol`), the name and the scope of
+# the use.
+_Use = Tuple[AstElement, Optional[int], str, Scope]
+
+
+class Resolver:
+    def __init__(self, minify: bool = False):
+        self.minify = minify
+        self.errors: List[str] = []
+        self.scopes: List[Scope] = []
+        self._uses: List[_Use] = []
+        self._interned: Dict[Tuple[str, SymbolKind, int], Symbol] = {}
+        # name -> the indices of the scopes that use it, in order
+        self._users: Dict[str, List[int]] = {}
+
+    def resolve(self, root: AstElement) -> Scope:
+        """
+        Annotate every name in `root` and return the top-level scope. Raises
+        `ScopeError` with all the errors found.
+        """
+        top = Scope(None, root)
+        self.scopes.append(top)
+        self._collect(root, top)
+        if self.errors:
+            raise ScopeError(self.errors)
+        if self.minify:
+            # only short names need to know what the nested scopes use
+            for scope in reversed(self.scopes):
+                if scope.parent is not None:
+                    scope.parent.last_nested = max(scope.parent.last_nested, scope.last_nested)
+            for scope in self.scopes:
+                for name in scope.used:
+                    self._users.setdefault(name, []).append(scope.index)
+        for scope in self.scopes:
+            self._choose_js_names(scope)
+        for (node, index, name, scope) in self._uses:
+            symbol = self._symbol(name, scope)
+            if index is None:
+                node.symbol = symbol  # type: ignore
+            else:
+                node.symbols[index] = symbol  # type: ignore
+        return top
+
+    def _declare(self, scope: Scope, name: str) -> None:
+        scope.declared[name] = None
+
+    def _use(self, node: AstElement, index: Optional[int], name: str, scope: Scope) -> None:
+        scope.used.add(name)
+        self._uses.append((node, index, name, scope))
+
+    def _collect(self, root: AstElement, top: Scope) -> None:
+        # Visits the nodes in the order their JS is generated, so that the
+        # errors come in the same order as the code.
+        stack: List[Tuple[AstElement, Scope]] = [(root, top)]
+        while stack:
+            (node, scope) = stack.pop()
+            if isinstance(node, FunctionDefinition):
+                block = node.body if isinstance(node.body, BlockExpression) else node
+                scope = Scope(scope, block, len(self.scopes))
+                self.scopes.append(scope)
+            elif isinstance(node, Name):
+                self._use(node, None, node.value, scope)
+            elif isinstance(node, LvalueName):
+                self._assign_local(node, None, node.name, scope)
+            elif isinstance(node, LvalueNameNonlocal):
+                if node.name in scope.local_names:
+                    self.errors.append(f"Cannot use name {node.name} as outer here.")
+                scope.nonlocal_names.add(node.name)
+                self._use(node, None, node.name, scope)
+            elif isinstance(node, LvalueArray):
+                if any(isinstance(t, LvalueNameNonlocal) for t in node.targets):
+                    self.errors.append("Cannot use nonlocal name in array destructuring.")
+            elif isinstance(node, LvalueTable):
+                node.symbols = [None] * len(node.names)  # type: ignore
+                for (i, name) in enumerate(node.names):
+                    self._assign_local(node, i, name, scope)
+            elif isinstance(node, NamedParameter):
+                self._declare(scope, node.name)
+                self._use(node, None, node.name, scope)
+            elif isinstance(node, (ObjectParameter, ArrayParameter)):
+                node.symbols = [None] * len(node.names)  # type: ignore
+                for (i, name) in enumerate(node.names):
+                    self._declare(scope, name)
+                    self._use(node, i, name, scope)
+            elif isinstance(node, TableLiteral):
+                node.symbols = [None] * len(node.entries)  # type: ignore
+                for (i, entry) in enumerate(node.entries):
+                    if not isinstance(entry, TableEntry.KeyValue):
+                        self._use(node, i, entry[0], scope)
+            stack.extend((child, scope) for child in reversed(list(node.children())))
+
+    def _assign_local(self, node: AstElement, index: Optional[int], name: str, scope: Scope) -> None:
+        if name in scope.nonlocal_names:
+            self.errors.append(f"Cannot use name {name} as local here.")
+        scope.local_names.add(name)
+        self._declare(scope, name)
+        self._use(node, index, name, scope)
+
+    def _choose_js_names(self, scope: Scope) -> None:
+        if not self.minify or scope.parent is None:
+            # top-level names are globals, other scripts may use them
+            for name in scope.declared:
+                scope.js_names[name] = _mangle(name)
+            return
+        # Short names are never reused by nested scopes, and skip every name
+        # used inside the function, so they can't shadow anything it uses.
+        # (The scopes are named in pre-order: the parent is done already.)
+        index = scope.parent.next_short_name
+        for name in scope.declared:
+            while True:
+                candidate = short_name(index)
+                index += 1
+                if candidate not in _RESERVED_NAMES and not self._used_within(scope, candidate):
+                    break
+            scope.js_names[name] = candidate
+        scope.next_short_name = index
+
+    def _used_within(self, scope: Scope, name: str) -> bool:
+        """Whether `name` is used in `scope` or in a scope nested in it."""
+        users = self._users.get(name)
+        if users is None:
+            return False
+        # the nested scopes come right after `scope` in pre-order
+        i = bisect_left(users, scope.index)
+        return i < len(users) and users[i] <= scope.last_nested
+
+    def _symbol(self, name: str, scope: Scope) -> Symbol:
+        declaring = scope.lookup(name)
+        kind: SymbolKind
+        if declaring is None:
+            kind = "global"
+        elif declaring is scope:
+            kind = "local"
+        else:
+            kind = "outer"
+        key = (name, kind, id(declaring))
+        symbol = self._interned.get(key)
+        if symbol is None:
+            symbol = Symbol(
+                name,
+                kind,
+                declaring.block if declaring is not None else None,
+                declaring.js_names[name] if declaring is not None else _mangle(name),
+            )
+            self._interned[key] = symbol
+        return symbol
+
+
+def _mangle(name: str) -> str:
+    return name.replace("?", "__QMARK")
+
+
+_SHORT_NAME_FIRST = string.ascii_letters
+_SHORT_NAME_REST = string.ascii_letters + string.digits
+
+
+def short_name(index: int) -> str:
+    name = _SHORT_NAME_FIRST[index % len(_SHORT_NAME_FIRST)]
+    index //= len(_SHORT_NAME_FIRST)
+    while index:
+        index -= 1
+        name += _SHORT_NAME_REST[index % len(_SHORT_NAME_REST)]
+        index //= len(_SHORT_NAME_REST)
+    return name
+
+
+# JS keywords, and the names that the generated code uses itself
+_RESERVED_NAMES = frozenset("""
+    await break case catch class const continue debugger default delete do
+    else enum export extends false finally for function if implements import
+    in instanceof interface let new null package private protected public
+    return static super switch this throw true try typeof var void while with
+    yield arguments eval undefined NaN Infinity
+    Integer String Array
+""".split())
+
+
+def resolve(root: AstElement, minify: bool = False) -> Scope:
+    """Annotate the names in `root` with their symbols. Raises `ScopeError`."""
+    return Resolver(minify).resolve(root)
@@ -0,0 +1,338 @@
+"""
+A compact binary format for parsed trees, so that unchanged sources can skip
+the parser (see `main.parse_cached`):
+
+    data = dumps(ast)
+    assert loads(data) == ast
+
+The tree is written in post-order as a stream of words: each node is
+a tag followed by its fixed fields (string indices, counts, flags), after all
+of its children. Loading is a single loop over the words with a stack of the
+nodes built so far, so it doesn't recurse however deep the tree is. Every
+string (names, string literals, and the digits of integers) is stored once,
+in a table after the header.
+
+Layout, all little-endian:
+
+    b"ZAST", version, word size, string count, word count   u32 each
+    string lengths                  u32 each, in code points
+    words                           u16 if every word fits, else u32
+    the strings, concatenated, as UTF-8
+
+Only what the parser produces is stored: symbols and other annotations added
+by later passes are not.
+"""
+
+import gc
+import struct
+import sys
+from array import array
+from typing import Callable, Dict, List, Tuple, Type
+
+from zuv_ast import (
+    ArrayLiteral,
+    ArrayParameter,
+    Assignment,
+    AstElement,
+    BlockExpression,
+    ChainedMethodCall,
+    ExpressionStatement,
+    FunctionCall,
+    FunctionDefinition,
+    IntLiteral,
+    LvalueArray,
+    LvalueName,
+    LvalueNameNonlocal,
+    LvalueTable,
+    MemberAccess,
+    MethodCall,
+    ModuleReference,
+    Name,
+    NamedParameter,
+    ObjectParameter,
+    SingleChainedCall,
+    StrLiteral,
+    TableEntry,
+    TableLiteral,
+)
+
+MAGIC = b"ZAST"
+# bump this whenever the layout or the meaning of a tag changes
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<4sIIII")
+
+# node kinds
+BLOCK = 0
+EXPRESSION_STATEMENT = 1
+NAME = 2
+INT = 3
+STR = 4
+ARRAY = 5
+TABLE = 6
+KEY_VALUE = 7
+KEY_SHORTHAND = 8
+GETTER_SHORTHAND = 9
+LVALUE_NAME = 10
+LVALUE_NONLOCAL = 11
+LVALUE_ARRAY = 12
+LVALUE_TABLE = 13
+ASSIGNMENT = 14
+NAMED_PARAMETER = 15
+OBJECT_PARAMETER = 16
+ARRAY_PARAMETER = 17
+MEMBER_ACCESS = 18
+METHOD_CALL = 19
+CHAINED_CALL = 20
+CHAIN = 21
+FUNCTION = 22
+CALL = 23
+MODULE = 24
+
+CHAIN_KINDS = ["@", "|>"]
+
+
+class FormatError(ValueError):
+    pass
+
+
+# type -> function of (node, string index) -> (children, then tag and fields)
+Encoder = Callable[[object, Callable[[str], int]], Tuple[list, list]]
+
+
+def _names(tag: int, names: List[str], string: Callable[[str], int]) -> list:
+    return [tag, len(names), *map(string, names)]
+
+
+ENCODERS: Dict[Type, Encoder] = {
+    BlockExpression: lambda n, s: (n.statements, [BLOCK, len(n.statements), int(n.implicit_return)]),
+    ExpressionStatement: lambda n, s: ([n.expression], [EXPRESSION_STATEMENT]),
+    Name: lambda n, s: ([], [NAME, s(n.value)]),
+    IntLiteral: lambda n, s: ([], [INT, s(str(n.value))]),
+    StrLiteral: lambda n, s: ([], [STR, s(n.value)]),
+    ArrayLiteral: lambda n, s: (n.elements, [ARRAY, len(n.elements)]),
+    TableLiteral: lambda n, s: (n.entries, [TABLE, len(n.entries)]),
+    TableEntry.KeyValue: lambda e, s: ([e[1]], [KEY_VALUE, s(e[0])]),
+    TableEntry.KeyShorthand: lambda e, s: ([], [KEY_SHORTHAND, s(e[0])]),
+    TableEntry.GetterShorthand: lambda e, s: ([], [GETTER_SHORTHAND, s(e[0])]),
+    LvalueName: lambda n, s: ([], [LVALUE_NAME, s(n.name)]),
+    LvalueNameNonlocal: lambda n, s: ([], [LVALUE_NONLOCAL, s(n.name)]),
+    LvalueArray: lambda n, s: (n.targets, [LVALUE_ARRAY, len(n.targets)]),
+    LvalueTable: lambda n, s: ([], _names(LVALUE_TABLE, n.names, s)),
+    Assignment: lambda n, s: ([n.target, n.expression], [ASSIGNMENT]),
+    NamedParameter: lambda n, s: ([], [NAMED_PARAMETER, s(n.name)]),
+    ObjectParameter: lambda n, s: ([], _names(OBJECT_PARAMETER, n.names, s)),
+    ArrayParameter: lambda n, s: ([], _names(ARRAY_PARAMETER, n.names, s)),
+    MemberAccess: lambda n, s: ([n.expression], [MEMBER_ACCESS, s(n.member_name)]),
+    MethodCall: lambda n, s: (
+        [n.expression, *n.arguments], [METHOD_CALL, s(n.method_name), len(n.arguments)]
+    ),
+    SingleChainedCall: lambda n, s: (
+        n.arguments,
+        [CHAINED_CALL, CHAIN_KINDS.index(n.kind), s(n.method_name), len(n.arguments)],
+    ),
+    ChainedMethodCall: lambda n, s: ([n.subject, *n.calls], [CHAIN, len(n.calls)]),
+    FunctionDefinition: lambda n, s: ([*n.parameters, n.body], [FUNCTION, len(n.parameters)]),
+    FunctionCall: lambda n, s: ([n.function, *n.arguments], [CALL, len(n.arguments)]),
+    ModuleReference: lambda n, s: ([], [MODULE, s(n.path)]),
+}
+
+
+def dumps(root: AstElement) -> bytes:
+    words = array("I")
+    strings: Dict[str, int] = {}
+
+    def string(value: str) -> int:
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    # nodes still to visit, and the fields of nodes whose children come first
+    stack: list = [root]
+    while stack:
+        item = stack.pop()
+        if type(item) is list:
+            words.extend(item)
+            continue
+        try:
+            encoder = ENCODERS[type(item)]
+        except KeyError:
+            raise FormatError(f"can't serialize {type(item).__name__}") from None
+        (children, fields) = encoder(item, string)
+        stack.append(fields)
+        stack.extend(reversed(children))
+
+    lengths = array("I", map(len, strings))
+    if not words or max(words) <= 0xFFFF:
+        words = array("H", words)
+    if sys.byteorder == "big":
+        words.byteswap()
+        lengths.byteswap()
+    return b"".join([
+        _HEADER.pack(MAGIC, FORMAT_VERSION, words.itemsize, len(strings), len(words)),
+        lengths.tobytes(),
+        words.tobytes(),
+        "".join(strings).encode("utf-8", "surrogatepass"),
+    ])
+
+
+def _pop(stack: list, count: int) -> list:
+    start = len(stack) - count
+    items = stack[start:]
+    del stack[start:]
+    return items
+
+
+def loads(data: bytes) -> AstElement:
+    """Raises `FormatError` if `data` wasn't written by this version of `dumps`."""
+    if len(data) < _HEADER.size:
+        raise FormatError("truncated header")
+    (magic, version, word_size, string_count, word_count) = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise FormatError("not a serialized zuv tree")
+    if version != FORMAT_VERSION:
+        raise FormatError(f"format version {version}, expected {FORMAT_VERSION}")
+    if word_size not in (2, 4):
+        raise FormatError(f"bad word size {word_size}")
+
+    offset = _HEADER.size
+    lengths = array("I")
+    words = array("H" if word_size == 2 else "I")
+    try:
+        lengths.frombytes(data[offset:offset + 4 * string_count])
+        offset += 4 * string_count
+        words.frombytes(data[offset:offset + word_size * word_count])
+        offset += word_size * word_count
+        text = data[offset:].decode("utf-8", "surrogatepass")
+    except (ValueError, UnicodeDecodeError) as e:
+        raise FormatError(f"corrupt data: {e}") from None
+    if len(lengths) != string_count or len(words) != word_count:
+        raise FormatError("truncated data")
+    if sys.byteorder == "big":
+        lengths.byteswap()
+        words.byteswap()
+
+    strings = []
+    position = 0
+    for length in lengths:
+        strings.append(sys.intern(text[position:position + length]))
+        position += length
+    if position != len(text):
+        raise FormatError("string table doesn't match its lengths")
+
+    # The tree has no cycles, so there's nothing for the collector to find:
+    # left on, it would walk the growing tree again and again.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _build(words, strings)
+    except (IndexError, ValueError) as e:
+        raise FormatError(f"corrupt data: {e}") from None
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _build(words: array, strings: List[str]) -> AstElement:
+    stack: list = []
+    push = stack.append
+    pop = stack.pop
+    # the keys are strings from the table, so the entries' checks can't fail
+    new_tuple = tuple.__new__
+    (KeyValue, KeyShorthand, GetterShorthand) = (
+        TableEntry.KeyValue, TableEntry.KeyShorthand, TableEntry.GetterShorthand
+    )
+    i = 0
+    end = len(words)
+    # roughly in order of how common each kind is
+    while i < end:
+        tag = words[i]
+        if tag == NAME:
+            push(Name(strings[words[i + 1]]))
+            i += 2
+        elif tag == INT:
+            push(IntLiteral(int(strings[words[i + 1]])))
+            i += 2
+        elif tag == STR:
+            push(StrLiteral(strings[words[i + 1]]))
+            i += 2
+        elif tag == METHOD_CALL:
+            arguments = _pop(stack, words[i + 2])
+            push(MethodCall(pop(), strings[words[i + 1]], arguments))
+            i += 3
+        elif tag == CALL:
+            arguments = _pop(stack, words[i + 1])
+            push(FunctionCall(pop(), arguments))
+            i += 2
+        elif tag == LVALUE_NAME:
+            push(LvalueName(strings[words[i + 1]]))
+            i += 2
+        elif tag == ASSIGNMENT:
+            expression = pop()
+            push(Assignment(pop(), expression))
+            i += 1
+        elif tag == MEMBER_ACCESS:
+            push(MemberAccess(pop(), strings[words[i + 1]]))
+            i += 2
+        elif tag == KEY_VALUE:
+            push(new_tuple(KeyValue, (strings[words[i + 1]], pop())))
+            i += 2
+        elif tag == KEY_SHORTHAND:
+            push(new_tuple(KeyShorthand, (strings[words[i + 1]],)))
+            i += 2
+        elif tag == GETTER_SHORTHAND:
+            push(new_tuple(GetterShorthand, (strings[words[i + 1]],)))
+            i += 2
+        elif tag == TABLE:
+            push(TableLiteral(_pop(stack, words[i + 1])))
+            i += 2
+        elif tag == ARRAY:
+            push(ArrayLiteral(_pop(stack, words[i + 1])))
+            i += 2
+        elif tag == NAMED_PARAMETER:
+            push(NamedParameter(strings[words[i + 1]]))
+            i += 2
+        elif tag == BLOCK:
+            push(BlockExpression(_pop(stack, words[i + 1]), bool(words[i + 2])))
+            i += 3
+        elif tag == FUNCTION:
+            body = pop()
+            push(FunctionDefinition(_pop(stack, words[i + 1]), body))
+            i += 2
+        elif tag == CHAINED_CALL:
+            push(SingleChainedCall(
+                CHAIN_KINDS[words[i + 1]], strings[words[i + 2]], _pop(stack, words[i + 3])
+            ))
+            i += 4
+        elif tag == CHAIN:
+            calls = _pop(stack, words[i + 1])
+            push(ChainedMethodCall(pop(), calls))
+            i += 2
+        elif tag == EXPRESSION_STATEMENT:
+            push(ExpressionStatement(pop()))
+            i += 1
+        elif tag == LVALUE_NONLOCAL:
+            push(LvalueNameNonlocal(strings[words[i + 1]]))
+            i += 2
+        elif tag == LVALUE_ARRAY:
+            push(LvalueArray(_pop(stack, words[i + 1])))
+            i += 2
+        elif tag in (LVALUE_TABLE, OBJECT_PARAMETER, ARRAY_PARAMETER):
+            count = words[i + 1]
+            names = [strings[index] for index in words[i + 2:i + 2 + count]]
+            if tag == LVALUE_TABLE:
+                push(LvalueTable(names))
+            elif tag == OBJECT_PARAMETER:
+                push(ObjectParameter(names))
+            else:
+                push(ArrayParameter(names))
+            i += 2 + count
+        elif tag == MODULE:
+            push(ModuleReference(strings[words[i + 1]]))
+            i += 2
+        else:
+            raise FormatError(f"unknown tag {tag}")
+    if len(stack) != 1 or not isinstance(stack[0], AstElement):
+        raise FormatError(f"{len(stack)} nodes left at the end")
+    return stack[0]
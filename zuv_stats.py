@@ -0,0 +1,294 @@
+"""
+Compiler statistics and profiling:
+
+    python main.py --stats stats.json program       # "-" writes to stderr
+    python main.py --profile compile.pstats program
+
+Both work through `main.CompileHooks`, which the compiler calls around each
+phase and each top-level statement. `Statistics` records each phase's wall
+time, the memory blocks it left allocated and the garbage collections it
+set off, then node counts by class, the deepest nesting, the slowest
+top-level statements and the largest functions in the output. `Profiler`
+runs cProfile during the phases only. Without hooks, the compiler pays for
+a few `is None` checks and nothing else.
+
+    statistics = Statistics()
+    ast = compiler.run_phase(statistics, "parse", compiler.parse, source)
+    compiler.write_program(ast, sink, flags, statistics)
+    json.dump(statistics.report(), file)
+"""
+
+import cProfile
+import gc
+import json
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import main as compiler
+import zuv_format
+from main import CompileHooks
+from zuv_ast import (
+    Assignment,
+    AstElement,
+    FunctionDefinition,
+    JsOptions,
+    LvalueName,
+    LvalueNameNonlocal,
+    MethodCall,
+    SingleChainedCall,
+    Statement,
+    TableEntry,
+    TableLiteral,
+)
+
+# how many statements and functions the report lists
+TOP = 10
+
+
+def _collections() -> int:
+    return sum(generation["collections"] for generation in gc.get_stats())
+
+
+class Statistics(CompileHooks):
+    def __init__(self):
+        self.phases: List[dict] = []
+        self.nodes: Counter = Counter()
+        self.max_depth = 0
+        self.max_function_depth = 0
+        self.statements: List[Tuple[float, int, Statement]] = []
+        # id() of each function in the emitted tree -> its label and JS size
+        self.function_labels: Labels = {}
+        self.function_sizes: Dict[int, int] = {}
+        self._emitted: Optional[AstElement] = None
+        self._options: Optional[JsOptions] = None
+        self._phase_start: Tuple[float, int, int] = (0.0, 0, 0)
+        self._statement_start = 0.0
+
+    def before_phase(self, phase: str) -> None:
+        self._phase_start = (time.perf_counter(), sys.getallocatedblocks(), _collections())
+
+    def after_phase(self, phase: str, ast: Optional[AstElement]) -> None:
+        (start, blocks, collections) = self._phase_start
+        self.phases.append({
+            "phase": phase,
+            "seconds": time.perf_counter() - start,
+            "allocated_blocks": sys.getallocatedblocks() - blocks,
+            "gc_collections": _collections() - collections,
+        })
+        if phase == "parse" and ast is not None:
+            self._count(ast)
+        elif phase == "resolve" and ast is not None:
+            # the tree that is emitted ("types" only annotates it)
+            self._emitted = ast
+            self.function_labels = function_labels(ast)
+        elif phase == "emit" and self._emitted is not None and self._options is not None:
+            self.function_sizes = function_sizes(self._emitted, self._options)
+
+    def before_statement(self, index: int, statement: Statement) -> None:
+        self._statement_start = time.perf_counter()
+
+    def after_statement(self, index: int, statement: Statement) -> None:
+        self.statements.append((time.perf_counter() - self._statement_start, index, statement))
+
+    def js_options(self, options: JsOptions) -> None:
+        self._options = options
+
+    def _count(self, root: AstElement) -> None:
+        stack = [(root, 1, 0)]
+        while stack:
+            (node, depth, functions) = stack.pop()
+            self.nodes[type(node).__name__] += 1
+            if isinstance(node, FunctionDefinition):
+                functions += 1
+            elif isinstance(node, TableLiteral):
+                self.nodes.update(entry._constructor_name for entry in node.entries)
+            self.max_depth = max(self.max_depth, depth)
+            self.max_function_depth = max(self.max_function_depth, functions)
+            stack.extend((child, depth + 1, functions) for child in node.children())
+
+    def report(self) -> dict:
+        slowest = sorted(self.statements, key=lambda item: item[0], reverse=True)[:TOP]
+        largest = sorted(self.function_sizes.items(), key=lambda item: item[1], reverse=True)[:TOP]
+        return {
+            "phases": self.phases,
+            "total_seconds": sum(phase["seconds"] for phase in self.phases),
+            "nodes": {
+                "total": sum(n for (name, n) in self.nodes.items() if not name.startswith("TableEntry.")),
+                "by_class": dict(self.nodes.most_common()),
+            },
+            "max_depth": self.max_depth,
+            "max_function_depth": self.max_function_depth,
+            "top_level_statements": len(self.statements),
+            "slowest_statements": [
+                {"index": index, "seconds": seconds, "statement": describe(statement)}
+                for (seconds, index, statement) in slowest
+            ],
+            "largest_functions": [
+                {"name": function_name(self.function_labels, key), "js_chars": size}
+                for (key, size) in largest
+            ],
+        }
+
+
+# id() of a function -> id() of the function it is in (or None), and its label
+Labels = Dict[int, Tuple[Optional[int], str]]
+
+
+def function_labels(root: AstElement) -> Labels:
+    """
+    Label each function with what it's assigned to, the table key or the
+    method it's passed to, or else "fn".
+    """
+    labels: Labels = {}
+    stack: List[Tuple[AstElement, Optional[int], Optional[str]]] = [(root, None, None)]
+    while stack:
+        (node, outer, label) = stack.pop()
+        if isinstance(node, FunctionDefinition):
+            labels[id(node)] = (outer, label or "fn")
+            outer = id(node)
+        if isinstance(node, Assignment) and isinstance(node.target, (LvalueName, LvalueNameNonlocal)):
+            stack.append((node.expression, outer, node.target.name))
+        elif isinstance(node, TableLiteral):
+            stack.extend(
+                (entry[1], outer, entry[0])
+                for entry in node.entries if isinstance(entry, TableEntry.KeyValue)
+            )
+        elif isinstance(node, (MethodCall, SingleChainedCall)):
+            stack.extend((child, outer, node.method_name) for child in node.children())
+        else:
+            stack.extend((child, outer, None) for child in node.children())
+    return labels
+
+
+def function_name(labels: Labels, key: int, levels: int = 6) -> str:
+    """The labels of a function and the ones around it, like `Store.findById.else`."""
+    parts: List[str] = []
+    current: Optional[int] = key
+    while current is not None and current in labels:
+        if len(parts) == levels:
+            parts.append("...")
+            break
+        (current, label) = labels[current]
+        parts.append(label)
+    return ".".join(reversed(parts)) or "fn"
+
+
+def function_sizes(root: AstElement, options: JsOptions) -> Dict[int, int]:
+    """id() of each function -> the length of its JS, before minifying."""
+    sizes: Dict[int, int] = {}
+    # [node, what its _js_iter has left to yield, the length of its JS so far]
+    stack: list = [[root, root._js_iter(options), 0]]
+    while stack:
+        top = stack[-1]
+        for piece in top[1]:
+            if type(piece) is str:
+                top[2] += len(piece)
+            elif isinstance(piece, AstElement):
+                stack.append([piece, piece._js_iter(options), 0])
+                break
+        else:
+            stack.pop()
+            if isinstance(top[0], FunctionDefinition):
+                sizes[id(top[0])] = top[2]
+            if stack:
+                stack[-1][2] += top[2]
+    return sizes
+
+
+def describe(statement: AstElement, width: int = 60) -> str:
+    # (the first line is the same without indentation, which could be huge)
+    first_line = zuv_format.format_ast(statement, indent_width=0).split("\n", 1)[0]
+    return first_line if len(first_line) <= width else first_line[:width - 3] + "..."
+
+
+class Profiler(CompileHooks):
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def before_phase(self, phase: str) -> None:
+        self.profile.enable()
+
+    def after_phase(self, phase: str, ast: Optional[AstElement]) -> None:
+        self.profile.disable()
+
+    def save(self, path: str) -> None:
+        """Write the stats in the format of `pstats` and snakeviz."""
+        self.profile.dump_stats(path)
+
+
+class HookList(CompileHooks):
+    """Calls each of `hooks` in order (and in reverse order after a step)."""
+
+    def __init__(self, hooks: List[CompileHooks]):
+        self.hooks = hooks
+
+    def before_phase(self, phase: str) -> None:
+        for hook in self.hooks:
+            hook.before_phase(phase)
+
+    def after_phase(self, phase: str, ast: Optional[AstElement]) -> None:
+        for hook in reversed(self.hooks):
+            hook.after_phase(phase, ast)
+
+    def before_statement(self, index: int, statement: Statement) -> None:
+        for hook in self.hooks:
+            hook.before_statement(index, statement)
+
+    def after_statement(self, index: int, statement: Statement) -> None:
+        for hook in reversed(self.hooks):
+            hook.after_statement(index, statement)
+
+    def js_options(self, options: JsOptions) -> None:
+        for hook in self.hooks:
+            hook.js_options(options)
+
+
+class CountingSink:
+    def __init__(self, sink):
+        self.sink = sink
+        self.count = 0
+
+    def write(self, text: str) -> int:
+        self.count += len(text)
+        return self.sink.write(text)
+
+
+def compile_with_report(
+    source: str,
+    sink,
+    flags: compiler.CompileFlags,
+    stats_path: Optional[str] = None,
+    profile_path: Optional[str] = None,
+) -> None:
+    """
+    What `main.py --stats/--profile` does. The source is parsed without the
+    AST cache, and the parser is loaded beforehand, so "parse" is the parse.
+    """
+    if flags.parser == "lark":
+        compiler.get_parser()
+    hooks: List[CompileHooks] = []
+    statistics = profiler = None
+    if stats_path is not None:
+        statistics = Statistics()
+        hooks.append(statistics)
+    if profile_path is not None:
+        profiler = Profiler()
+        hooks.append(profiler)
+    hook = HookList(hooks)
+
+    counter = CountingSink(sink)
+    ast = compiler.run_phase(hook, "parse", compiler.parse, source, flags.parser)
+    compiler.write_program(ast, counter, flags, hook)
+
+    if profiler is not None:
+        profiler.save(profile_path)  # type: ignore
+    if statistics is not None:
+        report = {"source_chars": len(source), "output_chars": counter.count, **statistics.report()}
+        text = json.dumps(report, indent=1) + "\n"
+        if stats_path == "-":
+            sys.stderr.write(text)
+        else:
+            with open(stats_path, "w") as file:  # type: ignore
+                file.write(text)
@@ -0,0 +1,214 @@
+"""
+Type inference for unboxed arithmetic, run after `zuv_scope.resolve`.
+
+Every runtime value is a box: `Integer(n)` makes an object with a closure
+per method, and `n @mod 3` is a method call that boxes its result. `infer`
+marks the operations whose operands are all Integers or Strings with a
+`Typing`, and code generation runs them on the bare bigints and JS strings,
+boxing only the result:
+
+    (eq: (n @mod 3) 0)
+    -> (n?.__T === "Integer" ? (((n.__n % 3n) === 0n) ? True : False)
+                             : (eq)(n.mod(Integer(3)), Integer(0)))
+
+The operations are the Integer methods (`@add`, `@mod`, `@lt`, ...) and the
+runtime functions `eq`, `concat` and `String`. Literals have known types,
+and so do the results of operations and runtime constructors (`Integer`,
+`String`, `repr`, ...). The type of a function's variable comes from what
+is assigned to it and from the operations it is an operand of, which is all
+there is to go by for parameters.
+
+Variable types are guesses: the generated code checks the type of each
+variable it reads unboxed, and runs the boxed operations if one is wrong,
+so errors and results are exactly those of the boxed code.
+
+Unboxed code uses the runtime's globals by name: nothing runs unboxed if
+the program redefines `Integer` or `String`, and nothing that gives a Bool
+if it redefines `True` or `False`.
+"""
+
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from zuv_ast import (
+    BOXES,
+    INTEGER_OPERATORS,
+    Assignment,
+    AstElement,
+    FunctionCall,
+    IntLiteral,
+    LvalueName,
+    LvalueNameNonlocal,
+    MethodCall,
+    Name,
+    StrLiteral,
+    Symbol,
+    Typing,
+    declared_names,
+)
+
+# the globals from `lib.js` that unboxed code relies on
+UNBOXED_GLOBALS = frozenset({"Integer", "String", "eq", "concat", "True", "False"})
+
+# what the runtime functions return
+RESULT_TYPES = {
+    "Integer": "Integer",
+    "String": "String",
+    "repr": "String",
+    "concat": "String",
+    "eq": "Bool",
+}
+
+_COMPARISONS = frozenset({"gt", "lt", "eq", "ge", "le"})
+
+# `Integer(...)` of a literal outside this range is an inexact JS number
+_MAX_SAFE_INTEGER = 2**53 - 1
+
+# rounds of guessing variable types from each other
+_ROUNDS = 4
+
+Operation = Union[MethodCall, FunctionCall]
+Variable = Tuple[str, int]
+
+
+class TypeInference:
+    def __init__(self, shadowed: Set[str]):
+        self.shadowed = shadowed
+        self.root: Optional[AstElement] = None
+        self.variables: Dict[Variable, str] = {}
+        self.types: Dict[int, str] = {}
+
+    def infer(self, root: AstElement) -> None:
+        self.root = root
+        # operands come before their operations
+        operations: List[Operation] = []
+        assignments: List[Tuple[Variable, AstElement]] = []
+        # types that the uses of variables ask for, which don't change
+        uses: Dict[Variable, Set[str]] = {}
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, (MethodCall, FunctionCall)):
+                node.typing = None
+                operations.append(node)
+                if self._integer_method(node):
+                    for operand in [node.expression, *node.arguments]:  # type: ignore
+                        variable = self._variable(operand.symbol) if isinstance(operand, Name) else None
+                        if variable is not None:
+                            uses.setdefault(variable, set()).add("Integer")
+            elif isinstance(node, Assignment) and isinstance(node.target, (LvalueName, LvalueNameNonlocal)):
+                variable = self._variable(node.target.symbol)
+                if variable is not None:
+                    assignments.append((variable, node.expression))
+            stack.extend(node.children())
+        operations.reverse()
+
+        if self.shadowed & {"Integer", "String"}:
+            # the boxes wouldn't be the runtime's
+            return
+        for _ in range(_ROUNDS):
+            self.types = {}
+            for operation in operations:
+                result = self._result_type(operation)
+                if result is not None:
+                    self.types[id(operation)] = result
+            guessed = {variable: set(types) for (variable, types) in uses.items()}
+            for (variable, value) in assignments:
+                value_type = self._type(value)
+                if value_type is not None:
+                    guessed.setdefault(variable, set()).add(value_type)
+            variables = {variable: types.pop() for (variable, types) in guessed.items() if len(types) == 1}
+            if variables == self.variables:
+                break
+            self.variables = variables
+
+        for operation in operations:
+            operation.typing = self._typing(operation)
+
+    def _variable(self, symbol: Optional[Symbol]) -> Optional[Variable]:
+        # Top-level variables are left alone: the statements that assign
+        # them may be compiled separately (see `zuv_parallel`).
+        if symbol is None or symbol.block is None or symbol.block is self.root:
+            return None
+        return (symbol.name, id(symbol.block))
+
+    def _global(self, node: AstElement) -> Optional[str]:
+        if isinstance(node, Name) and node.symbol is not None and node.symbol.kind == "global":
+            if node.value not in self.shadowed:
+                return node.value
+        return None
+
+    def _integer_method(self, node: Operation) -> bool:
+        return isinstance(node, MethodCall) and node.method_name in INTEGER_OPERATORS and len(node.arguments) == 1
+
+    def _type(self, node: AstElement) -> Optional[str]:
+        if isinstance(node, IntLiteral):
+            return "Integer"
+        elif isinstance(node, StrLiteral):
+            return "String"
+        elif isinstance(node, Name):
+            variable = self._variable(node.symbol)
+            return self.variables.get(variable) if variable is not None else None
+        return self.types.get(id(node))
+
+    def _result_type(self, node: Operation) -> Optional[str]:
+        if isinstance(node, MethodCall):
+            if self._integer_method(node) and self._type(node.expression) == "Integer":
+                return "Bool" if node.method_name in _COMPARISONS else "Integer"
+            return None
+        function = self._global(node.function)
+        return RESULT_TYPES.get(function) if function is not None else None
+
+    def _unboxed_type(self, node: AstElement) -> Optional[str]:
+        """The type of an operand that can be read unboxed."""
+        if isinstance(node, IntLiteral):
+            return "Integer" if abs(node.value) <= _MAX_SAFE_INTEGER else None
+        elif isinstance(node, StrLiteral):
+            return "String"
+        elif isinstance(node, Name):
+            return self._type(node)
+        elif isinstance(node, (MethodCall, FunctionCall)) and node.typing is not None:
+            result = node.typing[0]
+            return result if result != "Bool" else None
+        return None
+
+    def _typing(self, node: Operation) -> Optional[Typing]:
+        typing = self._operation_typing(node)
+        if typing is not None and self.shadowed.intersection(BOXES[typing[0]]):
+            # the result would be boxed with the program's own `True` or `False`
+            return None
+        return typing
+
+    def _operation_typing(self, node: Operation) -> Optional[Typing]:
+        if isinstance(node, MethodCall):
+            if not self._integer_method(node):
+                return None
+            [argument] = node.arguments
+            operands = (self._unboxed_type(node.expression), self._unboxed_type(argument))
+            if operands != ("Integer", "Integer"):
+                return None
+            if node.method_name == "mod" and not isinstance(argument, (IntLiteral, Name)):
+                # the sign of the divisor is needed twice
+                return None
+            return ("Bool" if node.method_name in _COMPARISONS else "Integer", operands)
+
+        function = self._global(node.function)
+        types = tuple(self._unboxed_type(argument) for argument in node.arguments)
+        if None in types:
+            return None
+        if function == "eq" and len(types) == 2 and types[0] == types[1]:
+            return ("Bool", types)  # type: ignore
+        elif function == "concat" or (function == "String" and len(types) == 1):
+            return ("String", types)  # type: ignore
+        return None
+
+
+def infer(root: AstElement, shadowed: Optional[Set[str]] = None) -> AstElement:
+    """
+    Mark the operations in `root` that can run unboxed. `shadowed` are the
+    runtime globals that the program redefines; by default they are looked
+    up in `root`.
+    """
+    if shadowed is None:
+        shadowed = declared_names(root) & UNBOXED_GLOBALS
+    TypeInference(shadowed).infer(root)
+    return root
@@ -0,0 +1,134 @@
+"""
+Watch mode: `python main.py watch [options] PATH...`
+
+Keeps the compiler warm in one process and polls the sources (by mtime and
+size). Only the files that changed are recompiled, incrementally when
+possible, and every output is replaced atomically, so a page that loads it
+never sees half-written JS.
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import main as compiler
+from zuv_batch import collect_sources, output_path_for, write_atomically
+from zuv_incremental import IncrementalCompilation
+
+
+def _edit_between(old: str, new: str) -> Tuple[int, int, str]:
+    """The smallest single edit turning `old` into `new`, as a byte range."""
+    limit = min(len(old), len(new))
+    prefix = 0
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    start = len(old[:prefix].encode())
+    end = len(old[:len(old) - suffix].encode())
+    return (start, end, new[prefix:len(new) - suffix])
+
+
+class WatchedFile:
+    def __init__(self, path: str, output: str, flags: compiler.CompileFlags):
+        self.path = path
+        self.output = output
+        self.flags = flags
+        self.stamp: Optional[Tuple[float, int]] = None
+        self.compilation: Optional[IncrementalCompilation] = None
+
+    def _current_stamp(self) -> Optional[Tuple[float, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime, stat.st_size)
+
+    def changed(self) -> bool:
+        return self._current_stamp() != self.stamp
+
+    def rebuild(self) -> None:
+        self.stamp = self._current_stamp()
+        with open(self.path, "r") as file:
+            source = file.read()
+        if self.flags.hoist_literals:
+            # the constant pool depends on the whole file
+            write_atomically(self.output, compiler.compile_source(source, self.flags) + "\n")
+            return
+        if self.compilation is None:
+            self.compilation = IncrementalCompilation(source, self.flags)
+        elif source != self.compilation.source:
+            try:
+                self.compilation.edit(*_edit_between(self.compilation.source, source))
+            except Exception:
+                # start from a clean slate next time
+                self.compilation = None
+                raise
+        write_atomically(self.output, self.compilation.to_js() + "\n")
+
+
+class Watcher:
+    def __init__(
+        self,
+        paths: Iterable[str],
+        out_dir: Optional[str] = None,
+        flags: compiler.CompileFlags = compiler.CompileFlags(),
+    ):
+        self.paths = list(paths)
+        self.out_dir = out_dir
+        self.flags = flags
+        self.files: Dict[str, WatchedFile] = {}
+
+    def _discover(self) -> None:
+        # directories are rescanned so that new files get picked up
+        for (path, root) in collect_sources(self.paths):
+            if path not in self.files:
+                output = output_path_for(path, self.out_dir, root)
+                self.files[path] = WatchedFile(path, output, self.flags)
+
+    def poll(self) -> List[Tuple[str, float, Optional[str]]]:
+        """Rebuild what changed, returning (path, seconds, error) for each file."""
+        self._discover()
+        results = []
+        for watched in list(self.files.values()):
+            if not os.path.exists(watched.path):
+                del self.files[watched.path]
+                continue
+            if not watched.changed():
+                continue
+            start = time.perf_counter()
+            error = None
+            try:
+                watched.rebuild()
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            results.append((watched.path, time.perf_counter() - start, error))
+        return results
+
+
+def main(argv: List[str]) -> int:
+    argparser = argparse.ArgumentParser(
+        prog="main.py watch",
+        description="Recompile zuv files whenever they change.",
+    )
+    argparser.add_argument("paths", nargs="+", help="files or directories with .zuv files")
+    argparser.add_argument("-o", "--out-dir", help="where to put the .js files (default: next to the sources)")
+    argparser.add_argument("-i", "--interval", type=float, default=0.2, help="seconds between polls")
+    compiler.add_flag_arguments(argparser)
+    args = argparser.parse_args(argv)
+
+    watcher = Watcher(args.paths, args.out_dir, compiler.flags_from_args(args))
+    print(f"watching {', '.join(args.paths)}", file=sys.stderr)
+    try:
+        while True:
+            for (path, seconds, error) in watcher.poll():
+                if error is None:
+                    print(f"rebuilt {path} in {seconds * 1000:.2f} ms", file=sys.stderr)
+                else:
+                    print(f"error {path}: {error}", file=sys.stderr)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        return 0